@@ -0,0 +1,283 @@
+import os
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .database import SessionLocal, ChunkRecord, ChunkSource, ChunkBand
+from . import dedupe
+
+logger = logging.getLogger(__name__)
+
+# New chunks are registered (claimed) when a batch is planned, before they are
+# embedded, so concurrent batches containing the same chunk treat it as a
+# duplicate. A claim that never got a source (its process died mid-batch) is
+# given up after this long.
+CLAIM_TIMEOUT_SECONDS = int(os.getenv("CHUNK_CLAIM_TIMEOUT_SECONDS", "3600"))
+
+
+class PlannedChunk(NamedTuple):
+    index: int  # Position in the incoming batch
+    chunk_id: str
+    text_hash: str
+    signature: List[int]
+    band_keys: List[str]
+
+
+class ChunkPlan(NamedTuple):
+    new: List[PlannedChunk]
+    # chunk_id of an already registered (or earlier in-batch) chunk -> batch positions it absorbed
+    duplicates: Dict[str, List[int]]
+    near_duplicates: int
+
+
+def chunk_id_for(property: Optional[str], text_hash: str) -> str:
+    """Chunks are deduplicated per property so property filters keep working."""
+    return hashlib.sha256(f"{property or ''}|{text_hash}".encode("utf-8")).hexdigest()
+
+
+def _insert(db):
+    """The dialect's INSERT, which supports ON CONFLICT DO NOTHING."""
+    return (postgresql if db.get_bind().dialect.name == "postgresql" else sqlite).insert
+
+
+def plan_chunks(texts: List[str], property: Optional[str]) -> ChunkPlan:
+    """
+    Splits a batch of chunks into ones that need embedding and ones that are
+    exact or near duplicates of chunks already registered for the property
+    (or of earlier chunks in the same batch). The new chunks are claimed in
+    the registry (see claim_chunks); if the batch then fails, release_chunks
+    must be called with them.
+    """
+    hashes = [dedupe.text_hash(text) for text in texts]
+    ids = [chunk_id_for(property, h) for h in hashes]
+    namespace = property or ""
+
+    db = SessionLocal()
+    try:
+        _expire_claims(db, set(ids))
+        existing = {row.id for row in db.query(ChunkRecord.id).filter(ChunkRecord.id.in_(set(ids))).all()}
+
+        duplicates: Dict[str, List[int]] = {}
+        candidates = []
+        batch_ids = set()
+        for i, chunk_id in enumerate(ids):
+            if chunk_id in existing or chunk_id in batch_ids:
+                duplicates.setdefault(chunk_id, []).append(i)
+                continue
+            batch_ids.add(chunk_id)
+            signature = dedupe.minhash_signature(texts[i])
+            # Chunks whose numbers differ never share a band, so they are never near duplicates
+            band_namespace = f"{namespace}:{dedupe.number_fingerprint(texts[i])}"
+            candidates.append(PlannedChunk(i, chunk_id, hashes[i], signature, dedupe.lsh_band_keys(signature, band_namespace)))
+
+        # Look up registered chunks sharing any LSH band with the candidates
+        all_keys = {key for c in candidates for key in c.band_keys}
+        band_matches: Dict[str, set] = {}
+        if all_keys:
+            for band_key, chunk_id in db.query(ChunkBand.band_key, ChunkBand.chunk_id).filter(ChunkBand.band_key.in_(all_keys)).all():
+                band_matches.setdefault(band_key, set()).add(chunk_id)
+        matched_ids = set().union(*band_matches.values()) if band_matches else set()
+        signatures = {}
+        if matched_ids:
+            signatures = {row.id: row.minhash for row in db.query(ChunkRecord.id, ChunkRecord.minhash).filter(ChunkRecord.id.in_(matched_ids)).all()}
+    finally:
+        db.close()
+
+    new: List[PlannedChunk] = []
+    near_duplicates = 0
+    batch_bands: Dict[str, List[PlannedChunk]] = {}
+    for candidate in candidates:
+        match = _find_near_duplicate(candidate, band_matches, signatures, batch_bands)
+        if match:
+            duplicates.setdefault(match, []).append(candidate.index)
+            near_duplicates += 1
+            continue
+        new.append(candidate)
+        for key in candidate.band_keys:
+            batch_bands.setdefault(key, []).append(candidate)
+
+    # Chunks another batch claimed since the lookup above are duplicates too
+    claimed = claim_chunks(new, property)
+    for candidate in new:
+        if candidate.chunk_id not in claimed:
+            duplicates.setdefault(candidate.chunk_id, []).append(candidate.index)
+    new = [candidate for candidate in new if candidate.chunk_id in claimed]
+
+    return ChunkPlan(new=new, duplicates=duplicates, near_duplicates=near_duplicates)
+
+
+def _expire_claims(db, chunk_ids: Set[str]):
+    """Drops claims on these chunks that never got a source within CLAIM_TIMEOUT_SECONDS."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=CLAIM_TIMEOUT_SECONDS)
+    expired = [
+        row.id for row in db.query(ChunkRecord.id).filter(
+            ChunkRecord.id.in_(chunk_ids), ChunkRecord.created_at < cutoff, ~ChunkRecord.sources.any()
+        ).all()
+    ]
+    if expired:
+        logger.warning(f"Dropping {len(expired)} abandoned chunk claims.")
+        _delete_chunks(db, expired)
+        db.commit()
+
+
+def claim_chunks(chunks: List[PlannedChunk], property: Optional[str]) -> Set[str]:
+    """
+    Registers planned chunks, and their LSH bands, in one atomic insert that
+    skips ids already present. Returns the ids this call claimed; the others
+    were claimed by a concurrent batch first.
+    """
+    if not chunks:
+        return set()
+    db = SessionLocal()
+    try:
+        insert = _insert(db)
+        rows = [
+            {"id": c.chunk_id, "text_hash": c.text_hash, "property": property, "minhash": c.signature}
+            for c in chunks
+        ]
+        result = db.execute(insert(ChunkRecord).values(rows).on_conflict_do_nothing(index_elements=["id"]).returning(ChunkRecord.id))
+        claimed = {row[0] for row in result}
+        bands = [{"band_key": key, "chunk_id": c.chunk_id} for c in chunks if c.chunk_id in claimed for key in c.band_keys]
+        if bands:
+            db.execute(insert(ChunkBand).values(bands).on_conflict_do_nothing())
+        db.commit()
+        return claimed
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def release_chunks(chunk_ids: List[str]):
+    """
+    Gives up the claims of a batch that failed before it was registered, so
+    the chunks are indexed again the next time they are seen. Duplicates other
+    documents attached to them meanwhile are detached too, since no vector was
+    written for them.
+    """
+    if not chunk_ids:
+        return
+    db = SessionLocal()
+    try:
+        _delete_chunks(db, chunk_ids)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _delete_chunks(db, chunk_ids: List[str]):
+    db.query(ChunkSource).filter(ChunkSource.chunk_id.in_(chunk_ids)).delete(synchronize_session=False)
+    db.query(ChunkBand).filter(ChunkBand.chunk_id.in_(chunk_ids)).delete(synchronize_session=False)
+    db.query(ChunkRecord).filter(ChunkRecord.id.in_(chunk_ids)).delete(synchronize_session=False)
+
+
+def plan_chunks_locally(texts: List[str], property: Optional[str]) -> ChunkPlan:
+    """
+    Registry-free planning: assigns content-addressed ids and drops exact
+    duplicates within the batch only. Used when no database is available
+    (e.g. benchmarks with a stub vector store).
+    """
+    new: List[PlannedChunk] = []
+    duplicates: Dict[str, List[int]] = {}
+    seen = set()
+    for i, text in enumerate(texts):
+        h = dedupe.text_hash(text)
+        chunk_id = chunk_id_for(property, h)
+        if chunk_id in seen:
+            duplicates.setdefault(chunk_id, []).append(i)
+            continue
+        seen.add(chunk_id)
+        new.append(PlannedChunk(i, chunk_id, h, [], []))
+    return ChunkPlan(new=new, duplicates=duplicates, near_duplicates=0)
+
+
+def _find_near_duplicate(candidate: PlannedChunk, band_matches: Dict[str, set], signatures: Dict[str, list], batch_bands: Dict[str, List[PlannedChunk]]) -> Optional[str]:
+    for key in candidate.band_keys:
+        for chunk_id in band_matches.get(key, ()):
+            if dedupe.estimated_similarity(candidate.signature, signatures.get(chunk_id, [])) >= dedupe.NEAR_DUPLICATE_THRESHOLD:
+                return chunk_id
+        for other in batch_bands.get(key, ()):
+            if dedupe.estimated_similarity(candidate.signature, other.signature) >= dedupe.NEAR_DUPLICATE_THRESHOLD:
+                return other.chunk_id
+    return None
+
+
+def find_embedded_text(text_hashes: List[str]) -> Dict[str, str]:
+    """Maps each text hash that is already embedded (under any property) to one of its chunk ids."""
+    if not text_hashes:
+        return {}
+    db = SessionLocal()
+    try:
+        rows = db.query(ChunkRecord.text_hash, ChunkRecord.id).filter(ChunkRecord.text_hash.in_(set(text_hashes))).all()
+        return {text_hash: chunk_id for text_hash, chunk_id in rows}
+    finally:
+        db.close()
+
+
+def register_chunks(new: List[PlannedChunk], duplicate_ids: List[str], source: str) -> Dict[str, List[str]]:
+    """
+    Attaches source to the newly indexed chunks (claimed by plan_chunks) and
+    adds it to the duplicates' source lists. Returns the merged source list of
+    every duplicate chunk, for updating vector metadata.
+    """
+    db = SessionLocal()
+    try:
+        # A duplicate's claim may have been released by a failed batch meanwhile
+        live_ids = {row.id for row in db.query(ChunkRecord.id).filter(ChunkRecord.id.in_(duplicate_ids)).all()} if duplicate_ids else set()
+        missing = [chunk_id for chunk_id in duplicate_ids if chunk_id not in live_ids]
+        if missing:
+            logger.warning(f"{len(missing)} chunks of {source} duplicated chunks whose indexing failed; they are not indexed.")
+        duplicate_ids = [chunk_id for chunk_id in duplicate_ids if chunk_id in live_ids]
+        rows = [{"chunk_id": chunk_id, "source": source} for chunk_id in [c.chunk_id for c in new] + duplicate_ids]
+        if rows:
+            db.execute(_insert(db)(ChunkSource).values(rows).on_conflict_do_nothing())
+        db.commit()
+
+        merged: Dict[str, List[str]] = {}
+        if duplicate_ids:
+            rows = db.query(ChunkSource.chunk_id, ChunkSource.source).filter(ChunkSource.chunk_id.in_(duplicate_ids)).order_by(ChunkSource.created_at).all()
+            for chunk_id, chunk_source in rows:
+                merged.setdefault(chunk_id, []).append(chunk_source)
+        return merged
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def remove_source(source: str) -> Tuple[List[str], Dict[str, List[str]]]:
+    """
+    Detaches a document from the registry. Returns the chunk ids that no
+    longer have any source (to delete from the index) and the remaining
+    sources of chunks that are still shared with other documents.
+    """
+    db = SessionLocal()
+    try:
+        chunk_ids = [row.chunk_id for row in db.query(ChunkSource.chunk_id).filter(ChunkSource.source == source).all()]
+        if not chunk_ids:
+            return [], {}
+        db.query(ChunkSource).filter(ChunkSource.source == source).delete(synchronize_session=False)
+
+        remaining: Dict[str, List[str]] = {}
+        for chunk_id, chunk_source in db.query(ChunkSource.chunk_id, ChunkSource.source).filter(ChunkSource.chunk_id.in_(chunk_ids)).order_by(ChunkSource.created_at).all():
+            remaining.setdefault(chunk_id, []).append(chunk_source)
+
+        orphaned = [chunk_id for chunk_id in chunk_ids if chunk_id not in remaining]
+        if orphaned:
+            db.query(ChunkBand).filter(ChunkBand.chunk_id.in_(orphaned)).delete(synchronize_session=False)
+            db.query(ChunkRecord).filter(ChunkRecord.id.in_(orphaned)).delete(synchronize_session=False)
+        db.commit()
+        return orphaned, remaining
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
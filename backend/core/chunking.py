@@ -1,13 +1,162 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+"""
+Shared text splitter for every ingestion path (uploads, crawled pages, bulk
+scripts).
 
-def chunk_text(text: str, chunk_size: int = 500, chunk_overlap: int = 50):
+Chunks are sized in tokens rather than characters and are cut on section,
+paragraph and sentence boundaries where possible. The splitter makes a single
+pass over the text, so it runs in linear time even on multi-megabyte inputs,
+and every chunk it returns is an exact slice of the input.
+"""
+import re
+from collections import deque
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+# ~4 characters per token, so these match the old 1000/100 character chunks.
+DEFAULT_CHUNK_TOKENS = 250
+DEFAULT_OVERLAP_TOKENS = 25
+
+# Word pieces are capped at 6 characters to approximate a BPE tokenizer
+# without depending on one.
+_TOKEN_RE = re.compile(r"\w{1,6}|[^\w\s]")
+# Blank lines, single newlines and sentence ends, strongest first.
+_BOUNDARY_RE = re.compile(r"\n[ \t]*\n\s*|\n|(?<=[.!?])[ \t]+")
+_HEADING_RE = re.compile(r"(#{1,6}\s|[A-Z0-9][A-Z0-9 &/:,()\-]{3,}$)")
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+# What chunk sizes are measured with; part of the parse cache key, so chunks
+# sized with the estimate are not reused once tiktoken is installed.
+TOKENIZER = "tiktoken/cl100k_base" if _encoding is not None else "estimate"
+
+
+def count_tokens(text: str) -> int:
+    """Counts tokens with tiktoken when it is installed, otherwise estimates them."""
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(_TOKEN_RE.findall(text))
+
+
+class _Segment(NamedTuple):
+    start: int
+    end: int
+    tokens: int
+    section_start: bool
+
+
+class TextSplitter:
+    """
+    Greedy token-budget splitter. Text is cut into sentence-sized segments,
+    which are packed into chunks of at most chunk_tokens; consecutive chunks
+    share up to overlap_tokens worth of trailing segments, or of the last
+    segment's trailing words when no whole segment fits. A heading starts a
+    new chunk once the current one is at least half full.
+    """
+
+    def __init__(self, chunk_tokens: int = DEFAULT_CHUNK_TOKENS, overlap_tokens: int = DEFAULT_OVERLAP_TOKENS):
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens must be smaller than chunk_tokens.")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def _segments(self, text: str) -> Iterator[_Segment]:
+        position = 0
+        paragraph_break = True
+        for boundary in _BOUNDARY_RE.finditer(text):
+            yield from self._segment(text, position, boundary.end(), paragraph_break)
+            paragraph_break = boundary.group().count("\n") > 1
+            position = boundary.end()
+        yield from self._segment(text, position, len(text), paragraph_break)
+
+    def _segment(self, text: str, start: int, end: int, paragraph_break: bool) -> Iterator[_Segment]:
+        piece = text[start:end]
+        tokens = count_tokens(piece)
+        if tokens == 0:
+            return
+        section_start = paragraph_break and bool(_HEADING_RE.match(piece.strip()))
+        if tokens <= self.chunk_tokens:
+            yield _Segment(start, end, tokens, section_start)
+            return
+        # A single sentence longer than a chunk is cut every chunk_tokens tokens
+        cut = start
+        for i, match in enumerate(_TOKEN_RE.finditer(text, start, end)):
+            if i and i % self.chunk_tokens == 0:
+                yield _Segment(cut, match.start(), self.chunk_tokens, section_start and cut == start)
+                cut = match.start()
+        yield _Segment(cut, end, count_tokens(text[cut:end]), False)
+
+    def iter_spans(self, text: str) -> Iterator[Tuple[int, int]]:
+        """Yields (start, end) offsets of each chunk, with surrounding whitespace trimmed."""
+        window: deque = deque()
+        tokens = 0
+
+        def span() -> Tuple[int, int]:
+            start, end = window[0].start, window[-1].end
+            while start < end and text[start].isspace():
+                start += 1
+            while end > start and text[end - 1].isspace():
+                end -= 1
+            return start, end
+
+        for segment in self._segments(text):
+            if window and segment.section_start and tokens >= self.chunk_tokens // 2:
+                yield span()
+                window.clear()
+                tokens = 0
+            elif window and tokens + segment.tokens > self.chunk_tokens:
+                yield span()
+                # Carry trailing segments forward as overlap
+                kept = 0
+                carry = []
+                for previous in reversed(window):
+                    if kept + previous.tokens > self.overlap_tokens:
+                        break
+                    carry.append(previous)
+                    kept += previous.tokens
+                if not carry and self.overlap_tokens:
+                    tail = self._tail(text, window[-1])
+                    if tail:
+                        carry.append(tail)
+                        kept = tail.tokens
+                window = deque(reversed(carry))
+                tokens = kept
+                # Drop overlap that would push the new segment over budget
+                while window and tokens + segment.tokens > self.chunk_tokens:
+                    tokens -= window.popleft().tokens
+            window.append(segment)
+            tokens += segment.tokens
+
+        if window:
+            start, end = span()
+            if end > start:
+                yield start, end
+
+    def _tail(self, text: str, segment: _Segment) -> Optional[_Segment]:
+        """The longest run of whole trailing words of a segment within overlap_tokens, if any."""
+        word_starts = [
+            match.start() for match in _TOKEN_RE.finditer(text, segment.start, segment.end)
+            if match.start() == segment.start or not text[match.start() - 1].isalnum()
+        ]
+        # Start around overlap_tokens estimated tokens back and move forward until it fits
+        for start in word_starts[max(len(word_starts) - self.overlap_tokens, 1):]:
+            tokens = count_tokens(text[start:segment.end])
+            if tokens <= self.overlap_tokens:
+                return _Segment(start, segment.end, tokens, False) if tokens else None
+        return None
+
+    def iter_chunks(self, text: str) -> Iterator[str]:
+        for start, end in self.iter_spans(text):
+            yield text[start:end]
+
+    def split_text(self, text: str) -> List[str]:
+        return list(self.iter_chunks(text))
+
+
+def chunk_text(text: str, chunk_size: int = DEFAULT_CHUNK_TOKENS, chunk_overlap: int = DEFAULT_OVERLAP_TOKENS) -> List[str]:
     """
-    Splits a long text into smaller chunks.
+    Splits a long text into smaller chunks. Sizes are in tokens.
     """
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        length_function=len,
-    )
-    chunks = text_splitter.split_text(text)
-    return chunks 
\ No newline at end of file
+    return TextSplitter(chunk_size, chunk_overlap).split_text(text)
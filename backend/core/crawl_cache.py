@@ -0,0 +1,92 @@
+import hashlib
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+
+from .database import SessionLocal, CrawlCacheEntry
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(chunks: List[str]) -> str:
+    """Hashes a page's extracted text chunks, so markup-only changes don't count as a change."""
+    hasher = hashlib.sha256()
+    for chunk in chunks:
+        hasher.update(chunk.encode("utf-8"))
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+def get_entries(urls: List[str]) -> Dict[str, dict]:
+    """Loads the cached validators and content hash for each previously crawled URL."""
+    db = SessionLocal()
+    try:
+        rows = db.query(CrawlCacheEntry).filter(CrawlCacheEntry.url.in_(urls)).all()
+        return {
+            row.url: {
+                "etag": row.etag,
+                "last_modified": row.last_modified,
+                "content_hash": row.content_hash,
+            }
+            for row in rows
+        }
+    finally:
+        db.close()
+
+
+def conditional_headers(entry: Optional[dict]) -> dict:
+    """Builds If-None-Match / If-Modified-Since headers from a cache entry."""
+    headers = {}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def record_fetch(url: str, etag: Optional[str], last_modified: Optional[str], new_hash: Optional[str] = None, chunk_count: Optional[int] = None):
+    """
+    Stores the latest validators for a URL. new_hash and chunk_count are only
+    passed when the page content changed and was re-indexed.
+    """
+    db = SessionLocal()
+    try:
+        entry = db.query(CrawlCacheEntry).filter(CrawlCacheEntry.url == url).first()
+        if not entry:
+            entry = CrawlCacheEntry(url=url)
+            db.add(entry)
+        # A 304 may omit validators; keep the ones we already have in that case
+        entry.etag = etag or entry.etag
+        entry.last_modified = last_modified or entry.last_modified
+        entry.last_fetched_at = func.now()
+        if new_hash is not None:
+            entry.content_hash = new_hash
+            entry.chunk_count = chunk_count or 0
+            entry.last_changed_at = func.now()
+        db.commit()
+    except Exception as e:
+        logger.error(f"Failed to update crawl cache for {url}: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def invalidate(url: str):
+    """
+    Forgets a URL's validators and content hash, so its next crawl fetches and
+    re-indexes it. Called before its stale chunks are deleted, so a failed
+    re-index is retried rather than skipped as unchanged.
+    """
+    db = SessionLocal()
+    try:
+        db.query(CrawlCacheEntry).filter(CrawlCacheEntry.url == url).update(
+            {"etag": None, "last_modified": None, "content_hash": None}, synchronize_session=False
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
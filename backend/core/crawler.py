@@ -0,0 +1,170 @@
+import os
+import asyncio
+import random
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# --- Crawl Settings ---
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "16"))
+CRAWL_PER_HOST_CONCURRENCY = int(os.getenv("CRAWL_PER_HOST_CONCURRENCY", "2"))
+CRAWL_TIMEOUT_SECONDS = 10
+CRAWL_MAX_RETRIES = 3
+CRAWL_BACKOFF_SECONDS = 1.0
+CRAWL_USER_AGENT = "AllianceCrawler/1.0 (+https://alliancerei.com)"
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Called with (url, response) for every page that was fetched successfully
+# or came back 304 Not Modified.
+PageHandler = Callable[[str, httpx.Response], Awaitable[None]]
+
+
+class Crawler:
+    """
+    Async crawler with a pooled HTTP client. Limits requests globally and per
+    host, caches robots.txt per host, and retries transient failures with
+    jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = CRAWL_CONCURRENCY,
+        per_host_concurrency: int = CRAWL_PER_HOST_CONCURRENCY,
+        max_retries: int = CRAWL_MAX_RETRIES,
+    ):
+        self.max_retries = max_retries
+        self.per_host_concurrency = per_host_concurrency
+        self._global_limit = asyncio.Semaphore(concurrency)
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self._robots: Dict[str, Optional[RobotFileParser]] = {}
+        self._robots_locks: Dict[str, asyncio.Lock] = {}
+        self._client = httpx.AsyncClient(
+            timeout=CRAWL_TIMEOUT_SECONDS,
+            follow_redirects=True,
+            headers={"User-Agent": CRAWL_USER_AGENT},
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._client.aclose()
+
+    def _host_limit(self, host: str) -> asyncio.Semaphore:
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host_concurrency)
+        return self._host_limits[host]
+
+    async def _robots_for(self, url: str) -> Optional[RobotFileParser]:
+        """
+        Returns the parsed robots.txt for the url's host, fetching it once per
+        host through the same limits and retries as pages. Following the
+        robots.txt convention, a 401 or 403, or a server that stays
+        unreachable, disallows the whole host; any other missing robots.txt
+        allows everything (None).
+        """
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        lock = self._robots_locks.setdefault(origin, asyncio.Lock())
+        async with lock:
+            if origin not in self._robots:
+                parser = None
+                try:
+                    response = await self.fetch(f"{origin}/robots.txt")
+                    if response.status_code == 200:
+                        parser = RobotFileParser()
+                        parser.parse(response.text.splitlines())
+                    elif response.status_code in (401, 403):
+                        parser = RobotFileParser()
+                        parser.disallow_all = True
+                except httpx.HTTPError as e:
+                    logger.info(f"Could not fetch robots.txt for {origin}, skipping the host: {e}")
+                    parser = RobotFileParser()
+                    parser.disallow_all = True
+                self._robots[origin] = parser
+        return self._robots[origin]
+
+    async def allowed(self, url: str) -> bool:
+        robots = await self._robots_for(url)
+        return robots is None or robots.can_fetch(CRAWL_USER_AGENT, url)
+
+    async def _backoff(self, attempt: int, retry_after: Optional[str] = None):
+        delay = CRAWL_BACKOFF_SECONDS * (2 ** attempt)
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        await asyncio.sleep(delay + random.uniform(0, delay))
+
+    async def fetch(self, url: str, headers: Optional[dict] = None) -> httpx.Response:
+        """
+        Fetches a single URL within the global and per-host limits, retrying
+        connection errors and retryable status codes. Raises httpx.HTTPError
+        once retries are exhausted.
+        """
+        host = urlsplit(url).netloc
+        for attempt in range(self.max_retries + 1):
+            async with self._global_limit, self._host_limit(host):
+                try:
+                    response = await self._client.get(url, headers=headers)
+                except httpx.TransportError:
+                    if attempt == self.max_retries:
+                        raise
+                    response = None
+            if response is not None and response.status_code not in RETRYABLE_STATUS_CODES:
+                return response
+            if response is not None and attempt == self.max_retries:
+                response.raise_for_status()
+            logger.info(f"Retrying {url} (attempt {attempt + 2}/{self.max_retries + 1})")
+            await self._backoff(attempt, response.headers.get("Retry-After") if response is not None else None)
+
+    async def crawl(
+        self,
+        urls: List[str],
+        on_page: PageHandler,
+        request_headers: Optional[Callable[[str], dict]] = None,
+    ) -> dict:
+        """
+        Fetches every URL concurrently and hands each successful response to
+        on_page. request_headers may supply per-URL headers such as
+        If-None-Match; 304 responses are passed to on_page as well.
+        Returns counts of fetched, not_modified, skipped (robots.txt) and failed URLs.
+        """
+        summary = {"fetched": 0, "not_modified": 0, "skipped": 0, "failed": 0}
+
+        async def crawl_one(url: str):
+            try:
+                if not await self.allowed(url):
+                    logger.info(f"Skipping {url}: disallowed by robots.txt")
+                    summary["skipped"] += 1
+                    return
+                response = await self.fetch(url, headers=request_headers(url) if request_headers else None)
+                if response.status_code == 304:
+                    await on_page(url, response)
+                    summary["not_modified"] += 1
+                    return
+                response.raise_for_status()
+                await on_page(url, response)
+                summary["fetched"] += 1
+            except Exception as e:
+                logger.error(f"Failed to crawl {url}. Reason: {e}")
+                summary["failed"] += 1
+
+        await asyncio.gather(*(crawl_one(url) for url in dict.fromkeys(urls)))
+        return summary
+
+
+async def crawl_urls(
+    urls: List[str],
+    on_page: PageHandler,
+    request_headers: Optional[Callable[[str], dict]] = None,
+    **settings,
+) -> dict:
+    """Convenience wrapper that runs a single crawl with its own client."""
+    async with Crawler(**settings) as crawler:
+        return await crawler.crawl(urls, on_page, request_headers)
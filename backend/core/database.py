@@ -153,6 +153,133 @@ class Activity(Base):
     user = relationship("User")
 
 
+class CrawlCacheEntry(Base):
+    __tablename__ = 'crawl_cache'
+
+    url = Column(String, primary_key=True)
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)  # Raw Last-Modified header value
+    content_hash = Column(String, nullable=True)  # SHA-256 of the page's extracted text
+    chunk_count = Column(Integer, default=0)
+    last_fetched_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    last_changed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ChunkRecord(Base):
+    """A unique chunk of indexed text. The id doubles as its Pinecone vector id."""
+    __tablename__ = 'chunk_registry'
+
+    id = Column(String, primary_key=True)  # sha256(property + normalised text hash)
+    text_hash = Column(String, index=True, nullable=False)  # sha256 of the normalised text
+    property = Column(String, index=True, nullable=True)
+    minhash = Column(JSON, nullable=False)  # MinHash signature for near-duplicate checks
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    sources = relationship("ChunkSource", back_populates="chunk", cascade="all, delete-orphan")
+
+
+class ChunkSource(Base):
+    """Every document a registered chunk was found in."""
+    __tablename__ = 'chunk_sources'
+
+    chunk_id = Column(String, ForeignKey('chunk_registry.id'), primary_key=True)
+    source = Column(String, primary_key=True, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    chunk = relationship("ChunkRecord", back_populates="sources")
+
+
+class ChunkBand(Base):
+    """LSH band keys of a chunk's MinHash signature, used to find near-duplicate candidates."""
+    __tablename__ = 'chunk_minhash_bands'
+
+    band_key = Column(String, primary_key=True)
+    chunk_id = Column(String, ForeignKey('chunk_registry.id', ondelete="CASCADE"), primary_key=True)
+
+
+
+class PropertyFact(Base):
+    """A key fact about a property (lease expiry, rent, ...) extracted from one of its documents at ingestion."""
+    __tablename__ = 'property_facts'
+
+    id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
+    property = Column(String, index=True, nullable=False)
+    fact_key = Column(String, index=True, nullable=False)  # One of fact_sheet.FACTS
+    value = Column(String, nullable=False)
+    source = Column(String, index=True, nullable=False)
+    page = Column(Integer, nullable=True)
+    quote = Column(String, nullable=True)  # Supporting excerpt from the source
+    document_date = Column(String, nullable=True)  # ISO date the source is dated or effective, if it says
+    extracted_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+
+class DocumentSummary(Base):
+    """
+    A generated summary of one document. A new version is recorded whenever
+    the document is re-ingested with different content.
+    """
+    __tablename__ = 'document_summaries'
+
+    id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
+    source = Column(String, index=True, nullable=False)
+    property = Column(String, index=True, nullable=False)
+    version = Column(Integer, nullable=False)  # Per (property, source)
+    content_hash = Column(String, nullable=False)  # Hash of the document's chunks when summarised
+    summary = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class PropertySummary(Base):
+    """A summary of a property built from the latest summaries of its documents."""
+    __tablename__ = 'property_summaries'
+
+    id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
+    property = Column(String, index=True, nullable=False)
+    version = Column(Integer, nullable=False)
+    document_versions = Column(JSON, nullable=False)  # {source: document summary version} it was built from
+    summary = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class GeneratorJob(Base):
+    """
+    A background content generator run. Its input and output CSV rows are
+    stored as GeneratorJobBlocks; each output block is committed together with
+    completed_rows, so an interrupted job resumes from the next row.
+    """
+    __tablename__ = 'generator_jobs'
+
+    id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
+    status = Column(String, index=True, nullable=False, default="queued")  # queued, running, completed, failed
+    filename = Column(String, nullable=False)
+    key_fields = Column(JSON, nullable=False)
+    core_content = Column(String, nullable=False)
+    tone = Column(String, nullable=False)
+    style = Column(String, nullable=False)
+    total_rows = Column(Integer, nullable=False)
+    completed_rows = Column(Integer, nullable=False, default=0)
+    failed_rows = Column(Integer, nullable=False, default=0)
+    cached_rows = Column(Integer, nullable=False, default=0)  # Rows reused from the output cache or a duplicate row
+    output_bytes = Column(Integer, nullable=False, default=0)  # Size of the stored output rows
+    input_header = Column(String, nullable=True)  # Header line of the input CSV; unset for jobs created before rows were stored
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class GeneratorJobBlock(Base):
+    """A block of consecutive CSV rows (without the header) of a generator job's input or output."""
+    __tablename__ = 'generator_job_blocks'
+
+    job_id = Column(String, ForeignKey('generator_jobs.id'), primary_key=True)
+    kind = Column(String, primary_key=True)  # input, output
+    seq = Column(Integer, primary_key=True)  # Position of the block within the CSV
+    row_count = Column(Integer, nullable=False)
+    data = Column(String, nullable=False)
+
+
 def get_db():
     """Dependency to get a DB session."""
     db = SessionLocal()
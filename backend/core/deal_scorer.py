@@ -1,8 +1,9 @@
 import random
 import json
+import numpy as np
 from jinja2 import Template
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 # --- CONFIGURABLE SCORING RULES ---
 SCORING_RULES = {
@@ -186,6 +187,209 @@ def score_deal_logic(deal_data: dict) -> dict:
     }
 
 
+# --- BATCH SCORING ---
+# Scores many deals at once: each metric becomes a NumPy column, SCORING_RULES
+# thresholds are applied as array comparisons, and property type rules as
+# masks. Given the same metrics it classifies deals exactly like
+# score_deal_logic, but it only scores the metrics a deal supplies (no
+# placeholder values are filled in) and only the metrics SCORING_RULES has a
+# rule for. A deal with none of those metrics is scored "Insufficient data"
+# rather than passing by default.
+
+# Per /score-deals request, which is one JSON body each way; larger pipelines
+# go through scripts/score_deals.py, which has no limit
+MAX_BATCH_DEALS = 2000
+GREEN, YELLOW, RED, MISSING = 0, 1, 2, -1
+COLOR_NAMES = {GREEN: "green", YELLOW: "yellow", RED: "red"}
+LOWER_IS_BETTER = ('vacancyRate', 'pricePerSqFt')
+_TRUE_STRINGS = {"true", "yes", "y", "1"}
+_FALSE_STRINGS = {"false", "no", "n", "0"}
+INSUFFICIENT_DATA = "Insufficient data"
+# Fields the batch scorer reads; anything else a deal supplies is reported as unrecognised
+RECOGNISED_FIELDS = set(SCORING_RULES) | {
+    'unitCount', 'fullBayAccess', 'deferredMaintenanceFlag', 'propertyType', 'property_type', 'marketStatus', 'id',
+}
+
+
+def _to_number(value: Any) -> float:
+    """Converts a metric value (number, bool, or numeric or yes/no string) to a float, NaN if missing."""
+    if value is None or isinstance(value, bool):
+        return np.nan if value is None else float(value)
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().lower().replace(",", "").rstrip("%")
+    if text in _TRUE_STRINGS:
+        return 1.0
+    if text in _FALSE_STRINGS:
+        return 0.0
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan
+
+
+def _flatten_deal(deal: dict) -> dict:
+    """Merges a deal's additional_data (a dict or JSON string) under its top-level fields."""
+    additional_data = deal.get('additional_data') or {}
+    if isinstance(additional_data, str):
+        try:
+            additional_data = json.loads(additional_data)
+        except ValueError:
+            additional_data = {}
+    if not isinstance(additional_data, dict):
+        additional_data = {}
+    return {**additional_data, **{k: v for k, v in deal.items() if k != 'additional_data'}}
+
+
+def build_metric_columns(deals: List[dict]) -> Dict[str, np.ndarray]:
+    """
+    One float column per SCORING_RULES metric (NaN where a deal lacks it),
+    plus the inputs of the property type rules. Occupancy is derived from
+    vacancy where only vacancy is given, as in calculate_metrics_from_data.
+    """
+    metrics = list(SCORING_RULES) + ['unitCount', 'fullBayAccess']
+    columns = {metric: np.array([_to_number(deal.get(metric)) for deal in deals], dtype=float) for metric in metrics}
+    # The rule is called deferredMaintenance; collected data calls it deferredMaintenanceFlag
+    flag = np.array([_to_number(deal.get('deferredMaintenanceFlag')) for deal in deals], dtype=float)
+    columns['deferredMaintenance'] = np.where(np.isnan(columns['deferredMaintenance']), flag, columns['deferredMaintenance'])
+    columns['occupancyRate'] = np.where(
+        np.isnan(columns['occupancyRate']), 100 - columns['vacancyRate'], columns['occupancyRate']
+    )
+    return columns
+
+
+def score_metric_columns(columns: Dict[str, np.ndarray], rules: dict = SCORING_RULES) -> Dict[str, np.ndarray]:
+    """
+    Applies evaluate_metric to whole columns at once. Returns an int8 column
+    of GREEN/YELLOW/RED per metric, with MISSING where the deal lacks it.
+    """
+    scores = {}
+    for metric, rule in rules.items():
+        values = columns[metric]
+        present = ~np.isnan(values)
+        if 'required' in rule or 'dealBreaker' in rule:
+            # A failed flag is red; anything else falls through to yellow, as in evaluate_metric
+            failed = np.zeros(values.shape, dtype=bool)
+            if 'required' in rule:
+                failed |= values == 0
+            if 'dealBreaker' in rule:
+                failed |= values != 0
+            colors = np.where(failed, RED, YELLOW)
+        elif 'green' in rule and 'yellow' in rule:
+            if metric in LOWER_IS_BETTER:
+                colors = np.where(values <= rule['green'], GREEN, np.where(values <= rule['yellow'], YELLOW, RED))
+            else:
+                colors = np.where(values >= rule['green'], GREEN, np.where(values >= rule['yellow'], YELLOW, RED))
+        else:
+            colors = np.full(values.shape, YELLOW)
+        scores[metric] = np.where(present, colors, MISSING).astype(np.int8)
+    return scores
+
+
+def _format_value(value: Any) -> Any:
+    return int(value) if isinstance(value, float) and value.is_integer() else value
+
+
+def score_deals_batch(deals: List[dict]) -> List[dict]:
+    """
+    Scores a batch of deals. Each deal is a flat dict of metrics (capRate,
+    trafficVolume, vacancyRate, ...), propertyType or property_type,
+    unitCount, fullBayAccess and marketStatus, optionally with an
+    additional_data dict or JSON string as collected by the deal form. An
+    "id" is passed through. Returns, per deal, its score, reason and details
+    (as score_deal_logic words them), its red/yellow/green flags, the
+    colour of each metric it supplied and the fields it supplied that the
+    scorer does not read. A deal with no SCORING_RULES metric (and no red
+    flag from its property type) is scored INSUFFICIENT_DATA.
+    """
+    deals = [_flatten_deal(deal) for deal in deals]
+    count = len(deals)
+    if not count:
+        return []
+    columns = build_metric_columns(deals)
+    scores = score_metric_columns(columns)
+    metric_names = list(scores)
+    matrix = np.stack([scores[metric] for metric in metric_names]) if metric_names else np.full((0, count), MISSING, dtype=np.int8)
+
+    # Property type rules as masks
+    property_types = np.array([str(deal.get('propertyType', deal.get('property_type', 'Other'))) for deal in deals])
+    multifamily = property_types == 'Multifamily'
+    industrial = property_types == 'Industrial'
+    unit_count = columns['unitCount']
+    low_unit_count = multifamily & (unit_count < PROPERTY_TYPE_RULES['Multifamily'].get('unitCountMin', 20))
+    no_bay_access = industrial & (columns['fullBayAccess'] == 0)
+    off_market = np.array([deal.get('marketStatus') == 'off-market' for deal in deals])
+
+    red_count = (matrix == RED).sum(axis=0) + low_unit_count + no_bay_access
+    yellow_count = (matrix == YELLOW).sum(axis=0)
+    green_count = (matrix == GREEN).sum(axis=0)
+    is_red = red_count > 0
+    is_yellow = ~is_red & ((yellow_count > 3) | ((yellow_count > 0) & (green_count == 0)))
+    upgraded = is_yellow & off_market
+    overall = np.where(is_red, RED, np.where(is_yellow & ~upgraded, YELLOW, GREEN))
+    insufficient = ~is_red & (matrix == MISSING).all(axis=0)
+
+    # Flag text only needs to be built for the cells that have a colour
+    flags = {color: [[] for _ in range(count)] for color in (RED, YELLOW, GREEN)}
+    for row, metric in enumerate(metric_names):
+        for index in np.flatnonzero(matrix[row] != MISSING):
+            raw = deals[index].get(metric)
+            if raw is None and metric == 'deferredMaintenance':
+                raw = deals[index].get('deferredMaintenanceFlag')
+            value = raw if raw is not None else _format_value(float(columns[metric][index]))
+            flags[int(matrix[row, index])][index].append(f"{metric}: {value}")
+    for index in np.flatnonzero(low_unit_count):
+        flags[RED][index].append(f"Unit count below minimum: {_format_value(float(unit_count[index]))}")
+    for index in np.flatnonzero(no_bay_access):
+        flags[RED][index].append("No full-bay truck access")
+
+    results = []
+    for index, deal in enumerate(deals):
+        red_flags, yellow_flags, green_metrics = flags[RED][index], flags[YELLOW][index], flags[GREEN][index]
+        unrecognised = sorted(
+            field for field, value in deal.items()
+            if field not in RECOGNISED_FIELDS and value is not None and value == value  # Skips None and NaN
+        )
+        if insufficient[index]:
+            score, reason = INSUFFICIENT_DATA, "None of the scored metrics were supplied."
+            details = f"Unrecognised fields: {', '.join(unrecognised)}" if unrecognised else "No metric values given."
+        elif overall[index] == RED:
+            score, reason, details = "Red", "Deal does not meet baseline investment criteria.", f"Critical issues: {', '.join(red_flags[:3])}"
+        elif overall[index] == YELLOW:
+            score, reason, details = "Yellow", "Deal meets minimum requirements with moderate risk.", f"Concerns: {', '.join(yellow_flags[:3])}"
+        elif upgraded[index]:
+            score, reason = "Green", "Off-market opportunity with strong potential."
+            details = f"Concerns: {', '.join(yellow_flags[:3])} (Upgraded due to off-market status)"
+        else:
+            score, reason, details = "Green", "High-performing property in target zone.", f"Strong metrics: {', '.join(green_metrics[:3])}"
+        results.append({
+            "id": deal.get('id'),
+            "score": score,
+            "reason": reason,
+            "details": details,
+            "red_flags": red_flags,
+            "yellow_flags": yellow_flags,
+            "green_metrics": green_metrics,
+            "metric_scores": {
+                metric: COLOR_NAMES[int(matrix[row, index])]
+                for row, metric in enumerate(metric_names) if matrix[row, index] != MISSING
+            },
+            "unrecognised_fields": unrecognised,
+        })
+    return results
+
+
+def summarize_scores(results: List[dict]) -> Dict[str, Any]:
+    """Counts deals per score, and how many deals supplied each unrecognised field."""
+    summary = {"Green": 0, "Yellow": 0, "Red": 0, INSUFFICIENT_DATA: 0}
+    unrecognised: Dict[str, int] = {}
+    for result in results:
+        summary[result["score"]] += 1
+        for field in result["unrecognised_fields"]:
+            unrecognised[field] = unrecognised.get(field, 0) + 1
+    summary["unrecognised_fields"] = dict(sorted(unrecognised.items(), key=lambda item: -item[1]))
+    return summary
+
 # --- HTML LETTER TEMPLATES ---
 
 LOGO_URL = "https://i.imgur.com/3ifP7i0.png" # Using a hosted version of the logo for now
@@ -0,0 +1,85 @@
+import re
+import hashlib
+import random
+import struct
+from typing import List
+
+# --- MinHash Settings ---
+# 64 permutations split into 16 LSH bands of 4 rows: chunk pairs with a
+# Jaccard similarity around 0.7 or more almost always share a band.
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+SHINGLE_SIZE = 5  # words per shingle
+NEAR_DUPLICATE_THRESHOLD = 0.9
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Fixed seed so signatures are stable across processes and restarts
+_rng = random.Random(1337)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(MINHASH_PERMUTATIONS)
+]
+
+_WHITESPACE = re.compile(r"\s+")
+_DIGITS = re.compile(r"\d+")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercases and collapses whitespace so trivially reformatted copies hash the same."""
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+def text_hash(text: str) -> str:
+    """SHA-256 of the normalised text; identical chunks share this hash."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def number_fingerprint(text: str) -> str:
+    """
+    Hash of the digit sequences in a chunk, in order. Rent rolls or CAM tables
+    for different years or units differ only in their numbers, so chunks are
+    only compared for near duplication when these match (see lsh_band_keys).
+    """
+    return hashlib.md5(" ".join(_DIGITS.findall(text)).encode("utf-8")).hexdigest()[:16]
+
+
+def _shingles(normalized: str) -> set:
+    words = normalized.split(" ")
+    if len(words) <= SHINGLE_SIZE:
+        return {normalized}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def minhash_signature(text: str) -> List[int]:
+    """Computes the MinHash signature of a chunk over word shingles."""
+    hashes = [
+        struct.unpack("<I", hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest())[0]
+        for shingle in _shingles(normalize_text(text))
+    ]
+    return [
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def lsh_band_keys(signature: List[int], namespace: str = "") -> List[str]:
+    """
+    Hashes each band of a signature into a lookup key, scoped to a namespace
+    (e.g. a property and the chunk's number_fingerprint).
+    """
+    rows = len(signature) // LSH_BANDS
+    keys = []
+    for band in range(LSH_BANDS):
+        values = signature[band * rows:(band + 1) * rows]
+        digest = hashlib.md5(struct.pack(f"<{rows}Q", *values)).hexdigest()[:16]
+        keys.append(f"{namespace}:{band}:{digest}")
+    return keys
+
+
+def estimated_similarity(first: List[int], second: List[int]) -> float:
+    """Estimates the Jaccard similarity of two chunks from their signatures."""
+    if not first or len(first) != len(second):
+        return 0.0
+    return sum(1 for a, b in zip(first, second) if a == b) / len(first)
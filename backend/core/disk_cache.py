@@ -0,0 +1,168 @@
+"""
+Size-bounded on-disk cache for JSON-serialisable values.
+
+Entries are gzip-compressed JSON files named after their key and spread over
+256 sub-directories. Reads refresh an entry's modification time, and once the
+cache grows past max_bytes the least recently used entries are removed until
+it is back under EVICT_TO_RATIO of the limit. Writes are atomic (write to a
+temporary file, then rename), so several processes can share a directory.
+List values can also be written item by item with DiskCache.writer, without
+holding the whole list in memory.
+"""
+import os
+import gzip
+import json
+import logging
+import tempfile
+import threading
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+EVICT_TO_RATIO = 0.9
+
+
+class DiskCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size: Optional[int] = None  # Measured lazily on the first write
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json.gz")
+
+    def get(self, key: str) -> Optional[Any]:
+        """Returns the cached value for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"DISK_CACHE: Dropping unreadable entry {path}. Reason: {e}")
+            self._remove(path)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any):
+        """Stores value under key, evicting old entries if the cache is over its size limit."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as f:
+                f.write(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+        except Exception:
+            self._remove(temp_path)
+            raise
+        self._commit(temp_path, path)
+
+    def writer(self, key: str) -> "DiskCacheWriter":
+        """Starts writing a list value under key; see DiskCacheWriter."""
+        return DiskCacheWriter(self, key)
+
+    def _commit(self, temp_path: str, path: str):
+        """Moves a fully written temporary file into place and accounts for its size."""
+        try:
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(temp_path, path)
+        except Exception:
+            self._remove(temp_path)
+            raise
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._measure()
+            else:
+                self._size += os.path.getsize(path) - previous
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json.gz"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def _measure(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        target = int(self.max_bytes * EVICT_TO_RATIO)
+        removed = 0
+        for _, size, path in sorted(self._entries()):
+            if self._size <= target:
+                break
+            self._remove(path)
+            self._size -= size
+            removed += 1
+        logger.info(f"DISK_CACHE: Evicted {removed} entries from {self.directory}.")
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class DiskCacheWriter:
+    """
+    Writes a list value to the cache a few items at a time. Nothing is
+    visible under the key until commit(); discard() drops what was written.
+    """
+
+    def __init__(self, cache: DiskCache, key: str):
+        self.cache = cache
+        self.path = cache._path(key)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+        self._raw = os.fdopen(fd, "wb")
+        self._file = gzip.GzipFile(fileobj=self._raw, mode="wb", compresslevel=6)
+        self._file.write(b"[")
+        self._count = 0
+
+    def append(self, items: list):
+        for item in items:
+            self._file.write((b"," if self._count else b"") + json.dumps(item, separators=(",", ":")).encode("utf-8"))
+            self._count += 1
+
+    def commit(self):
+        try:
+            self._file.write(b"]")
+            self._close()
+        except Exception:
+            self.discard()
+            raise
+        self.cache._commit(self.temp_path, self.path)
+
+    def discard(self):
+        try:
+            self._close()
+        finally:
+            self.cache._remove(self.temp_path)
+
+    def _close(self):
+        try:
+            self._file.close()
+        finally:
+            self._raw.close()
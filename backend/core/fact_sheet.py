@@ -0,0 +1,282 @@
+"""
+Per-property fact sheet.
+
+Key facts (lease expiration, monthly rent, CAM charges, property manager) are
+extracted from each document once, at ingestion, and stored with the source
+document, page, a supporting quote and the document's own date. Simple
+questions that ask for one of these facts are answered straight from the
+table, without vector searches or an LLM call; anything else, or a fact that
+was never found, falls back to RAG. When documents disagree, the value from
+the most recently dated document is given and the others are listed with it.
+"""
+import os
+import re
+import json
+import logging
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from fastapi.concurrency import run_in_threadpool
+
+from .database import SessionLocal, PropertyFact
+
+logger = logging.getLogger(__name__)
+
+# Excerpts sent to the extraction model per document, picked by keyword.
+MAX_EVIDENCE_CHUNKS = int(os.getenv("FACT_MAX_EVIDENCE_CHUNKS", "12"))
+EVIDENCE_PER_FACT = 3
+MAX_QUOTE_CHARS = 300
+# Longer questions, ones asking for analysis, and ones about a single suite or
+# unit (facts are per property) are never answered from the table.
+MAX_FACT_QUESTION_WORDS = 15
+_COMPLEX_QUESTION_RE = re.compile(
+    r"\b(compare|comparison|analy[sz]\w*|overview|summar\w*|trend\w*|across|versus|vs\.?|risks?|history|why|explain|each|all|suites?|units?)\b",
+    re.IGNORECASE,
+)
+
+
+class FactDefinition(NamedTuple):
+    label: str
+    description: str  # Given to the extraction model
+    question: re.Pattern  # Matches questions asking for this fact
+    evidence: re.Pattern  # Matches chunks likely to state it
+
+
+FACTS: Dict[str, FactDefinition] = {
+    "lease_expiration": FactDefinition(
+        "Lease expiration",
+        "The date the current lease expires or terminates.",
+        re.compile(r"\blease\s+(expir\w*|end\w*|terminat\w*)|\bwhen\b.*\blease\b.*\b(expire|end|terminate)s?\b", re.IGNORECASE),
+        re.compile(r"expir|terminat|lease term|commencement date", re.IGNORECASE),
+    ),
+    "monthly_rent": FactDefinition(
+        "Monthly rent",
+        "The current monthly base rent amount, with its currency.",
+        re.compile(r"\b(monthly|base|current)\s+rent\b|\b(what is|what's|how much is)\s+(the\s+)?rent\b", re.IGNORECASE),
+        re.compile(r"\brent\b|per month", re.IGNORECASE),
+    ),
+    "cam_charges": FactDefinition(
+        "CAM charges",
+        "The common area maintenance (CAM) charges, with their period (monthly, annual, per square foot).",
+        re.compile(r"\bcam\b|\bcommon area maintenance\b", re.IGNORECASE),
+        re.compile(r"\bCAM\b|common area", re.IGNORECASE),
+    ),
+    "property_manager": FactDefinition(
+        "Property manager",
+        "The name of the property manager or property management company.",
+        re.compile(r"\bproperty manag(er|ement)\b|\bwho manages\b|\bmanagement company\b", re.IGNORECASE),
+        re.compile(r"property manag|managed by|management (company|agreement)", re.IGNORECASE),
+    ),
+}
+
+FACT_EXTRACTION_PROMPT = """
+You are extracting key facts about the commercial property "{property}" from excerpts of the document "{source}".
+
+**Facts to extract:**
+{fact_list}
+
+**Excerpts** (each is labelled with its page number, if known):
+{excerpts}
+
+**Instructions:**
+1. Return ONLY a JSON object mapping each fact key you can find to an object with:
+   - "value": the fact, stated concisely (a date, an amount with its units, or a name)
+   - "page": the page number of the excerpt it came from, or null
+   - "quote": the exact sentence from the excerpt that states it
+   Also include "document_date": the date the document is dated, signed or effective, as YYYY-MM-DD, or null if the excerpts do not say.
+2. Leave out any fact the excerpts do not state explicitly. Do not guess.
+"""
+
+
+def match_fact(query: str) -> Optional[str]:
+    """Returns the fact key a short, single-fact question asks for, or None."""
+    if len(query.split()) > MAX_FACT_QUESTION_WORDS or _COMPLEX_QUESTION_RE.search(query):
+        return None
+    matches = [key for key, fact in FACTS.items() if fact.question.search(query)]
+    return matches[0] if len(matches) == 1 else None
+
+
+# --- Extraction ---
+
+def select_evidence(chunk_list: List[Tuple[str, dict]]) -> List[Tuple[str, dict]]:
+    """
+    Picks the chunks most likely to state each fact (the ones with the most
+    keyword hits), keeping document order.
+    """
+    picked = set()
+    for fact in FACTS.values():
+        scored = [(len(fact.evidence.findall(text)), i) for i, (text, _) in enumerate(chunk_list)]
+        best = sorted((hit for hit in scored if hit[0]), key=lambda hit: (-hit[0], hit[1]))[:EVIDENCE_PER_FACT]
+        picked.update(i for _, i in best)
+    return [chunk_list[i] for i in sorted(picked)[:MAX_EVIDENCE_CHUNKS]]
+
+
+def _parse_document_date(value) -> Optional[str]:
+    try:
+        return date.fromisoformat(str(value).strip()[:10]).isoformat()
+    except ValueError:
+        return None
+
+
+def _parse_extraction(response: str) -> Dict[str, dict]:
+    cleaned = response.strip().replace("```json", "").replace("```", "").strip()
+    data = json.loads(cleaned)
+    facts = {}
+    if not isinstance(data, dict):
+        return facts
+    document_date = _parse_document_date(data.get("document_date"))
+    for key, fact in data.items():
+        if key not in FACTS or not isinstance(fact, dict) or not str(fact.get("value") or "").strip():
+            continue
+        page = fact.get("page")
+        facts[key] = {
+            "value": str(fact["value"]).strip(),
+            "page": page if isinstance(page, int) else None,
+            "quote": (str(fact.get("quote") or "").strip()[:MAX_QUOTE_CHARS]) or None,
+            "document_date": document_date,
+        }
+    return facts
+
+
+async def extract_document_facts(property: str, source: str, chunk_list: List[Tuple[str, dict]]) -> Dict[str, dict]:
+    """
+    Extracts the fact sheet entries stated in one document and stores them,
+    replacing whatever was previously extracted from the same document.
+    """
+    evidence = select_evidence(chunk_list)
+    facts: Dict[str, dict] = {}
+    if evidence:
+        excerpts = "\n\n".join(
+            f"[Page {chunk_metadata['page']}]\n{text}" if chunk_metadata.get("page") else f"[Page unknown]\n{text}"
+            for text, chunk_metadata in evidence
+        )
+        fact_list = "\n".join(f"- {key}: {fact.description}" for key, fact in FACTS.items())
+        llm = ChatGoogleGenerativeAI(
+            model="gemini-1.5-pro",
+            google_api_key=os.environ["GEMINI_API_KEY"],
+            max_output_tokens=1024,
+            temperature=0.0
+        )
+        chain = ChatPromptTemplate.from_template(FACT_EXTRACTION_PROMPT) | llm | StrOutputParser()
+        response = await chain.ainvoke({"property": property, "source": source, "fact_list": fact_list, "excerpts": excerpts})
+        try:
+            facts = _parse_extraction(response)
+        except ValueError as e:
+            logger.warning(f"FACT_SHEET: Could not parse facts extracted from {source}: {e}")
+
+    await run_in_threadpool(store_facts, property, source, facts)
+    logger.info(f"FACT_SHEET: Extracted {len(facts)} facts for '{property}' from {source}: {sorted(facts)}")
+    return facts
+
+
+def store_facts(property: str, source: str, facts: Dict[str, dict]):
+    db = SessionLocal()
+    try:
+        db.query(PropertyFact).filter(PropertyFact.property == property, PropertyFact.source == source).delete(synchronize_session=False)
+        for key, fact in facts.items():
+            db.add(PropertyFact(
+                property=property, fact_key=key, value=fact["value"], source=source,
+                page=fact["page"], quote=fact["quote"], document_date=fact.get("document_date"),
+            ))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def delete_facts(source: str):
+    """Forgets every fact extracted from a document."""
+    db = SessionLocal()
+    try:
+        db.query(PropertyFact).filter(PropertyFact.source == source).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+# --- Lookup ---
+
+def get_facts(fact_key: str, properties: Optional[List[str]] = None) -> Dict[str, List[PropertyFact]]:
+    """
+    Returns every stored value of a fact for each property, one per source
+    document, the one to trust first: latest document date, then undated
+    documents by extraction time.
+    """
+    db = SessionLocal()
+    try:
+        query = db.query(PropertyFact).filter(PropertyFact.fact_key == fact_key)
+        if properties:
+            query = query.filter(PropertyFact.property.in_(properties))
+        by_property: Dict[str, List[PropertyFact]] = {}
+        for fact in query.order_by(PropertyFact.extracted_at.desc()).all():
+            by_property.setdefault(fact.property, []).append(fact)
+        for facts in by_property.values():
+            # Stable, so facts with the same (or no) date stay newest-extracted first
+            facts.sort(key=lambda fact: fact.document_date or "", reverse=True)
+        return by_property
+    finally:
+        db.close()
+
+
+def _citation(fact: PropertyFact) -> str:
+    citation = f"{fact.source}, p. {fact.page}" if fact.page else fact.source
+    return f"{citation}, dated {fact.document_date}" if fact.document_date else citation
+
+
+def _conflicts(facts: List[PropertyFact]) -> List[PropertyFact]:
+    """The facts, after the first, that state a different value."""
+    seen = {facts[0].value.casefold()}
+    conflicts = []
+    for fact in facts[1:]:
+        if fact.value.casefold() not in seen:
+            seen.add(fact.value.casefold())
+            conflicts.append(fact)
+    return conflicts
+
+
+def answer_from_fact_sheet(query: str, properties: Optional[List[str]] = None) -> Optional[dict]:
+    """
+    Answers a single-fact question from the fact sheet. Returns
+    {"content", "sources"}, or None when the question is not a known fact or
+    any of the requested properties has no value for it. Values that other
+    documents state differently are listed after the one given.
+    """
+    fact_key = match_fact(query)
+    if not fact_key:
+        return None
+    try:
+        facts = get_facts(fact_key, properties)
+    except Exception as e:
+        logger.error(f"FACT_SHEET: Lookup failed: {e}")
+        return None
+
+    if properties:
+        if any(p not in facts for p in properties):
+            return None
+    elif len(facts) != 1:
+        # Without a property filter, only an unambiguous fact can be answered
+        return None
+
+    conflicts = {name: _conflicts(candidates) for name, candidates in facts.items()}
+    if len(facts) == 1:
+        name, candidates = next(iter(facts.items()))
+        fact = candidates[0]
+        content = f"{fact.value}\n\n*Source: {_citation(fact)}*"
+        if fact.quote:
+            content += f"\n> {fact.quote}"
+        if conflicts[name]:
+            content += "\n\nOther documents state:\n" + "\n".join(f"- {other.value} ({_citation(other)})" for other in conflicts[name])
+    else:
+        lines = []
+        for name, candidates in sorted(facts.items()):
+            line = f"- **{name}:** {candidates[0].value} ({_citation(candidates[0])})"
+            if conflicts[name]:
+                line += "; other documents state " + ", ".join(f"{other.value} ({_citation(other)})" for other in conflicts[name])
+            lines.append(line)
+        content = "\n".join(lines)
+    cited = [candidates[0] for candidates in facts.values()] + [fact for others in conflicts.values() for fact in others]
+    return {"content": content, "sources": sorted({fact.source for fact in cited})}
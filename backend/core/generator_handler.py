@@ -1,66 +1,138 @@
 import os
+import json
+import asyncio
+import random
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.schema import SystemMessage, HumanMessage
+import numpy as np
 import pandas as pd
 import io
+import re
+import hashlib
 import logging
+import tempfile
+import time
+from functools import reduce
+from itertools import repeat
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Tuple, Union
+from fastapi.concurrency import run_in_threadpool
+
+from . import chunking
+from .disk_cache import DiskCache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# --- Generation Settings ---
+GENERATOR_CONCURRENCY = int(os.getenv("GENERATOR_CONCURRENCY", "8"))
+GENERATOR_MAX_RETRIES = int(os.getenv("GENERATOR_MAX_RETRIES", "3"))
+GENERATOR_BACKOFF_SECONDS = 1.0
+GENERATOR_MODEL = "gemini-1.5-pro"
+GENERATOR_MAX_OUTPUT_TOKENS = 8192
+# Rows packed into one prompt (1 disables batching). The actual batch size is
+# also capped by how many outputs fit in GENERATOR_MAX_OUTPUT_TOKENS and by
+# GENERATOR_BATCH_CONTEXT_TOKENS of row data per prompt.
+GENERATOR_BATCH_SIZE = int(os.getenv("GENERATOR_BATCH_SIZE", "8"))
+GENERATOR_BATCH_CONTEXT_TOKENS = int(os.getenv("GENERATOR_BATCH_CONTEXT_TOKENS", "4000"))
+# Generated rows are cached by template, tone, style and row data, so
+# duplicate rows are generated once; 0 disables the cache. Bump the version
+# whenever the prompts change so stale outputs are ignored.
+GENERATOR_CACHE_VERSION = "1"
+GENERATOR_CACHE_DIR = os.getenv("GENERATOR_CACHE_DIR", os.path.join(tempfile.gettempdir(), "alliance_generator_cache"))
+GENERATOR_CACHE_MAX_BYTES = int(os.getenv("GENERATOR_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+_output_cache = None
+# Larger files must be run as background jobs (see generator_jobs)
+GENERATOR_SYNC_MAX_ROWS = 1000
+# Previews personalize at most this many rows; sampled previews pick them
+# from the first GENERATOR_PREVIEW_SCAN_ROWS rows of the file.
+GENERATOR_PREVIEW_MAX_ROWS = 20
+GENERATOR_PREVIEW_SCAN_ROWS = int(os.getenv("GENERATOR_PREVIEW_SCAN_ROWS", "5000"))
+# Progress entries that see no update for this long are dropped and marked
+# done, e.g. when a run's response was never streamed.
+GENERATOR_PROGRESS_TTL_SECONDS = int(os.getenv("GENERATOR_PROGRESS_TTL_SECONDS", "900"))
+
 GENERATOR_PERSONA = """
 You are an expert-level marketing and sales copywriter. Your task is to rewrite a piece of core content for a specific individual based on their data.
 You must seamlessly weave the user's data into the core content to make it feel personal, natural, and compelling.
 The final output should ONLY be the personalized text. Do not add any extra greetings, commentary, or sign-offs.
 """
 
-async def process_csv_and_generate_content(
-    csv_file: io.BytesIO,
-    key_fields: list[str],
-    core_content: str,
-    tone: str,
-    style: str,
-    is_preview: bool = False
-) -> pd.DataFrame:
+def _placeholder(field: str) -> str:
+    return f"{{{{{field}}}}}"
+
+class PreparedRows(NamedTuple):
+    """Prompt inputs for every row of a DataFrame, built column-wise in one pass."""
+    templates: List[str]  # core_content with the row's key field placeholders filled in
+    contexts: List[str]  # The row's other columns as "column: 'value', ..."
+    prospects: List[dict]  # {"id", "fields", "context"} entries for batched prompts
+    cache_keys: List[str]  # See prepare_rows
+
+def _concat(columns: List[pd.Series], separator: str) -> pd.Series:
+    """Joins string columns element-wise with a separator."""
+    return reduce(lambda joined, column: joined + separator + column, columns)
+
+def prepare_rows(df: pd.DataFrame, key_fields: list[str], core_content: str, tone: str, style: str) -> PreparedRows:
     """
-    Reads a CSV file, generates personalized content for each row using an LLM,
-    and returns a DataFrame with the new content.
+    Fills the template and serialises the context for all rows at once, with
+    column-wise string operations instead of a pass over each row.
+
+    The template is compiled once into literal text and key field slots, and
+    each row's copy is built by concatenating the literal parts with the key
+    field columns. Output cache keys hash the template, tone, style and the
+    row's normalised data: whitespace is collapsed, and missing values count
+    as empty, so rows that differ only in those respects share an output.
     """
-    try:
-        df = pd.read_csv(csv_file)
-        target_df = df.head(1) if is_preview else df
+    text = df.astype(str).fillna("nan")  # Missing values read as str(nan), as in the per-row prompt
+    index = df.index
+    fields = [field for field in key_fields if field in df.columns and _placeholder(field) in core_content]
+    context_columns = [column for column in df.columns if column not in key_fields]
 
-        if len(df) > 1000:
-            raise ValueError("CSV file cannot contain more than 1000 rows.")
+    # Step 1: Fill the key field placeholders
+    if fields:
+        pattern = re.compile("|".join(re.escape(_placeholder(field)) for field in sorted(fields, key=len, reverse=True)))
+        literals = pattern.split(core_content)
+        slots = [match.group()[2:-2] for match in pattern.finditer(core_content)]
+        templates = pd.Series(literals[0], index=index)
+        for field, literal in zip(slots, literals[1:]):
+            templates = templates + text[field] + literal
+    else:
+        templates = pd.Series(core_content, index=index)
 
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-1.5-pro",
-            google_api_key=os.environ.get("GEMINI_API_KEY"),
-            temperature=0.7,
-            max_output_tokens=8192
+    # Step 2: Serialise the contextual data, excluding key_fields to avoid redundancy
+    if context_columns:
+        contexts = _concat([f"{column}: '" + text[column] + "'" for column in context_columns], ", ")
+    else:
+        contexts = pd.Series("", index=index)
+
+    field_values = zip(*[text[field].tolist() for field in fields]) if fields else repeat(())
+    context_values = zip(*[text[column].tolist() for column in context_columns]) if context_columns else repeat(())
+    prospects = [
+        {"id": position, "fields": dict(zip(fields, row_fields)), "context": dict(zip(context_columns, row_context))}
+        for position, row_fields, row_context in zip(range(len(df)), field_values, context_values)
+    ]
+
+    # Step 3: Cache keys over the normalised row data
+    key_columns = fields + sorted(context_columns, key=str)
+    if key_columns:
+        present = df[key_columns].notna()
+        normalised = df[key_columns].astype(object).where(present, "").astype(str).apply(
+            lambda column: column.str.replace(r"\s+", " ", regex=True).str.strip()
         )
-        
-        generated_contents = []
-        total_rows = len(target_df)
-        logger.info(f"Starting content generation for {total_rows} rows...")
-
-        for index, row in target_df.iterrows():
-            logger.info(f"Processing row {index + 1}/{total_rows}")
-            
-            # Step 1: Perform direct replacement for key fields
-            temp_content = core_content
-            for field in key_fields:
-                placeholder = f"{{{{{field}}}}}"
-                if placeholder in temp_content and field in row:
-                    temp_content = temp_content.replace(placeholder, str(row[field]))
-            
-            # Step 2: Prepare contextual data for the AI
-            # Exclude key_fields from the context to avoid redundancy
-            contextual_data = {k: v for k, v in row.items() if k not in key_fields}
-            context_str = ", ".join([f"{k}: '{v}'" for k, v in contextual_data.items()])
-            
-            # Step 3: Construct the new, more intelligent prompt
-            prompt = f"""
+        rows = _concat([normalised[column] for column in key_columns], "\x1f").tolist()
+    else:
+        rows = [""] * len(df)
+    prefix = json.dumps(
+        [GENERATOR_CACHE_VERSION, GENERATOR_MODEL, core_content, tone, style, [str(column) for column in key_columns]],
+        ensure_ascii=False, separators=(",", ":"),
+    )
+    cache_keys = [hashlib.sha256(f"{prefix}\x1e{row}".encode("utf-8")).hexdigest() for row in rows]
+
+    return PreparedRows(templates.tolist(), contexts.tolist(), prospects, cache_keys)
+
+def build_row_prompt(temp_content: str, context_str: str, tone: str, style: str) -> str:
+    """Builds the personalisation prompt for one CSV row from its filled template and context (see prepare_rows)."""
+    return f"""
 Your Task:
 You are an expert copywriter. Your goal is to rewrite and personalize the 'Smart Template' below.
 Use the 'Contextual Data' provided to make the message highly relevant to the recipient.
@@ -82,25 +154,451 @@ Maintain the core message and offer of the original template.
 - The final output style must be a: {style}
 - IMPORTANT: The output should ONLY be the final rewritten text. Do not add any of your own commentary, greetings, or sign-offs.
 """
-            
-            messages = [
-                SystemMessage(content=GENERATOR_PERSONA),
-                HumanMessage(content=prompt)
-            ]
-            
-            try:
+
+def build_batch_prompt(prospects: list[dict], core_content: str, tone: str, style: str) -> str:
+    """Builds one prompt that personalizes the template for several rows at once."""
+    return f"""
+Your Task:
+You are an expert copywriter. Your goal is to rewrite and personalize the 'Smart Template' below separately for each prospect in the 'Prospects' list.
+For each prospect, first replace every {{{{field}}}} placeholder in the template with the exact value of that field in the prospect's "fields".
+Then use the prospect's "context" to make the message highly relevant to them.
+Do NOT simply list the data. Instead, weave the information naturally into the template to make it sound personal and compelling.
+Maintain the core message and offer of the original template.
+
+**Smart Template to Personalize:**
+---
+{core_content}
+---
+
+**Prospects:**
+{json.dumps(prospects, ensure_ascii=False)}
+
+**Instructions:**
+- The final tone of your writing must be: {tone}
+- The final output style must be a: {style}
+- Return ONLY a JSON array with one object per prospect, in the same order: {{"id": <the prospect's id>, "content": "<the final rewritten text>"}}
+- IMPORTANT: Each "content" must ONLY be the final rewritten text. Do not add any of your own commentary, greetings, or sign-offs.
+"""
+
+def parse_batch_response(response: str, prospects: list[dict]) -> Dict[int, str]:
+    """
+    Returns the valid outputs of a batched prompt by row position. An output
+    is valid if it is non-empty and contains every key field value its row
+    should have filled in; rows without a valid output are left out.
+    """
+    cleaned = response.strip().replace("```json", "").replace("```", "").strip()
+    try:
+        items = json.loads(cleaned)
+    except ValueError:
+        return {}
+    if not isinstance(items, list):
+        return {}
+    expected = {prospect["id"]: prospect for prospect in prospects}
+    outputs = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        item_id = item.get("id")
+        # JSON numbers may come back as floats (0.0); booleans compare equal to 0 and 1 but are not ids
+        if type(item_id) is float and item_id.is_integer():
+            item_id = int(item_id)
+        if type(item_id) is not int or item_id not in expected:
+            continue
+        prospect = expected[item_id]
+        content = item.get("content")
+        if not isinstance(content, str) or not content.strip():
+            continue
+        if all(value in content for value in prospect["fields"].values()):
+            outputs[prospect["id"]] = content
+    return outputs
+
+def batch_row_limit(core_content: str, max_rows: int = GENERATOR_BATCH_SIZE) -> int:
+    """
+    How many rows fit in one batched prompt, given that every row's output is
+    expected to be about twice the template's length (personalization plus
+    JSON quoting) and all of them must fit in the output token limit.
+    """
+    expected_output_tokens = chunking.count_tokens(core_content) * 2 + 64
+    by_output = int(GENERATOR_MAX_OUTPUT_TOKENS * 0.8) // expected_output_tokens
+    return max(1, min(max_rows, by_output))
+
+def plan_batches(prospect_tokens: List[int], max_rows: int, max_context_tokens: int = GENERATOR_BATCH_CONTEXT_TOKENS) -> List[Tuple[int, int]]:
+    """Packs consecutive rows into (start, end) batches of at most max_rows rows and max_context_tokens of row data."""
+    batches, start, tokens = [], 0, 0
+    for position, row_tokens in enumerate(prospect_tokens):
+        if position > start and (position - start >= max_rows or tokens + row_tokens > max_context_tokens):
+            batches.append((start, position))
+            start, tokens = position, 0
+        tokens += row_tokens
+    if start < len(prospect_tokens):
+        batches.append((start, len(prospect_tokens)))
+    return batches
+
+def _get_output_cache() -> Optional[DiskCache]:
+    global _output_cache
+    if _output_cache is None and GENERATOR_CACHE_MAX_BYTES > 0:
+        _output_cache = DiskCache(GENERATOR_CACHE_DIR, GENERATOR_CACHE_MAX_BYTES)
+    return _output_cache
+
+def get_cached_outputs(keys: List[str]) -> Dict[str, str]:
+    """Returns the cached outputs for whichever of the keys have one."""
+    cache = _get_output_cache()
+    if cache is None:
+        return {}
+    outputs = {}
+    for key in keys:
+        output = cache.get(key)
+        if isinstance(output, str):
+            outputs[key] = output
+    return outputs
+
+def cache_outputs(outputs: Dict[str, str]):
+    """Stores generated outputs, skipping rows that came back empty."""
+    cache = _get_output_cache()
+    if cache is None:
+        return
+    for key, output in outputs.items():
+        if not output:
+            continue
+        try:
+            cache.set(key, output)
+        except OSError as e:
+            logger.warning(f"Could not write generator cache entry {key}: {e}")
+
+async def generate_with_retry(
+    llm: ChatGoogleGenerativeAI,
+    prompt: str,
+    semaphore: asyncio.Semaphore,
+    label: str,
+    max_retries: int = GENERATOR_MAX_RETRIES
+) -> str:
+    """
+    Sends one prompt (for the rows described by label), holding a slot of the semaphore only while the
+    request is in flight. Failures are retried with jittered exponential
+    backoff; the last error is raised once retries are exhausted.
+    """
+    messages = [
+        SystemMessage(content=GENERATOR_PERSONA),
+        HumanMessage(content=prompt)
+    ]
+    for attempt in range(max_retries + 1):
+        try:
+            async with semaphore:
                 response = await llm.ainvoke(messages)
-                generated_text = response.content
-                generated_contents.append(generated_text)
-                logger.info(f"Successfully generated content for row {index + 1}")
+            return response.content
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = GENERATOR_BACKOFF_SECONDS * (2 ** attempt)
+            logger.info(f"Retrying {label} (attempt {attempt + 2}/{max_retries + 1}) after error: {e}")
+            await asyncio.sleep(delay + random.uniform(0, delay))
+
+class GeneratorProgress:
+    """
+    Progress of a generator run, published for the optional
+    /generator/progress/{run_id} event stream.
+    """
+
+    def __init__(self, total: int, completed: int = 0, failed: int = 0, cached: int = 0):
+        self.total = total
+        self.completed = completed
+        self.failed = failed
+        self.cached = cached  # Rows reused from the cache or a duplicate row instead of generated
+        self.done = False
+        self.updated_at = time.monotonic()
+        self._changed = asyncio.Condition()
+
+    def snapshot(self) -> dict:
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "cached": self.cached,
+            "total": self.total,
+            "done": self.done,
+        }
+
+    async def update(self, failed: bool = False, cached: bool = False, done: bool = False):
+        async with self._changed:
+            if done:
+                self.done = True
+            else:
+                self.completed += 1
+                self.failed += int(failed)
+                self.cached += int(cached)
+            self.updated_at = time.monotonic()
+            self._changed.notify_all()
+
+    async def wait_for_change(self, last_completed: int, timeout: float = 15.0):
+        async with self._changed:
+            try:
+                await asyncio.wait_for(
+                    self._changed.wait_for(lambda: self.done or self.completed != last_completed), timeout
+                )
+            except asyncio.TimeoutError:
+                pass
+
+# Runs with a progress stream, by the run_id the client chose or the job id
+_progress: Dict[str, GeneratorProgress] = {}
+
+def expire_progress():
+    """Drops entries that have had no update for GENERATOR_PROGRESS_TTL_SECONDS."""
+    cutoff = time.monotonic() - GENERATOR_PROGRESS_TTL_SECONDS
+    for run_id, progress in list(_progress.items()):
+        if progress.updated_at < cutoff:
+            # Subscribers see done on their next poll and stop
+            progress.done = True
+            del _progress[run_id]
+
+def start_progress(run_id: str, total: int, completed: int = 0, failed: int = 0, cached: int = 0) -> GeneratorProgress:
+    expire_progress()
+    progress = GeneratorProgress(total, completed, failed, cached)
+    _progress[run_id] = progress
+    return progress
+
+def get_progress(run_id: str) -> Optional[GeneratorProgress]:
+    expire_progress()
+    return _progress.get(run_id)
+
+def finish_progress(run_id: str, progress: GeneratorProgress):
+    """Removes the run's entry, unless it has since been replaced by another run's."""
+    if _progress.get(run_id) is progress:
+        del _progress[run_id]
+
+def read_generator_csv(csv_file: Union[str, io.BytesIO], is_preview: bool = False) -> pd.DataFrame:
+    """Reads the uploaded CSV; for a preview, only its first row is read."""
+    if is_preview:
+        return read_preview_rows(csv_file, 1)
+    df = pd.read_csv(csv_file)
+    if len(df) > GENERATOR_SYNC_MAX_ROWS:
+        raise ValueError(
+            f"CSV file cannot contain more than {GENERATOR_SYNC_MAX_ROWS} rows. Submit larger files as a generator job."
+        )
+    return df
+
+def read_preview_rows(csv_file: Union[str, io.BytesIO], count: int = 1, sample: bool = False) -> pd.DataFrame:
+    """
+    Reads the rows to preview without parsing the whole file: the header and
+    first `count` rows, or with `sample`, `count` representative rows picked
+    from the first GENERATOR_PREVIEW_SCAN_ROWS (see sample_representative_rows).
+    """
+    count = max(1, min(count, GENERATOR_PREVIEW_MAX_ROWS))
+    if not sample:
+        return pd.read_csv(csv_file, nrows=count)
+    return sample_representative_rows(pd.read_csv(csv_file, nrows=GENERATOR_PREVIEW_SCAN_ROWS), count)
+
+def sample_representative_rows(df: pd.DataFrame, count: int) -> pd.DataFrame:
+    """
+    Picks `count` rows that between them cover as many distinct values as
+    possible, greedily: each pick is the row with the most values not yet
+    covered, preferring complete rows, then earlier ones. Only columns with
+    repeated values (segments such as city, industry or role) are counted;
+    near-unique columns such as names or emails say nothing about which
+    kind of row it is. Rows are returned in file order.
+    """
+    if len(df) <= count:
+        return df
+    segment_columns = [column for column in df.columns if 1 <= df[column].nunique() <= len(df) // 2]
+    codes = [pd.factorize(df[column])[0] for column in segment_columns]  # -1 for missing values
+    covered = [np.zeros(codes_.max() + 1, dtype=bool) for codes_ in codes]
+    completeness = df.notna().sum(axis=1).to_numpy()
+    available = np.ones(len(df), dtype=bool)
+    chosen = []
+    for _ in range(count):
+        novelty = np.zeros(len(df), dtype=np.int64)
+        for codes_, covered_ in zip(codes, covered):
+            novelty += (codes_ >= 0) & ~covered_[np.maximum(codes_, 0)]
+        score = np.where(available, novelty * (len(df.columns) + 1) + completeness, -1)
+        best = int(np.argmax(score))
+        chosen.append(best)
+        available[best] = False
+        for codes_, covered_ in zip(codes, covered):
+            if codes_[best] >= 0:
+                covered_[codes_[best]] = True
+    return df.iloc[sorted(chosen)]
+
+def _get_llm() -> ChatGoogleGenerativeAI:
+    return ChatGoogleGenerativeAI(
+        model=GENERATOR_MODEL,
+        google_api_key=os.environ.get("GEMINI_API_KEY"),
+        temperature=0.7,
+        max_output_tokens=GENERATOR_MAX_OUTPUT_TOKENS
+    )
+
+async def iter_generated_content(
+    df: pd.DataFrame,
+    key_fields: list[str],
+    core_content: str,
+    tone: str,
+    style: str,
+    concurrency: int = GENERATOR_CONCURRENCY,
+    progress: Optional[GeneratorProgress] = None,
+    batch_size: int = GENERATOR_BATCH_SIZE
+) -> AsyncIterator[Tuple[int, str]]:
+    """
+    Generates personalized content for each row of df, up to `concurrency`
+    requests at a time, and yields (position, text) in input order as soon as
+    a row and all rows before it are done. Rows whose output is cached (see
+    prepare_rows), or that duplicate an earlier row, are not generated
+    again. The rest are packed into batched prompts of up to batch_size rows
+    (see batch_row_limit and plan_batches); rows a batch does not return a
+    valid output for are retried on their own. Only a bounded window of
+    batches is in flight, so memory stays flat however far the slowest one
+    lags behind. A row whose LLM call keeps failing yields an empty string.
+    """
+    llm = _get_llm()
+    total_rows = len(df)
+    concurrency = max(1, concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    prepared = prepare_rows(df, key_fields, core_content, tone, style)
+    prospects, keys = prepared.prospects, prepared.cache_keys
+
+    # The first row with each key generates the output the others reuse
+    owners: Dict[str, int] = {}
+    for position, key in enumerate(keys):
+        owners.setdefault(key, position)
+    texts_by_key = await run_in_threadpool(get_cached_outputs, list(owners))
+    cache_hits = set(texts_by_key)
+    to_generate = [position for key, position in owners.items() if key not in texts_by_key]
+
+    max_rows = batch_row_limit(core_content, batch_size)
+    if max_rows > 1:
+        prospect_tokens = [chunking.count_tokens(json.dumps(prospects[p], ensure_ascii=False)) for p in to_generate]
+        batches = [to_generate[start:end] for start, end in plan_batches(prospect_tokens, max_rows)]
+    else:
+        batches = [[position] for position in to_generate]
+    batch_of = {position: index for index, batch in enumerate(batches) for position in batch}
+    logger.info(
+        f"Starting content generation for {total_rows} rows: {total_rows - len(to_generate)} reused from the cache "
+        f"or duplicate rows, {len(to_generate)} in {len(batches)} requests ({concurrency} at a time)..."
+    )
+
+    async def generate_row(position: int) -> str:
+        row_number = position + 1
+        prompt = build_row_prompt(prepared.templates[position], prepared.contexts[position], tone, style)
+        try:
+            generated_text = await generate_with_retry(llm, prompt, semaphore, f"row {row_number}")
+            logger.info(f"Successfully generated content for row {row_number}/{total_rows}")
+        except Exception as e:
+            logger.error(f"LLM failed for row {row_number}. Error: {e}. Leaving it empty.")
+            generated_text = None
+        if progress:
+            await progress.update(failed=generated_text is None)
+        return generated_text or ""
+
+    async def generate_batch(positions: List[int]):
+        outputs: Dict[int, str] = {}
+        if len(positions) > 1:
+            batch_prospects = [prospects[position] for position in positions]
+            label = f"rows {positions[0] + 1}-{positions[-1] + 1}"
+            try:
+                response = await generate_with_retry(
+                    llm, build_batch_prompt(batch_prospects, core_content, tone, style), semaphore, label
+                )
+                outputs = parse_batch_response(response, batch_prospects)
             except Exception as e:
-                logger.error(f"LLM failed for row {index + 1}. Error: {e}. Appending empty string.")
-                generated_contents.append("")
+                logger.error(f"LLM failed for {label}. Error: {e}. Retrying them one by one.")
+            if len(outputs) < len(positions):
+                logger.info(f"Batch {label} returned {len(outputs)}/{len(positions)} valid outputs; retrying the rest one by one.")
+            if progress:
+                for _ in outputs:
+                    await progress.update()
+        retry_positions = [position for position in positions if position not in outputs]
+        retried = await asyncio.gather(*(generate_row(position) for position in retry_positions))
+        outputs.update(zip(retry_positions, retried))
+        generated = {keys[position]: text for position, text in outputs.items()}
+        await run_in_threadpool(cache_outputs, generated)
+        texts_by_key.update(generated)
+
+    # Batches are scheduled up to a window ahead of the one holding the next row to be yielded
+    window = concurrency * 2
+    pending: Dict[int, asyncio.Task] = {}
+    next_to_schedule = 0
+    try:
+        for position, key in enumerate(keys):
+            if key not in texts_by_key:
+                index = batch_of[owners[key]]
+                while next_to_schedule < len(batches) and next_to_schedule < index + window:
+                    pending[next_to_schedule] = asyncio.create_task(generate_batch(batches[next_to_schedule]))
+                    next_to_schedule += 1
+                await pending.pop(index)
+            elif progress and (position != owners[key] or key in cache_hits):
+                # Generated rows were counted when their output arrived
+                await progress.update(cached=True)
+            yield position, texts_by_key[key]
+    finally:
+        for task in pending.values():
+            task.cancel()
+    logger.info(f"Finished content generation for all {total_rows} rows.")
+
+async def stream_generated_csv(
+    df: pd.DataFrame,
+    key_fields: list[str],
+    core_content: str,
+    tone: str,
+    style: str,
+    concurrency: int = GENERATOR_CONCURRENCY,
+    progress: Optional[GeneratorProgress] = None
+) -> AsyncIterator[str]:
+    """
+    Yields the output CSV piece by piece: the header first, then each row
+    with its ai_generated_content as soon as it (and every row before it) is
+    generated. Rows are formatted exactly as DataFrame.to_csv would.
+    """
+    yield df.head(0).assign(ai_generated_content=[]).to_csv(index=False)
+    try:
+        async for position, generated_text in iter_generated_content(
+            df, key_fields, core_content, tone, style, concurrency, progress
+        ):
+            yield df.iloc[[position]].assign(ai_generated_content=[generated_text]).to_csv(header=False, index=False)
+    finally:
+        if progress:
+            await progress.update(done=True)
+
+async def stream_previews(
+    df: pd.DataFrame,
+    key_fields: list[str],
+    core_content: str,
+    tone: str,
+    style: str
+) -> AsyncIterator[dict]:
+    """
+    Yields {"row", "data", "preview_content"} for each preview row, in file
+    order, as soon as it and the rows before it are generated. Rows are
+    generated all at once and one prompt each, so a preview shows exactly
+    what a single-row request produces.
+    """
+    records = df.astype(object).where(df.notna(), None).to_dict("records")
+    row_numbers = [int(label) + 1 for label in df.index]  # df keeps the file's row labels
+    async for position, generated_text in iter_generated_content(
+        df, key_fields, core_content, tone, style, concurrency=len(df), batch_size=1
+    ):
+        yield {"row": row_numbers[position], "data": records[position], "preview_content": generated_text}
 
+async def process_csv_and_generate_content(
+    csv_file: Union[str, io.BytesIO],
+    key_fields: list[str],
+    core_content: str,
+    tone: str,
+    style: str,
+    is_preview: bool = False,
+    concurrency: int = GENERATOR_CONCURRENCY
+) -> pd.DataFrame:
+    """
+    Reads a CSV file, generates personalized content for each row using an LLM
+    (up to `concurrency` rows at a time), and returns a DataFrame with the new
+    content in the original row order.
+    """
+    try:
+        target_df = read_generator_csv(csv_file, is_preview).copy()
+        generated_contents = [
+            generated_text
+            async for _, generated_text in iter_generated_content(
+                target_df, key_fields, core_content, tone, style, concurrency
+            )
+        ]
         target_df['ai_generated_content'] = generated_contents
-        logger.info(f"Finished content generation for all {total_rows} rows.")
         return target_df
 
     except Exception as e:
         logger.error(f"Error processing CSV file: {e}")
-        raise 
\ No newline at end of file
+        raise
@@ -0,0 +1,323 @@
+"""
+Background jobs for the content generator.
+
+A job's input CSV is stored in the database in blocks of
+GENERATOR_JOB_CHUNK_ROWS rows and generated from one block at a time, so there
+is no limit on its size. Generated rows are stored, in input order, as output
+blocks of GENERATOR_JOB_COMMIT_ROWS rows; each is committed together with the
+job's completed_rows, so after a crash, restart or redeploy the job carries on
+from the next row. The output can be downloaded at any time, partial or
+complete.
+"""
+import io
+import os
+import csv
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+
+import pandas as pd
+from sqlalchemy import func
+from fastapi.concurrency import run_in_threadpool
+
+from .database import SessionLocal, GeneratorJob, GeneratorJobBlock
+from . import generator_handler
+
+logger = logging.getLogger(__name__)
+
+GENERATOR_JOB_CHUNK_ROWS = int(os.getenv("GENERATOR_JOB_CHUNK_ROWS", "500"))
+GENERATOR_JOB_COMMIT_ROWS = 25
+ACTIVE_STATUSES = ("queued", "running")
+
+# Jobs running in this process, by id
+_running: Dict[str, asyncio.Task] = {}
+
+
+def job_status(job: GeneratorJob) -> dict:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "filename": job.filename,
+        "total_rows": job.total_rows,
+        "completed_rows": job.completed_rows,
+        "failed_rows": job.failed_rows,
+        "cached_rows": job.cached_rows,
+        "cache_hit_rate": job.cached_rows / job.completed_rows if job.completed_rows else 0.0,
+        "error": job.error,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+        "completed_at": job.completed_at,
+    }
+
+
+def get_job(job_id: str) -> Optional[GeneratorJob]:
+    db = SessionLocal()
+    try:
+        return db.query(GeneratorJob).filter(GeneratorJob.id == job_id).first()
+    finally:
+        db.close()
+
+
+def _update_job(job_id: str, **fields):
+    db = SessionLocal()
+    try:
+        db.query(GeneratorJob).filter(GeneratorJob.id == job_id).update(fields, synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _iter_csv_blocks(csv_path: str) -> Iterator[tuple]:
+    """
+    Splits a CSV file into its header line and (row_count, rows) blocks of
+    GENERATOR_JOB_CHUNK_ROWS rows, raising ValueError if it has no header or a
+    row has more fields than the header.
+    """
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header:
+            raise ValueError("The CSV file is empty.")
+        yield _csv_text([header])
+        rows = []
+        for row in reader:
+            if not row:
+                continue  # pandas skips blank lines too
+            if len(row) > len(header):
+                raise ValueError(f"Line {reader.line_num} of the CSV has more fields than its header.")
+            rows.append(row)
+            if len(rows) == GENERATOR_JOB_CHUNK_ROWS:
+                yield len(rows), _csv_text(rows)
+                rows = []
+        if rows:
+            yield len(rows), _csv_text(rows)
+
+
+def _csv_text(rows: List[list]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    return buffer.getvalue()
+
+
+async def create_job(csv_path: str, filename: str, key_fields: List[str], core_content: str, tone: str, style: str) -> dict:
+    """
+    Stores the uploaded CSV at csv_path with a new job and starts running it in
+    the background. The caller still owns, and removes, the file.
+    """
+    def store() -> GeneratorJob:
+        blocks = _iter_csv_blocks(csv_path)
+        header = next(blocks)
+        db = SessionLocal()
+        try:
+            job = GeneratorJob(
+                filename=filename, key_fields=key_fields, core_content=core_content,
+                tone=tone, style=style, total_rows=0, input_header=header,
+            )
+            db.add(job)
+            db.flush()
+            for seq, (row_count, data) in enumerate(blocks):
+                db.add(GeneratorJobBlock(job_id=job.id, kind="input", seq=seq, row_count=row_count, data=data))
+                job.total_rows += row_count
+                if seq % 20 == 19:
+                    db.flush()
+            db.commit()
+            db.refresh(job)
+            return job
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    job = await run_in_threadpool(store)
+    logger.info(f"GENERATOR_JOB: Created job {job.id} for {filename} ({job.total_rows} rows).")
+    start_job(job.id)
+    return job_status(job)
+
+
+def start_job(job_id: str):
+    """Runs the job in the background unless it is already running in this process."""
+    if job_id in _running:
+        return
+    task = asyncio.create_task(_run_job(job_id))
+    _running[job_id] = task
+    task.add_done_callback(lambda _: _running.pop(job_id, None))
+
+
+def retry_job(job_id: str) -> Optional[GeneratorJob]:
+    """Restarts a failed job from its last completed row. Returns None if there is no such job."""
+    job = get_job(job_id)
+    if job and job.status == "failed":
+        _update_job(job_id, status="queued", error=None)
+        start_job(job_id)
+        job = get_job(job_id)
+    return job
+
+
+def resume_interrupted_jobs() -> int:
+    """Restarts every job left queued or running by a previous process. Returns how many."""
+    db = SessionLocal()
+    try:
+        job_ids = [job.id for job in db.query(GeneratorJob.id).filter(GeneratorJob.status.in_(ACTIVE_STATUSES)).all()]
+    finally:
+        db.close()
+    for job_id in job_ids:
+        logger.info(f"GENERATOR_JOB: Resuming job {job_id}.")
+        start_job(job_id)
+    return len(job_ids)
+
+
+def _input_blocks(job_id: str) -> List[tuple]:
+    """Returns the (seq, row_count) of each of the job's input blocks, in order."""
+    db = SessionLocal()
+    try:
+        return (
+            db.query(GeneratorJobBlock.seq, GeneratorJobBlock.row_count)
+            .filter(GeneratorJobBlock.job_id == job_id, GeneratorJobBlock.kind == "input")
+            .order_by(GeneratorJobBlock.seq)
+            .all()
+        )
+    finally:
+        db.close()
+
+
+def _read_input_block(job: GeneratorJob, seq: int) -> pd.DataFrame:
+    db = SessionLocal()
+    try:
+        block = db.query(GeneratorJobBlock).filter(
+            GeneratorJobBlock.job_id == job.id, GeneratorJobBlock.kind == "input", GeneratorJobBlock.seq == seq
+        ).one()
+        data = block.data
+    finally:
+        db.close()
+    # Every block is read as text, exactly as written: dtypes inferred per block
+    # could render the same column as "30" in one block and "30.0" in another.
+    return pd.read_csv(io.StringIO(job.input_header + data), dtype=str, keep_default_na=False)
+
+
+def _next_output_seq(job_id: str) -> int:
+    db = SessionLocal()
+    try:
+        last = db.query(func.max(GeneratorJobBlock.seq)).filter(
+            GeneratorJobBlock.job_id == job_id, GeneratorJobBlock.kind == "output"
+        ).scalar()
+        return 0 if last is None else last + 1
+    finally:
+        db.close()
+
+
+def _store_output(job_id: str, seq: int, lines: List[str], **fields):
+    """Stores a block of output rows and the job's progress in one transaction."""
+    db = SessionLocal()
+    try:
+        db.add(GeneratorJobBlock(job_id=job_id, kind="output", seq=seq, row_count=len(lines), data="".join(lines)))
+        db.query(GeneratorJob).filter(GeneratorJob.id == job_id).update(fields, synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def output_header(job: GeneratorJob) -> str:
+    return pd.read_csv(io.StringIO(job.input_header), nrows=0).assign(ai_generated_content=[]).to_csv(index=False)
+
+
+def has_output(job: GeneratorJob) -> bool:
+    """Whether the job's rows are stored. Jobs created when they were kept on local disk lost them on restart."""
+    return job.input_header is not None
+
+
+async def _run_job(job_id: str):
+    job = await run_in_threadpool(get_job, job_id)
+    if not job or job.status not in ACTIVE_STATUSES:
+        return
+    if not has_output(job):
+        await run_in_threadpool(
+            _update_job, job_id, status="failed", error="The job's input was lost in a restart; please submit it again."
+        )
+        return
+    completed, failed = job.completed_rows, job.failed_rows
+    output_bytes = job.output_bytes
+    progress = generator_handler.start_progress(job_id, job.total_rows, completed, failed, job.cached_rows)
+    await run_in_threadpool(_update_job, job_id, status="running", error=None)
+    logger.info(f"GENERATOR_JOB: Running job {job_id} from row {completed + 1}/{job.total_rows}.")
+
+    try:
+        blocks = await run_in_threadpool(_input_blocks, job_id)
+        output_seq = await run_in_threadpool(_next_output_seq, job_id)
+        lines: List[str] = []
+
+        async def commit():
+            nonlocal output_seq, output_bytes, lines
+            if not lines:
+                return
+            output_bytes += sum(len(line.encode("utf-8")) for line in lines)
+            await run_in_threadpool(
+                _store_output, job_id, output_seq, lines,
+                completed_rows=completed, failed_rows=failed, cached_rows=progress.cached, output_bytes=output_bytes,
+            )
+            output_seq += 1
+            lines = []
+
+        rows_seen = 0
+        for seq, row_count in blocks:
+            # Skip rows already in the output from an earlier run
+            skip = min(max(completed - rows_seen, 0), row_count)
+            rows_seen += row_count
+            if skip == row_count:
+                continue
+            chunk = (await run_in_threadpool(_read_input_block, job, seq)).iloc[skip:]
+            async for position, generated_text in generator_handler.iter_generated_content(
+                chunk, job.key_fields, job.core_content, job.tone, job.style, progress=progress
+            ):
+                lines.append(chunk.iloc[[position]].assign(ai_generated_content=[generated_text]).to_csv(header=False, index=False))
+                completed += 1
+                failed += int(not generated_text)
+                if len(lines) >= GENERATOR_JOB_COMMIT_ROWS:
+                    await commit()
+
+        await commit()
+        await run_in_threadpool(
+            _update_job, job_id, status="completed", total_rows=completed, completed_at=datetime.now(timezone.utc)
+        )
+        logger.info(
+            f"GENERATOR_JOB: Job {job_id} completed: {completed} rows, {failed} failed, {progress.cached} reused from the cache."
+        )
+    except asyncio.CancelledError:
+        # Shutting down; the job stays running and resumes on the next start
+        raise
+    except Exception as e:
+        logger.error(f"GENERATOR_JOB: Job {job_id} failed at row {completed + 1}: {e}", exc_info=True)
+        await run_in_threadpool(_update_job, job_id, status="failed", error=str(e))
+    finally:
+        await progress.update(done=True)
+        generator_handler.finish_progress(job_id, progress)
+
+
+def iter_job_output(job: GeneratorJob, blocks_per_query: int = 20) -> Iterator[bytes]:
+    """Yields the job's output CSV: the header, then every stored output block in order."""
+    yield output_header(job).encode("utf-8")
+    next_seq = 0
+    while True:
+        db = SessionLocal()
+        try:
+            blocks = (
+                db.query(GeneratorJobBlock.seq, GeneratorJobBlock.data)
+                .filter(GeneratorJobBlock.job_id == job.id, GeneratorJobBlock.kind == "output", GeneratorJobBlock.seq >= next_seq)
+                .order_by(GeneratorJobBlock.seq)
+                .limit(blocks_per_query)
+                .all()
+            )
+        finally:
+            db.close()
+        if not blocks:
+            return
+        for seq, data in blocks:
+            yield data.encode("utf-8")
+            next_seq = seq + 1
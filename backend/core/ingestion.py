@@ -0,0 +1,587 @@
+"""
+Staged document ingestion: parse -> split -> embed -> upsert.
+
+Each stage runs its own workers and hands work to the next through a bounded
+asyncio queue, so a slow stage (usually embedding) applies back-pressure to
+the ones before it and overall throughput is set by the slowest stage rather
+than the sum of all of them.
+
+- parse:  files are parsed in the shared process pool (processor.get_parse_pool)
+          and stream parsed units (pages, row groups) back over a managed queue.
+          Files already in the parse cache skip the pool and go straight to
+          embedding with their cached chunks. Large PDFs are split into page
+          ranges parsed by several workers and re-assembled in page order.
+- split:  units are chunked incrementally per document and grouped into
+          embedding batches. Documents are pinned to one split worker so their
+          pages stay in order.
+- embed:  batches are deduplicated against the chunk registry and embedded.
+- upsert: embedded batches are written to Pinecone and the chunk registry.
+"""
+import os
+import json
+import time
+import queue
+import asyncio
+import logging
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from . import processor, pinecone_manager
+
+logger = logging.getLogger(__name__)
+
+# --- Pipeline Settings ---
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+SPLIT_WORKERS = int(os.getenv("INGEST_SPLIT_WORKERS", "2"))
+EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", "4"))
+UPSERT_WORKERS = int(os.getenv("INGEST_UPSERT_WORKERS", "2"))
+QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "8"))
+CHUNK_SPOOL_DIR = os.getenv("INGEST_CHUNK_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "alliance_ingest_chunks"))
+
+STAGES = ("parse", "split", "embed", "upsert")
+
+
+class IngestDocument(NamedTuple):
+    path: str
+    name: str
+    metadata: dict  # Shared vector metadata: source, doc_type, property
+    sha256: Optional[str] = None  # File content hash, if the caller already computed it
+
+
+class _DocumentState:
+    def __init__(self, document: IngestDocument):
+        self.document = document
+        self.splitter = processor.PageSplitter()
+        self.pending: List[tuple] = []  # (chunk_text, chunk_metadata) awaiting a full batch
+        self.batches_queued = 0
+        self.batches_done = 0
+        self.parse_done = False
+        self.finished = False
+        self.error: Optional[str] = None
+        self.chunks = 0
+        self.cache_key: Optional[str] = None
+        self.cached = False
+        self.cache_on_done = False  # Parse cache miss: store the chunks once splitting is done
+        self.cache_writer = None  # Parse cache entry the chunks are written to as they are split
+        self.spool_path: Optional[str] = None  # JSON lines file of every (chunk, metadata), when spooled
+        self.page_seconds = 0.0
+        self.slowest_page: Optional[tuple] = None  # (seconds, page number)
+        self.failed_pages: List[int] = []
+        self.stats = {"indexed": 0, "duplicates": 0, "near_duplicates": 0, "reused_embeddings": 0}
+
+
+class _ParseTask(NamedTuple):
+    document_index: int
+    part: int  # Position of the page range within the document
+    page_range: Optional[tuple]
+
+
+class _PartAssembler:
+    """
+    Re-orders the messages of a document parsed in several page ranges:
+    units of the current range are forwarded as they arrive, later ranges
+    are buffered until every range before them is done.
+    """
+
+    def __init__(self, parts: int):
+        self.parts = parts
+        self.next_part = 0
+        self.buffered: Dict[int, list] = {}
+        self.done_parts = set()
+        self.unit_count = 0
+        self.failed = False
+
+    def units(self, part: int, units: list) -> list:
+        """Returns the units that can be forwarded now."""
+        if part == self.next_part:
+            return units
+        self.buffered.setdefault(part, []).extend(units)
+        return []
+
+    def done(self, part: int, count: int) -> list:
+        """Marks a range done and returns any buffered units that are now in order."""
+        self.done_parts.add(part)
+        self.unit_count += count
+        ready = []
+        while self.next_part in self.done_parts:
+            self.next_part += 1
+            ready.extend(self.buffered.pop(self.next_part, []))
+        return ready
+
+    @property
+    def complete(self) -> bool:
+        return self.next_part == self.parts
+
+
+class IngestionPipeline:
+    """
+    Runs a set of documents through the staged pipeline. Worker counts, the
+    queue size and the embedding batch size are per-pipeline; embeddings and
+    index let callers substitute stub clients (e.g. for benchmarks).
+    on_document_done, if given, is awaited once per document after its last
+    batch has been written. It runs inside a stage worker, so it should only
+    queue slow post-processing, not await it. With spool_chunks the
+    document's (chunk_text, chunk_metadata) pairs are written to a file as they
+    are split, and its result carries the path as "chunk_path" (read it with
+    read_spooled_chunks). The callback then owns the file and must delete it.
+    """
+
+    def __init__(
+        self,
+        split_workers: int = SPLIT_WORKERS,
+        embed_workers: int = EMBED_WORKERS,
+        upsert_workers: int = UPSERT_WORKERS,
+        queue_size: int = QUEUE_SIZE,
+        embed_batch_size: int = EMBED_BATCH_SIZE,
+        embeddings=None,
+        index=None,
+        use_registry: bool = True,
+        use_parse_cache: bool = True,
+        delete_files: bool = True,
+        on_document_done: Optional[Callable[[IngestDocument, dict], Awaitable[None]]] = None,
+        spool_chunks: bool = False,
+    ):
+        self.split_workers = split_workers
+        self.embed_workers = embed_workers
+        self.upsert_workers = upsert_workers
+        self.queue_size = queue_size
+        self.embed_batch_size = embed_batch_size
+        self.embeddings = embeddings
+        self.index = index
+        self.use_registry = use_registry
+        self.use_parse_cache = use_parse_cache
+        self.delete_files = delete_files
+        self.on_document_done = on_document_done
+        self.spool_chunks = spool_chunks and on_document_done is not None
+        self.stage_stats = {stage: {"items": 0, "busy_seconds": 0.0} for stage in STAGES}
+
+    @staticmethod
+    def _page_report(state: _DocumentState) -> dict:
+        if state.slowest_page is None:
+            return {}
+        return {
+            "page_seconds": round(state.page_seconds, 3),
+            "slowest_page": {"page": state.slowest_page[1], "seconds": round(state.slowest_page[0], 3)},
+            "failed_pages": sorted(state.failed_pages),
+        }
+
+    def _record(self, stage: str, started: float, items: int = 1):
+        self.stage_stats[stage]["items"] += items
+        self.stage_stats[stage]["busy_seconds"] += time.perf_counter() - started
+
+    async def run(self, documents: List[IngestDocument]) -> dict:
+        """Ingests every document and returns per-document results and per-stage timings."""
+        started = time.perf_counter()
+        if self.index is None:
+            self.index = pinecone_manager._get_pinecone_index()
+        if self.embeddings is None:
+            self.embeddings = pinecone_manager._get_embedding_model()
+
+        self.states = [_DocumentState(document) for document in documents]
+        if self.spool_chunks:
+            os.makedirs(CHUNK_SPOOL_DIR, exist_ok=True)
+            for state in self.states:
+                fd, state.spool_path = tempfile.mkstemp(suffix=".jsonl", dir=CHUNK_SPOOL_DIR)
+                os.close(fd)
+        self.split_queues = [asyncio.Queue(self.queue_size) for _ in range(self.split_workers)]
+        self.embed_queue = asyncio.Queue(self.queue_size)
+        self.upsert_queue = asyncio.Queue(self.queue_size)
+
+        split_tasks = [asyncio.create_task(self._split_worker(q)) for q in self.split_queues]
+        embed_tasks = [asyncio.create_task(self._embed_worker()) for _ in range(self.embed_workers)]
+        upsert_tasks = [asyncio.create_task(self._upsert_worker()) for _ in range(self.upsert_workers)]
+
+        try:
+            await self._parse_stage()
+        finally:
+            # Drain stage by stage so every queued batch is finished
+            for q in self.split_queues:
+                await q.put(None)
+            await asyncio.gather(*split_tasks)
+            for _ in embed_tasks:
+                await self.embed_queue.put(None)
+            await asyncio.gather(*embed_tasks)
+            for _ in upsert_tasks:
+                await self.upsert_queue.put(None)
+            await asyncio.gather(*upsert_tasks)
+            # Spooled chunks of documents that never finished have no owner,
+            # and parse cache entries left open are incomplete
+            for state in self.states:
+                if state.cache_writer is not None:
+                    await run_in_threadpool(self._discard_cache_entry, state)
+                if not state.finished and state.spool_path and os.path.exists(state.spool_path):
+                    os.remove(state.spool_path)
+
+        return {
+            "documents": [
+                {"name": s.document.name, "chunks": s.chunks, "error": s.error, "parse_cached": s.cached, **self._page_report(s), **s.stats}
+                for s in self.states
+            ],
+            "stages": self.stage_stats,
+            "parse_cache_hits": sum(s.cached for s in self.states),
+            "elapsed_seconds": time.perf_counter() - started,
+        }
+
+    # --- Parse ---
+    async def _parse_stage(self):
+        started = time.perf_counter()
+        hits = {}
+        if self.use_parse_cache and processor.PARSE_CACHE_MAX_BYTES > 0:
+            hits = await run_in_threadpool(self._lookup_parse_cache)
+
+        to_parse = [i for i in range(len(self.states)) if i not in hits]
+        if to_parse:
+            await self._parse_files(to_parse, hits)
+        else:
+            await self._route_cached(hits)
+        # Parsing happens in other processes, so report its wall-clock time
+        self.stage_stats["parse"]["busy_seconds"] = time.perf_counter() - started
+
+    def _lookup_parse_cache(self) -> dict:
+        """Resolves each document's cache key and returns the cached chunks of every hit, by index."""
+        hits = {}
+        for i, state in enumerate(self.states):
+            document = state.document
+            try:
+                file_hash = document.sha256 or processor.file_sha256(document.path)
+            except OSError:
+                continue  # Let the parser report the missing file
+            state.cache_key = processor.parse_cache_key(file_hash, document.name)
+            chunks = processor.get_cached_chunks(state.cache_key)
+            if chunks is None:
+                state.cache_on_done = True
+            else:
+                state.cached = True
+                hits[i] = chunks
+        return hits
+
+    async def _route_cached(self, hits: dict):
+        for i, chunks in hits.items():
+            logger.info(f"INGEST: Parse cache hit for {self.states[i].document.name} ({len(chunks)} chunks).")
+            units = [processor.ParsedUnit(text, chunk_metadata, presplit=True) for text, chunk_metadata in chunks]
+            for start in range(0, len(units), self.embed_batch_size):
+                await self._route(("units", i, units[start:start + self.embed_batch_size]))
+            await self._route(("done", i, len(units)))
+
+    def _plan_parse_tasks(self, to_parse: List[int]) -> List[_ParseTask]:
+        tasks = []
+        for i in to_parse:
+            document = self.states[i].document
+            ranges = []
+            if os.path.splitext(document.name)[1].lower() == ".pdf":
+                try:
+                    ranges = processor.pdf_page_ranges(processor.count_pdf_pages(document.path))
+                except Exception:
+                    pass  # Parsed as a whole so the worker reports the error
+            if ranges:
+                logger.info(f"INGEST: Parsing {document.name} in {len(ranges)} page ranges.")
+            for part, page_range in enumerate(ranges or [None]):
+                tasks.append(_ParseTask(i, part, page_range))
+        return tasks
+
+    async def _parse_files(self, to_parse: List[int], hits: dict):
+        loop = asyncio.get_running_loop()
+        tasks = await run_in_threadpool(self._plan_parse_tasks, to_parse)
+        assemblers: Dict[int, _PartAssembler] = {}
+        for task in tasks:
+            assemblers[task.document_index] = _PartAssembler(task.part + 1)
+
+        unit_queue = await run_in_threadpool(processor.new_parse_queue, self.queue_size * self.split_workers)
+        received = [0] * len(tasks)  # Units already received from each task
+        pools: List[Optional[ProcessPoolExecutor]] = [None] * len(tasks)
+        futures = [None] * len(tasks)
+        retried = set()
+
+        def submit(t: int):
+            task = tasks[t]
+            document = self.states[task.document_index].document
+            pools[t] = processor.get_parse_pool()
+            futures[t] = pools[t].submit(
+                processor.stream_file_units, document.path, document.name, unit_queue, t,
+                page_range=task.page_range, skip_units=received[t],
+            )
+
+        for t in range(len(tasks)):
+            try:
+                submit(t)
+            except BrokenProcessPool:
+                # Left broken by a worker that died earlier
+                await run_in_threadpool(processor.reset_parse_pool, pools[t])
+                submit(t)
+        # Cached documents are routed while the pool parses the rest
+        await self._route_cached(hits)
+        pending = set(range(len(tasks)))
+
+        async def handle(message: tuple):
+            if message[0] == "units":
+                received[message[1]] += len(message[2])
+            else:
+                pending.discard(message[1])
+            await self._assemble(tasks[message[1]], assemblers, message)
+
+        while pending:
+            try:
+                message = await loop.run_in_executor(None, unit_queue.get, True, 1)
+            except queue.Empty:
+                # A worker that died outright never reports back; check for it here.
+                failed = [t for t in pending if futures[t].done() and futures[t].exception()]
+                broken = [t for t in failed if isinstance(futures[t].exception(), BrokenProcessPool) and t not in retried]
+                if broken:
+                    # The dead worker took the whole pool down. Replace it, take in what the
+                    # other workers sent before they were stopped, and parse the rest once more.
+                    for pool in {id(pools[t]): pools[t] for t in broken}.values():
+                        await run_in_threadpool(processor.reset_parse_pool, pool)
+                    while True:
+                        try:
+                            message = unit_queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        await handle(message)
+                    broken = [t for t in broken if t in pending]
+                    names = sorted({self.states[tasks[t].document_index].document.name for t in broken})
+                    logger.warning(f"INGEST: A parsing worker died; retrying {', '.join(names)} on a new pool.")
+                    for t in broken:
+                        retried.add(t)
+                        submit(t)
+                    continue
+                for t in failed:
+                    pending.discard(t)
+                    await self._assemble(tasks[t], assemblers, ("error", t, str(futures[t].exception())))
+                continue
+            await handle(message)
+
+    async def _assemble(self, task: _ParseTask, assemblers: Dict[int, _PartAssembler], message: tuple):
+        kind, _, payload = message
+        i = task.document_index
+        assembler = assemblers[i]
+        if assembler.failed:
+            return
+        if kind == "error":
+            assembler.failed = True
+            await self._route(("error", i, payload))
+            return
+        if kind == "units":
+            self._record_pages(self.states[i], payload)
+            ready = assembler.units(task.part, payload)
+        else:
+            ready = assembler.done(task.part, payload)
+        if ready:
+            self.stage_stats["parse"]["items"] += len(ready)
+            await self._route(("units", i, ready))
+        if assembler.complete:
+            await self._route(("done", i, assembler.unit_count))
+
+    @staticmethod
+    def _record_pages(state: _DocumentState, units: list):
+        for unit in units:
+            seconds = unit.metadata.get("extract_seconds")
+            if seconds is None:
+                continue
+            state.page_seconds += seconds
+            if state.slowest_page is None or seconds > state.slowest_page[0]:
+                state.slowest_page = (seconds, unit.metadata["page"])
+            if "extract_error" in unit.metadata:
+                state.failed_pages.append(unit.metadata["page"])
+
+    async def _route(self, message: tuple):
+        _, i, _ = message
+        await self.split_queues[i % self.split_workers].put(message)
+
+    # --- Split ---
+    async def _split_worker(self, split_queue: asyncio.Queue):
+        while True:
+            message = await split_queue.get()
+            if message is None:
+                return
+            kind, i, payload = message
+            state = self.states[i]
+            started = time.perf_counter()
+            if kind == "error":
+                state.error = payload
+                state.parse_done = True
+                logger.error(f"INGEST: Failed to parse {state.document.name}. Reason: {payload}")
+            elif state.error:
+                state.parse_done = kind == "done"
+            elif kind == "units":
+                chunks = await run_in_threadpool(self._split_units, state, payload)
+                state.pending.extend(chunks)
+                await self._collect(state, chunks)
+                while len(state.pending) >= self.embed_batch_size:
+                    await self._queue_batch(state, state.pending[:self.embed_batch_size])
+                    state.pending = state.pending[self.embed_batch_size:]
+            else:  # done
+                tail = state.splitter.finish()
+                state.pending.extend(tail)
+                await self._collect(state, tail)
+                if state.cache_on_done:
+                    await run_in_threadpool(self._finish_cache_entry, state)
+                if state.pending:
+                    await self._queue_batch(state, state.pending)
+                    state.pending = []
+                state.parse_done = True
+            self._record("split", started, len(payload) if kind == "units" else 0)
+            await self._maybe_finish(state)
+
+    async def _collect(self, state: _DocumentState, chunks: list):
+        """Writes a document's chunks to the parse cache and spools them for post-processing."""
+        if not chunks:
+            return
+        if state.cache_on_done:
+            await run_in_threadpool(self._write_cache_entry, state, chunks)
+        if state.spool_path:
+            await run_in_threadpool(_append_spool, state.spool_path, chunks)
+
+    @staticmethod
+    def _write_cache_entry(state: _DocumentState, chunks: list):
+        try:
+            if state.cache_writer is None:
+                state.cache_writer = processor.open_parse_cache_entry(state.cache_key)
+                if state.cache_writer is None:
+                    state.cache_on_done = False
+                    return
+            state.cache_writer.append([[text, chunk_metadata] for text, chunk_metadata in chunks])
+        except OSError as e:
+            logger.warning(f"INGEST: Not caching the chunks of {state.document.name}. Reason: {e}")
+            IngestionPipeline._discard_cache_entry(state)
+
+    @staticmethod
+    def _finish_cache_entry(state: _DocumentState):
+        """
+        Commits the document's parse cache entry, unless a page could not be
+        extracted; those are tried again the next time the file is ingested.
+        """
+        if state.failed_pages:
+            IngestionPipeline._discard_cache_entry(state)
+            return
+        IngestionPipeline._write_cache_entry(state, [])
+        if state.cache_writer is None:
+            return
+        try:
+            state.cache_writer.commit()
+        except OSError as e:
+            logger.warning(f"INGEST: Could not write the parse cache entry of {state.document.name}: {e}")
+        state.cache_writer = None
+        state.cache_on_done = False
+
+    @staticmethod
+    def _discard_cache_entry(state: _DocumentState):
+        state.cache_on_done = False
+        if state.cache_writer is not None:
+            try:
+                state.cache_writer.discard()
+            except OSError:
+                pass
+            state.cache_writer = None
+
+    @staticmethod
+    def _split_units(state: _DocumentState, units: list) -> list:
+        chunks = []
+        for unit in units:
+            if unit.presplit:
+                chunks.append((unit.text, unit.metadata))
+            else:
+                chunks.extend(state.splitter.feed(unit.text, unit.metadata.get("page")))
+        return chunks
+
+    async def _queue_batch(self, state: _DocumentState, chunks: list):
+        state.batches_queued += 1
+        state.chunks += len(chunks)
+        batch = pinecone_manager.ChunkBatch(
+            [text for text, _ in chunks],
+            state.document.metadata,
+            [chunk_metadata for _, chunk_metadata in chunks],
+        )
+        await self.embed_queue.put((state, batch))
+
+    # --- Embed ---
+    async def _embed_worker(self):
+        while True:
+            item = await self.embed_queue.get()
+            if item is None:
+                return
+            state, batch = item
+            started = time.perf_counter()
+            try:
+                await run_in_threadpool(pinecone_manager.prepare_chunks, batch, self.index, self.use_registry)
+                await run_in_threadpool(pinecone_manager.embed_chunks, batch, self.embeddings)
+            except Exception as e:
+                self._record("embed", started, len(batch.chunks))
+                await self._fail_batch(state, batch, e)
+                continue
+            self._record("embed", started, len(batch.chunks))
+            await self.upsert_queue.put((state, batch))
+
+    # --- Upsert ---
+    async def _upsert_worker(self):
+        while True:
+            item = await self.upsert_queue.get()
+            if item is None:
+                return
+            state, batch = item
+            started = time.perf_counter()
+            try:
+                stats = await run_in_threadpool(pinecone_manager.write_chunks, batch, self.index, self.use_registry)
+                for key, value in stats.items():
+                    state.stats[key] += value
+            except Exception as e:
+                self._record("upsert", started, len(batch.chunks))
+                await self._fail_batch(state, batch, e)
+                continue
+            self._record("upsert", started, len(batch.chunks))
+            state.batches_done += 1
+            await self._maybe_finish(state)
+
+    async def _fail_batch(self, state: _DocumentState, batch: pinecone_manager.ChunkBatch, error: Exception):
+        logger.error(f"INGEST: Failed to index a batch of {state.document.name}. Reason: {error}")
+        try:
+            await run_in_threadpool(pinecone_manager.release_chunks, batch, self.use_registry)
+        except Exception as e:
+            logger.error(f"INGEST: Could not release the chunks of a failed batch of {state.document.name}. Reason: {e}")
+        state.error = state.error or str(error)
+        state.batches_done += 1
+        await self._maybe_finish(state)
+
+    async def _maybe_finish(self, state: _DocumentState):
+        if state.finished or not state.parse_done or state.batches_done < state.batches_queued:
+            return
+        state.finished = True
+        document = state.document
+        if self.delete_files and os.path.exists(document.path):
+            os.remove(document.path)
+        if state.failed_pages:
+            logger.warning(f"INGEST: Could not extract pages {sorted(state.failed_pages)} of {document.name}.")
+        if state.error:
+            logger.error(f"INGEST: Finished {document.name} with errors: {state.error}")
+        elif state.chunks:
+            logger.info(f"INGEST: Indexed {document.name}: {state.chunks} chunks, {state.stats}")
+        else:
+            logger.warning(f"INGEST: No chunks found for {document.name}. Skipping.")
+        if self.on_document_done:
+            result = {"chunks": state.chunks, "error": state.error, **state.stats}
+            if state.spool_path:
+                result["chunk_path"] = state.spool_path
+            try:
+                await self.on_document_done(document, result)
+            except Exception as e:
+                logger.error(f"INGEST: Post-processing failed for {document.name}. Reason: {e}")
+
+
+def _append_spool(path: str, chunks: list):
+    with open(path, "a", encoding="utf-8") as f:
+        for text, chunk_metadata in chunks:
+            f.write(json.dumps([text, chunk_metadata]) + "\n")
+
+
+def read_spooled_chunks(path: str) -> List[tuple]:
+    """Loads the (chunk_text, chunk_metadata) pairs spooled for a document."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [tuple(json.loads(line)) for line in f]
+
+
+async def ingest_documents(documents: List[IngestDocument], **settings) -> dict:
+    """Runs a single pipeline over the given documents with default settings unless overridden."""
+    return await IngestionPipeline(**settings).run(documents)
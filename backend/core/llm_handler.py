@@ -7,7 +7,7 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 import json
 from fastapi.concurrency import run_in_threadpool
-from . import pinecone_manager
+from . import pinecone_manager, fact_sheet, summaries
 
 # Configure comprehensive logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -185,7 +185,7 @@ async def handle_simple_query(
     query: str, properties: Optional[List[str]]
 ) -> AsyncGenerator[Dict, None]:
     """
-    Handles simple factual queries with direct, concise answers
+    Handles simple factual queries with direct, concise answers.
     """
     logger.info("Handling simple query")
     llm = get_llm()
@@ -295,6 +295,15 @@ async def run_agentic_rag_pipeline(
     # Preprocess query for mortgage-related synonyms
     expanded_query = preprocess_query_for_synonyms(query)
     
+    # Questions for a fact already on the property fact sheet are answered
+    # from it, without classifying the query or any retrieval.
+    fact_answer = await run_in_threadpool(fact_sheet.answer_from_fact_sheet, query, properties)
+    if fact_answer:
+        logger.info("Answered from the property fact sheet")
+        yield {"content": fact_answer["content"]}
+        yield {"sources": fact_answer["sources"]}
+        return
+
     # First, classify the query
     query_type = await classify_query(query)
     
@@ -305,14 +314,25 @@ async def run_agentic_rag_pipeline(
     else:
         # Handle complex queries with the full pipeline
         llm = get_llm()
-        
-        # 1. Decompose the query (use expanded query for better decomposition)
-        sub_questions = await decompose_query_to_sub_questions(expanded_query, llm)
-        
-        # 2. Gather evidence for each sub-question
         evidence_list = []
         all_sources = set()
         
+        # 1. Broad questions start from the precomputed property and document
+        #    summaries and only drill into chunks for the question itself.
+        #    Everything else is decomposed into sub-questions.
+        summary_evidence = None
+        if summaries.is_overview_query(query):
+            summary_evidence = await run_in_threadpool(summaries.get_summary_evidence, properties)
+        if summary_evidence:
+            logger.info(f"Answering from {len(summary_evidence.evidence)} precomputed summaries.")
+            evidence_list.extend(summary_evidence.evidence)
+            all_sources.update(summary_evidence.sources)
+            sub_questions = [query]
+        else:
+            # Use the expanded query for better decomposition
+            sub_questions = await decompose_query_to_sub_questions(expanded_query, llm)
+        
+        # 2. Gather evidence for each sub-question
         for i, sub_q in enumerate(sub_questions):
             logger.info(f"Step {i+1}/{len(sub_questions)}: Retrieving context for sub-question: '{sub_q}'")
             
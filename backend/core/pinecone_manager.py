@@ -1,9 +1,9 @@
 import os
 from pinecone import Pinecone
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_pinecone import Pinecone as LangchainPinecone
-from typing import List
+from typing import Dict, List, Optional
 import logging
+from . import chunk_registry
 
 # --- Environment Setup ---
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
@@ -35,25 +35,154 @@ def _get_embedding_model():
         google_api_key=GEMINI_API_KEY
     )
 
-def upsert_chunks(chunks: List[str], metadata: dict):
+UPSERT_BATCH_SIZE = 100
+
+
+class ChunkBatch:
+    """
+    A batch of chunks from one document moving through prepare -> embed -> write.
+    Each step is a separate function so the ingestion pipeline can run them as
+    independent stages; upsert_chunks runs all three in sequence.
+    """
+
+    def __init__(self, chunks: List[str], metadata: dict, chunk_metadatas: Optional[List[dict]] = None):
+        self.chunks = chunks
+        self.metadata = metadata
+        self.chunk_metadatas = chunk_metadatas
+        self.plan: Optional[chunk_registry.ChunkPlan] = None
+        self.to_embed: List[chunk_registry.PlannedChunk] = []
+        self.values: dict = {}  # chunk_id -> embedding
+        self.vectors: list = []
+        self.stats: dict = {}
+        self.registered = False
+
+    @property
+    def property_name(self) -> Optional[str]:
+        return self.metadata.get("property")
+
+    @property
+    def source(self) -> Optional[str]:
+        return self.metadata.get("source")
+
+
+def prepare_chunks(batch: ChunkBatch, index=None, use_registry: bool = True) -> ChunkBatch:
+    """
+    Works out which chunks actually need embedding. With the registry, exact
+    and near duplicates of chunks already indexed for the property are
+    dropped, and text already embedded for another property reuses the stored
+    vector. Without it, only exact duplicates inside the batch are dropped.
+    """
+    if use_registry:
+        batch.plan = chunk_registry.plan_chunks(batch.chunks, batch.property_name)
+    else:
+        batch.plan = chunk_registry.plan_chunks_locally(batch.chunks, batch.property_name)
+
+    batch.to_embed = list(batch.plan.new)
+    if use_registry and batch.plan.new:
+        shared = chunk_registry.find_embedded_text([c.text_hash for c in batch.plan.new])
+        if shared:
+            index = index or _get_pinecone_index()
+            fetched = index.fetch(ids=list(set(shared.values())))
+            existing = {vector_id: vector.values for vector_id, vector in fetched.vectors.items()}
+            for c in batch.plan.new:
+                if shared.get(c.text_hash) in existing:
+                    batch.values[c.chunk_id] = existing[shared[c.text_hash]]
+            batch.to_embed = [c for c in batch.plan.new if c.chunk_id not in batch.values]
+    return batch
+
+
+def embed_chunks(batch: ChunkBatch, embeddings=None) -> ChunkBatch:
+    """Embeds the chunks of a prepared batch that have no reusable vector."""
+    if batch.to_embed:
+        embeddings = embeddings or _get_embedding_model()
+        values = embeddings.embed_documents([batch.chunks[c.index] for c in batch.to_embed])
+        batch.values.update({c.chunk_id: v for c, v in zip(batch.to_embed, values)})
+    return batch
+
+
+def write_chunks(batch: ChunkBatch, index=None, use_registry: bool = True) -> dict:
+    """Upserts an embedded batch into Pinecone and records it in the chunk registry."""
+    vectors = []
+    for c in batch.plan.new:
+        doc_metadata = batch.metadata.copy()
+        if batch.chunk_metadatas:
+            doc_metadata.update(batch.chunk_metadatas[c.index])
+        doc_metadata["text"] = batch.chunks[c.index]
+        doc_metadata["sources"] = [batch.source]
+        vectors.append((c.chunk_id, batch.values[c.chunk_id], doc_metadata))
+
+    if vectors:
+        index = index or _get_pinecone_index()
+        for start in range(0, len(vectors), UPSERT_BATCH_SIZE):
+            index.upsert(vectors=vectors[start:start + UPSERT_BATCH_SIZE])
+
+    if use_registry:
+        new_ids = {c.chunk_id for c in batch.plan.new}
+        duplicate_ids = [chunk_id for chunk_id in batch.plan.duplicates if chunk_id not in new_ids]
+        merged_sources = chunk_registry.register_chunks(batch.plan.new, duplicate_ids, batch.source)
+        batch.registered = True
+        if merged_sources:
+            _set_sources(index or _get_pinecone_index(), merged_sources)
+
+    batch.vectors = vectors
+    batch.stats = {
+        "indexed": len(vectors),
+        "duplicates": len(batch.chunks) - len(vectors),
+        "near_duplicates": batch.plan.near_duplicates,
+        "reused_embeddings": len(batch.plan.new) - len(batch.to_embed),
+    }
+    return batch.stats
+
+
+def release_chunks(batch: ChunkBatch, use_registry: bool = True):
+    """Gives up the registry claims of a batch that failed before write_chunks registered it."""
+    if use_registry and batch.plan and not batch.registered:
+        chunk_registry.release_chunks([c.chunk_id for c in batch.plan.new])
+
+
+def _set_sources(index, sources_by_id: Dict[str, List[str]], reset_source: bool = False):
+    """
+    Rewrites the 'sources' metadata of indexed chunks (and 'source', with
+    reset_source, to the first of them). Chunks are fetched and re-upserted
+    UPSERT_BATCH_SIZE at a time rather than updated one request each.
+    """
+    chunk_ids = list(sources_by_id)
+    for start in range(0, len(chunk_ids), UPSERT_BATCH_SIZE):
+        fetched = index.fetch(ids=chunk_ids[start:start + UPSERT_BATCH_SIZE])
+        vectors = []
+        for vector_id, vector in fetched.vectors.items():
+            metadata = dict(vector.metadata or {})
+            metadata["sources"] = sources_by_id[vector_id]
+            if reset_source:
+                metadata["source"] = sources_by_id[vector_id][0]
+            vectors.append((vector_id, vector.values, metadata))
+        if vectors:
+            index.upsert(vectors=vectors)
+
+
+def upsert_chunks(chunks: List[str], metadata: dict, chunk_metadatas: Optional[List[dict]] = None) -> dict:
     """
     Embeds text chunks using Google Gemini and upserts them into Pinecone.
+    chunk_metadatas, if given, holds per-chunk fields (e.g. page numbers)
+    merged over the shared metadata.
+
+    Chunks are content-addressed through the chunk registry: exact and near
+    duplicates of chunks already indexed for the property are not embedded
+    again, only their source lists are extended, and text already embedded
+    for another property reuses the stored vector.
     Initializes clients on-the-fly for stability.
     """
-    embeddings = _get_embedding_model()
-    
-    docs_with_metadata = []
-    for i, chunk in enumerate(chunks):
-        doc_metadata = metadata.copy()
-        doc_metadata["text"] = chunk
-        docs_with_metadata.append(doc_metadata)
-
-    LangchainPinecone.from_texts(
-        texts=chunks,
-        embedding=embeddings,
-        metadatas=docs_with_metadata,
-        index_name=os.getenv("PINECONE_INDEX_NAME")
-    )
+    batch = ChunkBatch(chunks, metadata, chunk_metadatas)
+    index = _get_pinecone_index()
+    try:
+        prepare_chunks(batch, index=index)
+        embed_chunks(batch)
+        stats = write_chunks(batch, index=index)
+    except Exception:
+        release_chunks(batch)
+        raise
+    logger.info(f"Upserted chunks for {batch.source}: {stats}")
+    return stats
 
 def list_documents(property: str = None):
     """
@@ -80,14 +209,16 @@ def list_documents(property: str = None):
         seen_files = set()
         unique_documents = []
         for match in results.get('matches', []):
-            file_name = match.get('metadata', {}).get('source')
-            if file_name and file_name not in seen_files:
-                unique_documents.append({
-                    "name": file_name,
-                    "type": match.get('metadata', {}).get('doc_type', 'N/A'),
-                    "status": "Ready"
-                })
-                seen_files.add(file_name)
+            match_metadata = match.get('metadata', {})
+            # Shared chunks list every document they appear in under 'sources'
+            for file_name in match_metadata.get('sources') or [match_metadata.get('source')]:
+                if file_name and file_name not in seen_files:
+                    unique_documents.append({
+                        "name": file_name,
+                        "type": match_metadata.get('doc_type', 'N/A'),
+                        "status": "Ready"
+                    })
+                    seen_files.add(file_name)
         return unique_documents
     except Exception as e:
         print(f"Error listing documents from Pinecone: {e}")
@@ -99,6 +230,12 @@ def delete_document(file_name: str):
     Initializes clients on-the-fly for stability.
     """
     index = _get_pinecone_index()
+    orphaned, shared = chunk_registry.remove_source(file_name)
+    for start in range(0, len(orphaned), UPSERT_BATCH_SIZE):
+        index.delete(ids=orphaned[start:start + UPSERT_BATCH_SIZE])
+    # Chunks still used by other documents stay, attributed to those documents
+    _set_sources(index, shared, reset_source=True)
+    # Vectors indexed before the chunk registry existed are only tagged by 'source'
     index.delete(filter={"source": file_name})
 
 def query_index(query: str, top_k: int = 10, file_names: List[str] = None, properties: List[str] = None):
@@ -114,7 +251,10 @@ def query_index(query: str, top_k: int = 10, file_names: List[str] = None, prope
     
     filter_metadata = {}
     if file_names:
-        filter_metadata["source"] = {"$in": file_names}
+        filter_metadata["$or"] = [
+            {"source": {"$in": file_names}},
+            {"sources": {"$in": file_names}},
+        ]
     if properties:
         filter_metadata["property"] = {"$in": properties}
 
@@ -148,9 +288,10 @@ def get_all_property_documents(properties: List[str]) -> List[str]:
         # Extract unique document names
         doc_names = set()
         for match in results.get('matches', []):
-            source = match.get('metadata', {}).get('source')
-            if source:
-                doc_names.add(source)
+            match_metadata = match.get('metadata', {})
+            for source in match_metadata.get('sources') or [match_metadata.get('source')]:
+                if source:
+                    doc_names.add(source)
         
         return list(doc_names)
     except Exception as e:
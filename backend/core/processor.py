@@ -1,97 +1,563 @@
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 import docx
 from pypdf import PdfReader
 import requests
 from bs4 import BeautifulSoup
 import os
-import pandas as pd
 import io
+import datetime
+import hashlib
+import tempfile
+import time
+import zipfile
+import threading
+import multiprocessing
+import openpyxl
+import xlrd
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterable, Iterator, NamedTuple, Optional, Tuple
+from . import chunking
+from .disk_cache import DiskCache, DiskCacheWriter
 
-CHUNK_SIZE = 1000
-CHUNK_OVERLAP = 100
+# Chunk sizes are in tokens; see core/chunking.py.
+CHUNK_TOKENS = chunking.DEFAULT_CHUNK_TOKENS
+CHUNK_OVERLAP_TOKENS = chunking.DEFAULT_OVERLAP_TOKENS
+# Number of parsed units (pages, row groups) sent from a parsing worker in one message.
+STREAM_BATCH_SIZE = 8
 
-def _get_text_splitter():
+# Parsing (pypdf, pandas) is CPU-bound and holds the GIL, so uploads are parsed
+# in a pool of worker processes. Defaults to one worker per core.
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0")) or (os.cpu_count() or 1)
+
+# Bump whenever parsing or chunking output changes so stale cache entries are ignored.
+PARSER_VERSION = "2"
+# Parsed chunks are cached on disk by file content; 0 disables the cache.
+PARSE_CACHE_DIR = os.getenv("PARSE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "alliance_parse_cache"))
+PARSE_CACHE_MAX_BYTES = int(os.getenv("PARSE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# PDFs with at least this many pages are extracted in parallel, in ranges of
+# PDF_PAGE_RANGE_SIZE pages spread over the parsing pool.
+PDF_PARALLEL_PAGE_THRESHOLD = int(os.getenv("PDF_PARALLEL_PAGE_THRESHOLD", "150"))
+PDF_PAGE_RANGE_SIZE = int(os.getenv("PDF_PAGE_RANGE_SIZE", "40"))
+# Pages slower than this to extract are logged.
+PDF_SLOW_PAGE_SECONDS = float(os.getenv("PDF_SLOW_PAGE_SECONDS", "5"))
+
+_parse_pool = None
+_parse_manager = None
+_parse_manager_lock = threading.Lock()
+_parse_cache = None
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """Returns the shared process pool used for document parsing, creating it on first use."""
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+    return _parse_pool
+
+def reset_parse_pool(pool: ProcessPoolExecutor):
+    """
+    Discards a parsing pool left broken by a worker that died (killed for
+    running out of memory, a crash in a parser), so the next get_parse_pool
+    starts a new one. Does nothing to a pool that already replaced it.
+    """
+    global _parse_pool
+    if _parse_pool is pool:
+        _parse_pool = None
+    pool.shutdown(wait=True, cancel_futures=True)
+
+def new_parse_queue(maxsize: int):
+    """
+    Returns a new queue parsing workers can send units back on. The queues are
+    served by one manager process, started on first use and shared by every
+    run. Blocking (the first call starts the process); run it in a threadpool.
+    """
+    global _parse_manager
+    with _parse_manager_lock:
+        if _parse_manager is not None:
+            try:
+                return _parse_manager.Queue(maxsize=maxsize)
+            except (OSError, EOFError):
+                # The manager process died; start a new one
+                _parse_manager = None
+        _parse_manager = multiprocessing.Manager()
+        return _parse_manager.Queue(maxsize=maxsize)
+
+def shutdown_parse_pool(wait: bool = False):
+    """Shuts down the parsing pool and its queue manager, if they were started."""
+    global _parse_pool, _parse_manager
+    if _parse_pool is not None:
+        _parse_pool.shutdown(wait=wait, cancel_futures=True)
+        _parse_pool = None
+    with _parse_manager_lock:
+        if _parse_manager is not None:
+            _parse_manager.shutdown()
+            _parse_manager = None
+
+def _get_text_splitter() -> chunking.TextSplitter:
     """Returns a configured text splitter."""
-    return RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP,
-        length_function=len
-    )
+    return chunking.TextSplitter(CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS)
 
 def _get_text_from_docx(file_path: str) -> str:
     """Extracts text from a .docx file."""
     doc = docx.Document(file_path)
     return "\n".join([para.text for para in doc.paragraphs])
 
+class PdfPage(NamedTuple):
+    number: int
+    text: str
+    seconds: float  # Time spent extracting the page
+    error: Optional[str] = None  # Set if the page could not be read; text is then empty
+
+def count_pdf_pages(file_path: str) -> int:
+    return len(PdfReader(file_path).pages)
+
+def pdf_page_ranges(page_count: int) -> list[Tuple[int, int]]:
+    """
+    Splits a PDF into (start, end) page ranges for parallel extraction, or
+    returns an empty list if it is too small to be worth splitting.
+    """
+    if page_count < PDF_PARALLEL_PAGE_THRESHOLD:
+        return []
+    return [(start, min(start + PDF_PAGE_RANGE_SIZE, page_count)) for start in range(0, page_count, PDF_PAGE_RANGE_SIZE)]
+
+def _iter_pdf_pages(file_path: str, start: int = 0, end: Optional[int] = None) -> Iterator[PdfPage]:
+    """
+    Yields each page of a .pdf file (optionally only pages start..end-1), one
+    page at a time. A page that fails to extract is yielded empty with its
+    error instead of failing the whole file.
+    """
+    reader = PdfReader(file_path)
+    pages = reader.pages
+    end = len(pages) if end is None else min(end, len(pages))
+    for index in range(start, end):
+        started = time.perf_counter()
+        try:
+            text, error = pages[index].extract_text() or "", None
+        except Exception as e:
+            text, error = "", str(e)
+            print(f"Warning: Could not extract page {index + 1} of {file_path}: {e}")
+        seconds = time.perf_counter() - started
+        if seconds > PDF_SLOW_PAGE_SECONDS:
+            print(f"Warning: Page {index + 1} of {file_path} took {seconds:.1f}s to extract")
+        yield PdfPage(index + 1, text, seconds, error)
+
+def extract_pdf_pages(file_path: str, start: int, end: int) -> list[PdfPage]:
+    """Parsing-pool entry point: extracts one page range of a PDF."""
+    return list(_iter_pdf_pages(file_path, start, end))
+
+def iter_pdf_pages_parallel(file_path: str) -> Iterator[PdfPage]:
+    """
+    Yields the pages of a .pdf file in order. Large files are extracted by
+    page range in the parsing pool; smaller ones are read in this process.
+    Must not be called from inside a parsing-pool worker.
+    """
+    ranges = pdf_page_ranges(count_pdf_pages(file_path))
+    if not ranges:
+        yield from _iter_pdf_pages(file_path)
+        return
+    next_range = 0
+    retried = False
+    while next_range < len(ranges):
+        pool = get_parse_pool()
+        futures = []
+        try:
+            futures = [pool.submit(extract_pdf_pages, file_path, start, end) for start, end in ranges[next_range:]]
+            for future in futures:
+                pages = future.result()
+                next_range += 1
+                yield from pages
+        except BrokenProcessPool:
+            if retried:
+                raise
+            # Start a new pool and extract the remaining ranges once more
+            print(f"Warning: A parsing worker died while extracting {file_path}; retrying on a new pool.")
+            reset_parse_pool(pool)
+            retried = True
+        finally:
+            for future in futures:
+                future.cancel()
+
 def _get_text_from_pdf(file_path: str) -> str:
     """Extracts text from a .pdf file."""
-    reader = PdfReader(file_path)
-    return "\n".join([page.extract_text() for page in reader.pages])
+    return "\n".join(page.text for page in iter_pdf_pages_parallel(file_path))
+
+class PageSplitter:
+    """
+    Incrementally splits a stream of page texts into chunks. Only a small
+    tail of text is buffered between pages, and each chunk is tagged with the
+    pages it starts and ends on (when page numbers are known).
+    """
+
+    def __init__(self):
+        self.text_splitter = _get_text_splitter()
+        self.buffer = ""
+        self.page_starts = []  # (offset into buffer, page_number)
+
+    def _page_at(self, offset: int) -> Optional[int]:
+        page = self.page_starts[0][1] if self.page_starts else None
+        for start, page_number in self.page_starts:
+            if start > offset:
+                break
+            page = page_number
+        return page
+
+    def _emit(self, spans: list) -> list[Tuple[str, dict]]:
+        chunks = []
+        for start, end in spans:
+            page = self._page_at(start)
+            chunk_metadata = {} if page is None else {"page": page, "page_end": self._page_at(end - 1)}
+            chunks.append((self.buffer[start:end], chunk_metadata))
+        return chunks
+
+    def feed(self, text: str, page_number: Optional[int] = None) -> list[Tuple[str, dict]]:
+        """Adds a page of text and returns the chunks that are now complete."""
+        if self.buffer:
+            self.buffer += "\n"
+        self.page_starts.append((len(self.buffer), page_number))
+        self.buffer += text
+        if chunking.count_tokens(self.buffer) < 2 * CHUNK_TOKENS:
+            return []
+
+        spans = list(self.text_splitter.iter_spans(self.buffer))
+        if len(spans) < 2:
+            return []
+        # The last chunk may continue onto the next page, so keep it buffered.
+        chunks = self._emit(spans[:-1])
+        tail_start = spans[-1][0]
+        tail_page = self._page_at(tail_start)
+        self.buffer = self.buffer[tail_start:]
+        kept = [(start - tail_start, page) for start, page in self.page_starts if start > tail_start]
+        self.page_starts = [(0, tail_page)] + kept
+        return chunks
+
+    def finish(self) -> list[Tuple[str, dict]]:
+        """Returns the chunks left in the buffer once the last page has been fed."""
+        chunks = self._emit(list(self.text_splitter.iter_spans(self.buffer))) if self.buffer.strip() else []
+        self.buffer, self.page_starts = "", []
+        return chunks
+
+def _split_pages(pages: Iterable[Tuple[int, str]]) -> Iterator[Tuple[str, dict]]:
+    """Splits a stream of (page_number, text) pairs into page-tagged chunks."""
+    splitter = PageSplitter()
+    for page_number, page_text in pages:
+        yield from splitter.feed(page_text, page_number)
+    yield from splitter.finish()
 
 def _get_text_from_txt(file_path: str) -> str:
     """Reads text from a .txt file."""
     with open(file_path, "r", encoding="utf-8") as f:
         return f.read()
 
+def _format_cell(value) -> str:
+    """Renders a spreadsheet cell value as markdown-safe text."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    elif isinstance(value, (datetime.datetime, datetime.date)):
+        value = value.isoformat()
+    return str(value).replace("|", "\\|").replace("\n", " ").strip()
+
+def _iter_excel_rows(file_path: str) -> Iterator[Tuple[str, int, list]]:
+    """
+    Yields (sheet_name, row_number, values) for every row of every sheet,
+    reading each sheet once. Each sheet starts with a (sheet_name, 0, [])
+    entry, so sheets without any rows are seen too. .xlsx is opened in
+    openpyxl's read-only streaming mode; legacy .xls goes through xlrd with
+    on-demand sheets.
+    """
+    if file_path.lower().endswith(".xls") or not zipfile.is_zipfile(file_path):
+        book = xlrd.open_workbook(file_path, on_demand=True)
+        try:
+            for sheet_index in range(book.nsheets):
+                sheet = book.get_sheet(sheet_index)
+                yield sheet.name, 0, []
+                for row_index in range(sheet.nrows):
+                    yield sheet.name, row_index + 1, sheet.row_values(row_index)
+                book.unload_sheet(sheet_index)
+        finally:
+            book.release_resources()
+        return
+
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            yield sheet.title, 0, []
+            for row_number, values in enumerate(sheet.iter_rows(values_only=True), start=1):
+                yield sheet.title, row_number, list(values)
+    finally:
+        workbook.close()
+
+def _iter_excel_chunks(file_path: str, max_tokens: int = CHUNK_TOKENS) -> Iterator[Tuple[str, dict]]:
+    """
+    Streams an .xls/.xlsx file into markdown-table chunks of consecutive rows
+    (up to max_tokens of row content each).
+    The sheet name and header row are repeated in every chunk so each one is a
+    self-describing table on its own. A sheet with no data rows still yields
+    one chunk, with just its header (if any), so it stays searchable.
+    """
+    sheet_name = None
+    header = None
+    header_row = 0
+    rows = []
+    rows_len = 0
+    first_row = last_row = 0
+    sheet_chunks = 0
+
+    def table_head() -> list:
+        return [
+            f"## Sheet: {sheet_name}",
+            "",
+            "| " + " | ".join(header) + " |",
+            "|" + "|".join(["---"] * len(header)) + "|",
+        ]
+
+    def flush() -> Iterator[Tuple[str, dict]]:
+        nonlocal sheet_chunks
+        if not rows:
+            return
+        sheet_chunks += 1
+        lines = table_head()
+        lines.extend("| " + " | ".join(row) + " |" for row in rows)
+        yield "\n".join(lines), {"sheet": sheet_name, "row_start": first_row, "row_end": last_row}
+
+    def finish_sheet() -> Iterator[Tuple[str, dict]]:
+        yield from flush()
+        if sheet_name is None or sheet_chunks:
+            return
+        if header is None:
+            yield f"## Sheet: {sheet_name}\n\n(empty sheet)", {"sheet": sheet_name, "row_start": 0, "row_end": 0}
+            return
+        yield "\n".join(table_head()), {"sheet": sheet_name, "row_start": header_row, "row_end": header_row}
+
+    for current_sheet, row_number, values in _iter_excel_rows(file_path):
+        if current_sheet != sheet_name:
+            yield from finish_sheet()
+            sheet_name, header, rows, rows_len, sheet_chunks = current_sheet, None, [], 0, 0
+
+        cells = [_format_cell(v) for v in values]
+        while cells and not cells[-1]:
+            cells.pop()
+        if not cells:
+            continue
+
+        if header is None:
+            header = [cell or f"Column {i + 1}" for i, cell in enumerate(cells)]
+            header_row = row_number
+            continue
+
+        # Pad or widen so every row lines up with the header. Rows already
+        # buffered are emitted under the header they were read with first.
+        if len(cells) > len(header):
+            yield from flush()
+            rows, rows_len = [], 0
+            header = header + [f"Column {i + 1}" for i in range(len(header), len(cells))]
+        cells.extend([""] * (len(header) - len(cells)))
+
+        row_len = chunking.count_tokens(" | ".join(cells)) + 2
+        if rows and rows_len + row_len > max_tokens:
+            yield from flush()
+            rows, rows_len = [], 0
+        if not rows:
+            first_row = row_number
+        rows.append(cells)
+        rows_len += row_len
+        last_row = row_number
+
+    yield from finish_sheet()
+
 def _get_text_from_excel(file_path: str) -> str:
     """Extracts text from .xls or .xlsx files."""
-    try:
-        # Read all sheets from the Excel file
-        excel_file = pd.ExcelFile(file_path)
-        all_text = []
-        
-        for sheet_name in excel_file.sheet_names:
-            df = pd.read_excel(file_path, sheet_name=sheet_name)
-            
-            # Add sheet name as header
-            all_text.append(f"## Sheet: {sheet_name}\n")
-            
-            # Convert DataFrame to markdown table format for better structure
-            if not df.empty:
-                # Clean column names
-                df.columns = df.columns.astype(str)
-                
-                # Convert to string, handling NaN values
-                df = df.fillna('')
-                
-                # Create a markdown table
-                table_text = df.to_markdown(index=False)
-                all_text.append(table_text)
-                all_text.append("\n")
-            else:
-                all_text.append("(Empty sheet)\n")
-        
-        return "\n".join(all_text)
-    except Exception as e:
-        print(f"Error processing Excel file: {e}")
-        # Fallback: try to read as CSV-like text
-        try:
-            df = pd.read_excel(file_path)
-            return df.to_string()
-        except:
-            return ""
+    return "\n\n".join(chunk for chunk, _ in _iter_excel_chunks(file_path))
 
-def process_file(file_path: str, original_filename: str) -> list[str]:
+class ParsedUnit(NamedTuple):
     """
-    Determines the file type from the original filename and processes it.
+    A piece of parsed document handed from parsing to splitting: a page of a
+    PDF, a whole .docx/.txt, or a spreadsheet row group that is already a
+    finished chunk (presplit).
+    """
+    text: str
+    metadata: dict
+    presplit: bool = False
+
+def iter_file_units(file_path: str, original_filename: str, page_range: Optional[Tuple[int, int]] = None, parallel: bool = False) -> Iterator[ParsedUnit]:
+    """
+    Determines the file type from the original filename and yields its parsed
+    units. PDFs are read page by page (only page_range, if given, or in
+    parallel across the parsing pool if parallel is set); spreadsheets are
+    streamed row by row into self-contained table chunks.
+
+    PDF units carry the page's extraction time and, if it failed, its error
+    alongside the page number.
     """
-    text_splitter = _get_text_splitter()
-    text = ""
     file_ext = os.path.splitext(original_filename)[1].lower()
 
-    if file_ext == ".docx":
-        text = _get_text_from_docx(file_path)
-    elif file_ext == ".pdf":
-        text = _get_text_from_pdf(file_path)
-    elif file_ext == ".txt":
-        text = _get_text_from_txt(file_path)
+    if file_ext == ".pdf":
+        if page_range:
+            pages = _iter_pdf_pages(file_path, *page_range)
+        elif parallel:
+            pages = iter_pdf_pages_parallel(file_path)
+        else:
+            pages = _iter_pdf_pages(file_path)
+        for page in pages:
+            page_metadata = {"page": page.number, "extract_seconds": page.seconds}
+            if page.error:
+                page_metadata["extract_error"] = page.error
+            yield ParsedUnit(page.text, page_metadata)
     elif file_ext in [".xls", ".xlsx"]:
-        text = _get_text_from_excel(file_path)
+        # Spreadsheets are already chunked into row groups with their header.
+        for chunk, chunk_metadata in _iter_excel_chunks(file_path):
+            yield ParsedUnit(chunk, chunk_metadata, presplit=True)
+    elif file_ext == ".docx":
+        yield ParsedUnit(_get_text_from_docx(file_path), {})
+    elif file_ext == ".txt":
+        yield ParsedUnit(_get_text_from_txt(file_path), {})
     else:
         print(f"Warning: Unsupported file type '{file_ext}' for file {original_filename}")
-        return []
 
-    return text_splitter.split_text(text)
+def split_units(units: Iterable[ParsedUnit], splitter: Optional[PageSplitter] = None) -> Iterator[Tuple[str, dict]]:
+    """Turns parsed units into (chunk_text, chunk_metadata) pairs."""
+    splitter = splitter or PageSplitter()
+    for unit in units:
+        if unit.presplit:
+            yield unit.text, unit.metadata
+        else:
+            yield from splitter.feed(unit.text, unit.metadata.get("page"))
+    yield from splitter.finish()
+
+def iter_file_chunks(file_path: str, original_filename: str) -> Iterator[Tuple[str, dict]]:
+    """
+    Determines the file type from the original filename and yields
+    (chunk_text, chunk_metadata) pairs.
+    """
+    yield from split_units(iter_file_units(file_path, original_filename, parallel=True))
+
+def process_file(file_path: str, original_filename: str, use_cache: bool = True) -> list[str]:
+    """
+    Determines the file type from the original filename and processes it.
+    Files whose exact bytes were parsed before are served from the parse cache.
+    Files with a page that could not be extracted are not cached, so the next
+    run tries those pages again.
+    """
+    if not use_cache or _get_parse_cache() is None:
+        return [chunk for chunk, _ in iter_file_chunks(file_path, original_filename)]
+    key = parse_cache_key(file_sha256(file_path), original_filename)
+    chunks = get_cached_chunks(key)
+    if chunks is None:
+        failed_pages = []
+
+        def track_failures(units: Iterable[ParsedUnit]) -> Iterator[ParsedUnit]:
+            for unit in units:
+                if "extract_error" in unit.metadata:
+                    failed_pages.append(unit.metadata["page"])
+                yield unit
+
+        chunks = list(split_units(track_failures(iter_file_units(file_path, original_filename, parallel=True))))
+        if not failed_pages:
+            cache_parsed_chunks(key, chunks)
+    return [chunk for chunk, _ in chunks]
+
+# --- Parse Cache ---
+
+def _get_parse_cache() -> Optional[DiskCache]:
+    global _parse_cache
+    if _parse_cache is None and PARSE_CACHE_MAX_BYTES > 0:
+        _parse_cache = DiskCache(PARSE_CACHE_DIR, PARSE_CACHE_MAX_BYTES)
+    return _parse_cache
+
+def file_sha256(file_path: str, block_size: int = 1024 * 1024) -> str:
+    """Hashes a file's bytes without reading it into memory at once."""
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def parse_cache_key(file_hash: str, original_filename: str) -> str:
+    """
+    Cache key for a file's chunks. The extension picks the parser, and the
+    parser version, chunk sizes and the tokenizer that measures them determine
+    its output, so all are included.
+    """
+    file_ext = os.path.splitext(original_filename)[1].lower()
+    key = f"{PARSER_VERSION}|{chunking.TOKENIZER}|{CHUNK_TOKENS}|{CHUNK_OVERLAP_TOKENS}|{file_ext}|{file_hash}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def get_cached_chunks(key: str) -> Optional[list[Tuple[str, dict]]]:
+    """Returns the cached (chunk_text, chunk_metadata) pairs for a key, or None."""
+    cache = _get_parse_cache()
+    if cache is None:
+        return None
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    return [(text, chunk_metadata) for text, chunk_metadata in entry]
+
+def cache_parsed_chunks(key: str, chunks: list[Tuple[str, dict]]):
+    """Stores a file's (chunk_text, chunk_metadata) pairs in the parse cache."""
+    cache = _get_parse_cache()
+    if cache is None:
+        return
+    try:
+        cache.set(key, [[text, chunk_metadata] for text, chunk_metadata in chunks])
+    except OSError as e:
+        print(f"Warning: Could not write parse cache entry {key}: {e}")
+
+def open_parse_cache_entry(key: str) -> Optional[DiskCacheWriter]:
+    """
+    Starts writing a file's (chunk_text, chunk_metadata) pairs to the parse
+    cache as they are produced. Returns None if there is no cache.
+    """
+    cache = _get_parse_cache()
+    if cache is None:
+        return None
+    try:
+        return cache.writer(key)
+    except OSError as e:
+        print(f"Warning: Could not write parse cache entry {key}: {e}")
+        return None
+
+def stream_file_units(file_path: str, original_filename: str, out_queue, file_index: int, batch_size: int = STREAM_BATCH_SIZE, page_range: Optional[Tuple[int, int]] = None, skip_units: int = 0):
+    """
+    Parsing-pool entry point. Puts batches of parsed units on out_queue as
+    they are produced so splitting and embedding can start while later pages
+    are still being read. page_range limits a PDF to those pages, so one
+    large file can be spread over several workers. The first skip_units units
+    are not sent again (a retry after the worker died partway through).
+
+    Messages are ("units", file_index, [ParsedUnit, ...]), then exactly one of
+    ("done", file_index, unit_count) or ("error", file_index, reason).
+    """
+    units = []
+    count = skip_units
+    try:
+        for position, unit in enumerate(iter_file_units(file_path, original_filename, page_range=page_range)):
+            if position < skip_units:
+                continue
+            units.append(unit)
+            if len(units) >= batch_size:
+                out_queue.put(("units", file_index, units))
+                count += len(units)
+                units = []
+        if units:
+            out_queue.put(("units", file_index, units))
+            count += len(units)
+        out_queue.put(("done", file_index, count))
+    except Exception as e:
+        out_queue.put(("error", file_index, str(e)))
+
+def extract_text_from_html(content) -> str:
+    """Strips scripts and styles from an HTML document and returns its visible text."""
+    soup = BeautifulSoup(content, "html.parser")
+    
+    for script_or_style in soup(["script", "style"]):
+        script_or_style.decompose()
+        
+    return soup.get_text(separator="\n", strip=True)
+
+def split_html(content) -> list[str]:
+    """Extracts the visible text of an HTML document and splits it into chunks."""
+    return _get_text_splitter().split_text(extract_text_from_html(content))
 
 def process_url(url: str) -> list[str]:
     """
@@ -100,17 +566,8 @@ def process_url(url: str) -> list[str]:
     try:
         response = requests.get(url, timeout=10)
         response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, "html.parser")
-        
-        for script_or_style in soup(["script", "style"]):
-            script_or_style.decompose()
-            
-        text = soup.get_text(separator="\n", strip=True)
-        
-        text_splitter = _get_text_splitter()
-        return text_splitter.split_text(text)
+        return split_html(response.content)
         
     except requests.RequestException as e:
         print(f"Error fetching URL {url}: {e}")
-        return [] 
\ No newline at end of file
+        return []
@@ -0,0 +1,325 @@
+"""
+Hierarchical document and property summaries.
+
+Each document is summarised once at ingestion: its chunks are grouped into
+sections of about SECTION_TOKENS tokens, every section is summarised, and the
+section summaries are combined into the document summary. A property summary
+is then built from the latest summaries of all of its documents. Both are
+versioned: a re-ingested document with changed content gets a new summary
+version, and the property summary is rebuilt whenever any of its documents'
+versions change. Rebuilds are debounced per property (see
+schedule_property_refresh), so a folder of documents uploaded one at a time
+leads to one rebuild rather than one per document.
+
+Broad, overview-style questions are answered from these summaries first (see
+llm_handler.run_agentic_rag_pipeline), with a single retrieval for supporting
+detail instead of a fan-out of sub-question searches.
+"""
+import os
+import re
+import asyncio
+import hashlib
+import logging
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func
+
+from .database import SessionLocal, DocumentSummary, PropertySummary
+from . import chunking
+
+logger = logging.getLogger(__name__)
+
+SECTION_TOKENS = int(os.getenv("SUMMARY_SECTION_TOKENS", "6000"))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+# Limits on how many summaries an answer is built from; beyond them the
+# regular sub-question pipeline is used.
+MAX_PROPERTY_SUMMARIES = 5
+MAX_DOCUMENT_SUMMARIES = 12
+# How long a property's summary waits for more document changes before it is rebuilt
+PROPERTY_SUMMARY_DEBOUNCE_SECONDS = float(os.getenv("PROPERTY_SUMMARY_DEBOUNCE_SECONDS", "60"))
+
+# Properties with a rebuild scheduled or running, and those changed since it started
+_refresh_tasks: Dict[str, asyncio.Task] = {}
+_refresh_pending: Set[str] = set()
+
+_OVERVIEW_QUERY_RE = re.compile(
+    r"\b(overview|summar\w*|tell me about|describe|description|high[- ]level|key (points|facts|terms|details)|comprehensive|at a glance|background|profile)\b",
+    re.IGNORECASE,
+)
+
+SECTION_SUMMARY_PROMPT = """
+Summarise the following section of the document "{source}" about the property "{property}".
+Keep every specific figure, date, name, and term (rents, expenses, lease dates, parties, loan terms).
+Write at most 200 words of dense prose or bullet points.
+
+Section:
+{text}
+"""
+
+DOCUMENT_SUMMARY_PROMPT = """
+Below are summaries of consecutive sections of the document "{source}" about the property "{property}".
+Combine them into one summary of the whole document: start with one sentence saying what the document is,
+then list its key facts and figures. Keep specific numbers, dates, and names. At most 300 words.
+
+Section summaries:
+{text}
+"""
+
+PROPERTY_SUMMARY_PROMPT = """
+Below are summaries of the documents on file for the property "{property}".
+Write an overview of the property for a real estate investment professional: what it is, tenancy and leases,
+income and expenses, financing, and any notable risks or open items. Keep specific numbers, dates, and names,
+and mention which document each key fact comes from. At most 500 words.
+
+Document summaries:
+{text}
+"""
+
+
+class SummaryEvidence(NamedTuple):
+    evidence: List[str]
+    sources: List[str]
+
+
+def is_overview_query(query: str) -> bool:
+    return bool(_OVERVIEW_QUERY_RE.search(query))
+
+
+def _get_llm() -> ChatGoogleGenerativeAI:
+    return ChatGoogleGenerativeAI(
+        model="gemini-1.5-pro",
+        google_api_key=os.environ["GEMINI_API_KEY"],
+        max_output_tokens=1024,
+        temperature=0.0
+    )
+
+
+def _group_sections(texts: List[str], max_tokens: int = SECTION_TOKENS) -> List[str]:
+    """Packs consecutive texts into sections of at most max_tokens tokens."""
+    sections, current, tokens = [], [], 0
+    for text in texts:
+        text_tokens = chunking.count_tokens(text)
+        if current and tokens + text_tokens > max_tokens:
+            sections.append("\n\n".join(current))
+            current, tokens = [], 0
+        current.append(text)
+        tokens += text_tokens
+    if current:
+        sections.append("\n\n".join(current))
+    return sections
+
+
+async def _summarise_hierarchically(texts: List[str], section_prompt: str, combine_prompt: str, variables: dict) -> str:
+    """
+    Summarises each section of texts (with bounded concurrency), then
+    combines the section summaries, repeating until a single summary remains.
+    texts must not be empty.
+    """
+    llm = _get_llm()
+    semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+
+    async def summarise(prompt: str, section: str) -> str:
+        chain = ChatPromptTemplate.from_template(prompt) | llm | StrOutputParser()
+        async with semaphore:
+            return (await chain.ainvoke({**variables, "text": section})).strip()
+
+    summaries = await asyncio.gather(*(summarise(section_prompt, section) for section in _group_sections(texts)))
+    while len(summaries) > 1:
+        summaries = await asyncio.gather(*(summarise(combine_prompt, section) for section in _group_sections(summaries)))
+    return summaries[0]
+
+
+def _content_hash(chunk_list: List[Tuple[str, dict]]) -> str:
+    hasher = hashlib.sha256()
+    for text, _ in chunk_list:
+        hasher.update(text.encode("utf-8"))
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+def _latest_document_summary(db, property: str, source: str) -> Optional[DocumentSummary]:
+    return (
+        db.query(DocumentSummary)
+        .filter(DocumentSummary.property == property, DocumentSummary.source == source)
+        .order_by(DocumentSummary.version.desc())
+        .first()
+    )
+
+
+async def summarize_document(property: str, source: str, chunk_list: List[Tuple[str, dict]]) -> Optional[int]:
+    """
+    Summarises a document and stores it as a new version. Returns the new
+    version, or None if the document is unchanged since its last summary.
+    """
+    content_hash = _content_hash(chunk_list)
+
+    def latest_version() -> Tuple[int, Optional[str]]:
+        db = SessionLocal()
+        try:
+            latest = _latest_document_summary(db, property, source)
+            return (latest.version, latest.content_hash) if latest else (0, None)
+        finally:
+            db.close()
+
+    version, previous_hash = await run_in_threadpool(latest_version)
+    if previous_hash == content_hash:
+        logger.info(f"SUMMARIES: {source} is unchanged since summary v{version}; skipping.")
+        return None
+
+    summary = await _summarise_hierarchically(
+        [text for text, _ in chunk_list], SECTION_SUMMARY_PROMPT, DOCUMENT_SUMMARY_PROMPT,
+        {"source": source, "property": property},
+    )
+
+    def store() -> int:
+        db = SessionLocal()
+        try:
+            latest = _latest_document_summary(db, property, source)
+            new_version = (latest.version if latest else 0) + 1
+            db.add(DocumentSummary(source=source, property=property, version=new_version, content_hash=content_hash, summary=summary))
+            db.commit()
+            return new_version
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    new_version = await run_in_threadpool(store)
+    logger.info(f"SUMMARIES: Stored summary v{new_version} of {source}.")
+    return new_version
+
+
+def _latest_document_summaries(db, properties: Optional[List[str]]) -> List[DocumentSummary]:
+    latest = (
+        db.query(DocumentSummary.property, DocumentSummary.source, func.max(DocumentSummary.version).label("version"))
+        .group_by(DocumentSummary.property, DocumentSummary.source)
+        .subquery()
+    )
+    query = db.query(DocumentSummary).join(
+        latest,
+        (DocumentSummary.property == latest.c.property)
+        & (DocumentSummary.source == latest.c.source)
+        & (DocumentSummary.version == latest.c.version),
+    )
+    if properties:
+        query = query.filter(DocumentSummary.property.in_(properties))
+    return query.order_by(DocumentSummary.created_at.desc()).all()
+
+
+def _latest_property_summaries(db, properties: Optional[List[str]]) -> Dict[str, PropertySummary]:
+    query = db.query(PropertySummary)
+    if properties:
+        query = query.filter(PropertySummary.property.in_(properties))
+    latest: Dict[str, PropertySummary] = {}
+    for summary in query.order_by(PropertySummary.version.desc()).all():
+        latest.setdefault(summary.property, summary)
+    return latest
+
+
+async def refresh_property_summary(property: str) -> Optional[int]:
+    """
+    Rebuilds a property's summary if any of its documents' summaries changed
+    since the last build. Returns the new version, or None if it was current.
+    """
+    def load():
+        db = SessionLocal()
+        try:
+            documents = _latest_document_summaries(db, [property])
+            if not documents:
+                # Every document is gone, so is the basis for its summary
+                db.query(PropertySummary).filter(PropertySummary.property == property).delete(synchronize_session=False)
+                db.commit()
+                return [], None
+            current = _latest_property_summaries(db, [property]).get(property)
+            return [(d.source, d.version, d.summary) for d in documents], current.document_versions if current else None
+        finally:
+            db.close()
+
+    documents, current_versions = await run_in_threadpool(load)
+    document_versions = {source: version for source, version, _ in documents}
+    if not documents or current_versions == document_versions:
+        return None
+
+    texts = [f"Document: {source}\n{summary}" for source, _, summary in sorted(documents)]
+    summary = await _summarise_hierarchically(texts, PROPERTY_SUMMARY_PROMPT, PROPERTY_SUMMARY_PROMPT, {"property": property})
+
+    def store() -> int:
+        db = SessionLocal()
+        try:
+            latest = _latest_property_summaries(db, [property]).get(property)
+            new_version = (latest.version if latest else 0) + 1
+            db.add(PropertySummary(property=property, version=new_version, document_versions=document_versions, summary=summary))
+            db.commit()
+            return new_version
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    new_version = await run_in_threadpool(store)
+    logger.info(f"SUMMARIES: Stored summary v{new_version} of property '{property}' from {len(documents)} documents.")
+    return new_version
+
+
+def schedule_property_refresh(property: str):
+    """
+    Marks a property's summary as stale. It is rebuilt once no document of
+    the property has changed for PROPERTY_SUMMARY_DEBOUNCE_SECONDS; at most
+    one rebuild per property runs at a time, and changes made while it runs
+    lead to one more.
+    """
+    _refresh_pending.add(property)
+    if property not in _refresh_tasks:
+        _refresh_tasks[property] = asyncio.create_task(_run_property_refresh(property))
+
+
+async def _run_property_refresh(property: str):
+    try:
+        while property in _refresh_pending:
+            # Wait until changes stop arriving
+            while property in _refresh_pending:
+                _refresh_pending.discard(property)
+                await asyncio.sleep(PROPERTY_SUMMARY_DEBOUNCE_SECONDS)
+            try:
+                await refresh_property_summary(property)
+            except Exception as e:
+                logger.error(f"SUMMARIES: Could not refresh the summary of '{property}'. Reason: {e}")
+    finally:
+        _refresh_tasks.pop(property, None)
+
+
+def delete_document_summaries(source: str) -> List[str]:
+    """Removes every summary version of a document. Returns the properties whose summaries are now stale."""
+    db = SessionLocal()
+    try:
+        properties = {row.property for row in db.query(DocumentSummary.property).filter(DocumentSummary.source == source).all()}
+        db.query(DocumentSummary).filter(DocumentSummary.source == source).delete(synchronize_session=False)
+        db.commit()
+        return sorted(properties)
+    finally:
+        db.close()
+
+
+def get_summary_evidence(properties: Optional[List[str]]) -> Optional[SummaryEvidence]:
+    """
+    Returns the latest property and document summaries for the properties
+    (or all of them) as evidence, or None if there are none or too many to
+    be useful.
+    """
+    db = SessionLocal()
+    try:
+        property_summaries = _latest_property_summaries(db, properties)
+        if not property_summaries or len(property_summaries) > MAX_PROPERTY_SUMMARIES:
+            return None
+        documents = _latest_document_summaries(db, list(property_summaries))[:MAX_DOCUMENT_SUMMARIES]
+    finally:
+        db.close()
+
+    evidence = [f"Property Summary: {name}\n{summary.summary}" for name, summary in sorted(property_summaries.items())]
+    evidence.extend(f"Document Summary: {d.source} (property: {d.property})\n{d.summary} [Source: {d.source}]" for d in documents)
+    return SummaryEvidence(evidence, sorted({d.source for d in documents}))
@@ -0,0 +1,381 @@
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import tempfile
+import logging
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# Uploads are copied to disk in fixed-size pieces so memory stays flat no
+# matter how large the file is.
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(500 * 1024 * 1024)))
+
+# --- Resumable Upload Settings ---
+UPLOAD_SESSION_DIR = os.getenv("UPLOAD_SESSION_DIR", os.path.join(tempfile.gettempdir(), "alliance_upload_sessions"))
+UPLOAD_PART_SIZE = int(os.getenv("UPLOAD_PART_SIZE", str(8 * 1024 * 1024)))  # Suggested to clients
+UPLOAD_SESSION_TTL_SECONDS = int(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24")) * 3600
+# Completed uploads are remembered this long, so a retried /complete gets the same answer
+UPLOAD_COMPLETED_TTL_SECONDS = int(os.getenv("UPLOAD_COMPLETED_TTL_SECONDS", "3600"))
+UPLOAD_SWEEP_INTERVAL_SECONDS = int(os.getenv("UPLOAD_SWEEP_INTERVAL_SECONDS", "900"))
+# Part writes in flight before new ones are turned away with a 429, and the
+# number of parallel uploads clients are told to use (halved under load).
+MAX_ACTIVE_PART_WRITES = int(os.getenv("MAX_ACTIVE_PART_WRITES", "32"))
+UPLOAD_CLIENT_CONCURRENCY = int(os.getenv("UPLOAD_CLIENT_CONCURRENCY", "8"))
+
+_CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/(\d+)$")
+_UPLOAD_ID_RE = re.compile(r"[0-9a-f]{32}$")
+_active_part_writes = 0
+
+
+class _SessionGuard:
+    """
+    Lets range writes to one upload run concurrently, but not alongside its
+    finalize. The lock also serialises updates to the session file.
+    """
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.writers = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+
+_session_guards: Dict[str, _SessionGuard] = {}
+
+
+class StoredUpload(NamedTuple):
+    path: str
+    filename: str
+    sha256: str
+    size: int
+
+
+async def save_upload_to_disk(
+    upload: UploadFile,
+    max_bytes: Optional[int] = None,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> StoredUpload:
+    """
+    Streams an UploadFile to a temporary file, hashing it as it goes.
+    Raises a 413 as soon as the running size passes max_bytes; the partial
+    file is removed in that case.
+    """
+    limit = MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+    hasher = hashlib.sha256()
+    size = 0
+
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=f"_{os.path.basename(upload.filename or 'upload')}")
+    try:
+        with temp_file:
+            while True:
+                piece = await upload.read(chunk_size)
+                if not piece:
+                    break
+                size += len(piece)
+                if size > limit:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File '{upload.filename}' exceeds the {limit // (1024 * 1024)} MB upload limit."
+                    )
+                hasher.update(piece)
+                temp_file.write(piece)
+    except BaseException:
+        os.remove(temp_file.name)
+        raise
+    finally:
+        await upload.close()
+
+    return StoredUpload(path=temp_file.name, filename=upload.filename, sha256=hasher.hexdigest(), size=size)
+
+
+# --- Resumable Uploads ---
+#
+# A client creates a session with the file's name and size, PUTs byte ranges
+# (in any order, retrying or resuming as needed) with a Content-Range header,
+# and finalises the session once every byte has arrived. Each range is written
+# straight into a single pre-sized file at its offset, so the finished file
+# needs no assembly step. Session state lives in a JSON file next to the data
+# so an interrupted upload can resume after a server restart.
+
+def _session_paths(upload_id: str) -> Tuple[str, str]:
+    if not _UPLOAD_ID_RE.match(upload_id):
+        raise HTTPException(status_code=404, detail="Upload session not found.")
+    base = os.path.join(UPLOAD_SESSION_DIR, upload_id)
+    return f"{base}.json", f"{base}.part"
+
+
+def _completed_path(upload_id: str) -> str:
+    return os.path.join(UPLOAD_SESSION_DIR, f"{upload_id}.done")
+
+
+def _save_session(session: dict):
+    state_path, _ = _session_paths(session["upload_id"])
+    temp_path = f"{state_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(session, f)
+    os.replace(temp_path, state_path)
+
+
+def _merge_ranges(ranges: List[List[int]]) -> List[List[int]]:
+    merged: List[List[int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def missing_ranges(session: dict) -> List[List[int]]:
+    """Returns the [start, end) byte ranges the server has not received yet."""
+    missing = []
+    position = 0
+    for start, end in session["received"]:
+        if start > position:
+            missing.append([position, start])
+        position = max(position, end)
+    if position < session["size"]:
+        missing.append([position, session["size"]])
+    return missing
+
+
+def session_status(session: dict) -> dict:
+    received = sum(end - start for start, end in session["received"])
+    return {
+        "upload_id": session["upload_id"],
+        "filename": session["filename"],
+        "size": session["size"],
+        "received_bytes": received,
+        "missing_ranges": missing_ranges(session),
+        "part_size": UPLOAD_PART_SIZE,
+        "max_concurrency": recommended_concurrency(),
+    }
+
+
+def recommended_concurrency() -> int:
+    """Rate hint for upload clients: how many files to upload in parallel right now."""
+    if _active_part_writes >= MAX_ACTIVE_PART_WRITES // 2:
+        return max(1, UPLOAD_CLIENT_CONCURRENCY // 2)
+    return UPLOAD_CLIENT_CONCURRENCY
+
+
+def _expire_sessions():
+    """
+    Removes sessions (and their partial data) that have not been touched
+    within the TTL, and completed-upload records past theirs.
+    """
+    now = time.time()
+    os.makedirs(UPLOAD_SESSION_DIR, exist_ok=True)
+    for name in os.listdir(UPLOAD_SESSION_DIR):
+        path = os.path.join(UPLOAD_SESSION_DIR, name)
+        ttl = UPLOAD_COMPLETED_TTL_SECONDS if name.endswith(".done") else UPLOAD_SESSION_TTL_SECONDS
+        try:
+            if os.path.getmtime(path) < now - ttl:
+                os.remove(path)
+                if name.endswith(".json"):
+                    _session_guards.pop(name[:-len(".json")], None)
+        except FileNotFoundError:
+            pass
+
+
+async def sweep_sessions_periodically():
+    """Expires abandoned sessions every UPLOAD_SWEEP_INTERVAL_SECONDS, whether or not new uploads arrive."""
+    while True:
+        try:
+            await run_in_threadpool(_expire_sessions)
+        except Exception as e:
+            logger.error(f"UPLOAD: Could not sweep expired sessions: {e}")
+        await asyncio.sleep(UPLOAD_SWEEP_INTERVAL_SECONDS)
+
+
+def create_upload_session(filename: str, size: int, metadata: dict, sha256: Optional[str] = None) -> dict:
+    """
+    Starts a resumable upload. The data file is sized up front (sparsely,
+    on filesystems that support it) so ranges can be written at any offset.
+    """
+    if size <= 0:
+        raise HTTPException(status_code=400, detail="Upload size must be greater than zero.")
+    if size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File '{filename}' exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit.")
+    os.makedirs(UPLOAD_SESSION_DIR, exist_ok=True)
+
+    session = {
+        "upload_id": uuid.uuid4().hex,
+        "filename": os.path.basename(filename),
+        "size": size,
+        "sha256": sha256.lower() if sha256 else None,
+        "metadata": metadata,
+        "received": [],
+        "created_at": time.time(),
+    }
+    _, data_path = _session_paths(session["upload_id"])
+    with open(data_path, "wb") as f:
+        f.truncate(size)
+    _save_session(session)
+    logger.info(f"UPLOAD: Started session {session['upload_id']} for '{filename}' ({size} bytes).")
+    return session
+
+
+def get_upload_session(upload_id: str) -> dict:
+    state_path, _ = _session_paths(upload_id)
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload session not found.")
+
+
+def parse_content_range(header: Optional[str], size: int) -> Tuple[int, int]:
+    """Parses 'bytes start-end/total' (end inclusive) into a [start, end) range."""
+    match = _CONTENT_RANGE_RE.match((header or "").strip())
+    if not match:
+        raise HTTPException(status_code=400, detail="A 'Content-Range: bytes start-end/total' header is required.")
+    start, last, total = (int(group) for group in match.groups())
+    if total != size or start > last or last >= size:
+        raise HTTPException(status_code=416, detail=f"Range {start}-{last}/{total} is not valid for a {size}-byte upload.")
+    return start, last + 1
+
+
+def _open_at(data_path: str, start: int):
+    f = open(data_path, "r+b")
+    f.seek(start)
+    return f
+
+
+def _record_range(upload_id: str, start: int, end: int) -> dict:
+    session = get_upload_session(upload_id)
+    session["received"] = _merge_ranges(session["received"] + [[start, end]])
+    _save_session(session)
+    return session
+
+
+async def write_upload_range(upload_id: str, content_range: Optional[str], body: AsyncIterator[bytes]) -> dict:
+    """
+    Streams one byte range of the request body into the session's data file.
+    Whatever arrived is recorded even if the client disconnects midway, so a
+    retry only needs to send the rest. File access runs in the threadpool.
+    """
+    global _active_part_writes
+    session = await run_in_threadpool(get_upload_session, upload_id)
+    start, end = parse_content_range(content_range, session["size"])
+    _, data_path = _session_paths(upload_id)
+    if _active_part_writes >= MAX_ACTIVE_PART_WRITES:
+        raise HTTPException(status_code=429, detail="Too many uploads in progress.", headers={"Retry-After": "2"})
+
+    guard = _session_guards.setdefault(upload_id, _SessionGuard())
+    written = 0
+    _active_part_writes += 1
+    try:
+        async with guard.lock:
+            # The session may have been finalized or aborted while this request waited
+            session = await run_in_threadpool(get_upload_session, upload_id)
+            guard.writers += 1
+            guard.idle.clear()
+        try:
+            try:
+                f = await run_in_threadpool(_open_at, data_path, start)
+            except FileNotFoundError:
+                # Aborted or expired since the session was read
+                raise HTTPException(status_code=404, detail="Upload session not found.")
+            try:
+                async for piece in body:
+                    if written + len(piece) > end - start:
+                        raise HTTPException(status_code=400, detail="Request body is longer than its Content-Range.")
+                    await run_in_threadpool(f.write, piece)
+                    written += len(piece)
+            finally:
+                await run_in_threadpool(f.close)
+        finally:
+            async with guard.lock:
+                try:
+                    if written:
+                        session = await run_in_threadpool(_record_range, upload_id, start, start + written)
+                finally:
+                    guard.writers -= 1
+                    if not guard.writers:
+                        guard.idle.set()
+    finally:
+        _active_part_writes -= 1
+
+    if written != end - start:
+        raise HTTPException(status_code=400, detail=f"Received {written} of {end - start} bytes for this range.")
+    return session
+
+
+async def finalize_upload_session(upload_id: str) -> Tuple[StoredUpload, Optional[dict]]:
+    """
+    Verifies that every byte has arrived (and matches the declared SHA-256,
+    if one was given) and returns the completed file and the session's
+    metadata, ending the session. The file is handed over as-is; the caller
+    owns it from here on. Waits for range writes still in flight for the
+    upload, and holds off new ones.
+
+    Finalizing an upload that was already completed (a client retrying after
+    a lost response) returns the same file details with metadata None, since
+    the file was already handed over.
+    """
+    guard = _session_guards.setdefault(upload_id, _SessionGuard())
+    while True:
+        await guard.idle.wait()
+        await guard.lock.acquire()
+        if not guard.writers:
+            break
+        guard.lock.release()
+    try:
+        return await run_in_threadpool(_finalize_upload_session, upload_id)
+    except HTTPException as e:
+        if e.status_code == 404:
+            _session_guards.pop(upload_id, None)
+        raise
+    finally:
+        guard.lock.release()
+
+
+def _finalize_upload_session(upload_id: str) -> Tuple[StoredUpload, Optional[dict]]:
+    state_path, data_path = _session_paths(upload_id)
+    try:
+        with open(_completed_path(upload_id), "r", encoding="utf-8") as f:
+            completed = json.load(f)
+        _session_guards.pop(upload_id, None)
+        return StoredUpload(path=data_path, **completed), None
+    except FileNotFoundError:
+        pass
+    session = get_upload_session(upload_id)
+    missing = missing_ranges(session)
+    if missing:
+        raise HTTPException(status_code=409, detail={"message": "Upload is incomplete.", "missing_ranges": missing})
+
+    hasher = hashlib.sha256()
+    with open(data_path, "rb") as f:
+        for piece in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            hasher.update(piece)
+    sha256 = hasher.hexdigest()
+    if session["sha256"] and session["sha256"] != sha256:
+        abort_upload_session(upload_id)
+        raise HTTPException(status_code=422, detail="Uploaded data does not match the declared SHA-256; the session was discarded.")
+
+    completed = {"filename": session["filename"], "sha256": sha256, "size": session["size"]}
+    temp_path = f"{_completed_path(upload_id)}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(completed, f)
+    os.replace(temp_path, _completed_path(upload_id))
+    os.remove(state_path)
+    _session_guards.pop(upload_id, None)
+    logger.info(f"UPLOAD: Completed session {upload_id} for '{session['filename']}'.")
+    return StoredUpload(path=data_path, **completed), session["metadata"]
+
+
+def abort_upload_session(upload_id: str):
+    """Discards a session and any data received for it."""
+    for path in _session_paths(upload_id):
+        if os.path.exists(path):
+            os.remove(path)
+    _session_guards.pop(upload_id, None)
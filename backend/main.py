@@ -1,15 +1,14 @@
-from fastapi import FastAPI, HTTPException, Form, BackgroundTasks, UploadFile, File, Depends
+from fastapi import FastAPI, HTTPException, Form, BackgroundTasks, UploadFile, File, Depends, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, Response
-from typing import List, Optional, AsyncGenerator
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict, List, Optional, AsyncGenerator
 from pydantic import BaseModel, Field, EmailStr
 from dotenv import load_dotenv
 import os
 import sys
 import json
 import uuid
-import tempfile
-import io
+import asyncio
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordRequestForm
 import logging
@@ -17,7 +16,7 @@ from sqlalchemy import inspect, text
 from datetime import datetime
 from fastapi.concurrency import run_in_threadpool
 
-from core import pinecone_manager, llm_handler, processor, auth, generator_handler
+from core import pinecone_manager, llm_handler, processor, auth, generator_handler, uploads
 from core.llm_handler import run_agentic_rag_pipeline
 from core.database import Base, get_db, engine, User, ChatSession, SessionLocal, Feedback, AgentIdea, DealSubmission, Contact, Opportunity, Activity
 from core.agent_ideator_endpoints import setup_agent_ideator_endpoints
@@ -26,7 +25,13 @@ from core import deal_scorer
 from core import loopnet_scraper
 from core import sms_verification
 from core import crm_endpoints
+from core import crawler
+from core import crawl_cache
+from core import ingestion
+from core import fact_sheet
+from core import summaries
 from core import email_campaigns
+from core import generator_jobs
 
 load_dotenv()
 
@@ -73,6 +78,13 @@ class Token(BaseModel):
 class UrlList(BaseModel):
     urls: List[str]
 
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int
+    property: str
+    sha256: Optional[str] = None
+    doc_type: str = "file_upload"
+
 class GeneratorRequest(BaseModel):
     mappings: dict
     core_content: str
@@ -99,6 +111,9 @@ class DealSubmissionResponse(BaseModel):
     score: str
     html_response: str
 
+class BulkScoreRequest(BaseModel):
+    deals: List[Dict[str, Any]]  # Flat metric dicts; see deal_scorer.score_deals_batch
+
 class LoopNetScrapeRequest(BaseModel):
     url: str
 
@@ -200,6 +215,28 @@ def update_db_schema(db: Session):
     except Exception as e:
         logger.info(f"Could not update 'deal_submissions' table: {e}")
 
+    # Check for 'input_header' column in 'generator_jobs' table
+    try:
+        if inspector.has_table('generator_jobs'):
+            job_columns = [c['name'] for c in inspector.get_columns('generator_jobs')]
+            if 'input_header' not in job_columns:
+                logger.info("Column 'input_header' not found in 'generator_jobs' table. Adding it now.")
+                db.execute(text('ALTER TABLE generator_jobs ADD COLUMN input_header VARCHAR'))
+                logger.info("Successfully added 'input_header' column to 'generator_jobs' table.")
+    except Exception as e:
+        logger.info(f"Could not update 'generator_jobs' table: {e}")
+
+    # Check for 'document_date' column in 'property_facts' table
+    try:
+        if inspector.has_table('property_facts'):
+            fact_columns = [c['name'] for c in inspector.get_columns('property_facts')]
+            if 'document_date' not in fact_columns:
+                logger.info("Column 'document_date' not found in 'property_facts' table. Adding it now.")
+                db.execute(text('ALTER TABLE property_facts ADD COLUMN document_date VARCHAR'))
+                logger.info("Successfully added 'document_date' column to 'property_facts' table.")
+    except Exception as e:
+        logger.info(f"Could not update 'property_facts' table: {e}")
+
 @app.on_event("startup")
 def on_startup():
     logger.info("Application startup: Initializing database...")
@@ -222,6 +259,28 @@ def on_startup():
     finally:
         db.close()
 
+@app.on_event("startup")
+async def resume_generator_jobs():
+    try:
+        resumed = await run_in_threadpool(generator_jobs.resume_interrupted_jobs)
+        if resumed:
+            logger.info(f"Resumed {resumed} interrupted generator jobs.")
+    except Exception as e:
+        logger.error(f"Could not resume generator jobs: {e}", exc_info=True)
+
+_upload_sweeper: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_upload_sweeper():
+    global _upload_sweeper
+    _upload_sweeper = asyncio.create_task(uploads.sweep_sessions_periodically())
+
+@app.on_event("shutdown")
+def on_shutdown():
+    if _upload_sweeper:
+        _upload_sweeper.cancel()
+    processor.shutdown_parse_pool()
+
 # --- CORS Middleware ---
 app.add_middleware(
     CORSMiddleware,
@@ -322,6 +381,24 @@ async def verify_sms_code_endpoint(req: SmsCodeVerificationRequest):
         return SmsCodeVerificationResponse(valid=False)
 
 
+@app.post("/score-deals")
+async def score_deals(req: BulkScoreRequest, current_user: User = Depends(auth.get_current_active_user)):
+    """
+    Scores a batch of pipeline deals (e.g. from LoopNet or the CRM) in one
+    vectorised pass and returns each deal's score and flags, plus a summary.
+    Deals without any scored metric come back as "Insufficient data", and the
+    summary counts the fields the scorer did not recognise. Nothing is stored
+    and no letters are generated.
+    """
+    if len(req.deals) > deal_scorer.MAX_BATCH_DEALS:
+        raise HTTPException(status_code=400, detail=f"At most {deal_scorer.MAX_BATCH_DEALS} deals can be scored per request; use scripts/score_deals.py for larger files.")
+    try:
+        results = await run_in_threadpool(deal_scorer.score_deals_batch, req.deals)
+    except Exception as e:
+        logger.error(f"Error scoring deal batch: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="An internal error occurred while scoring the deals.")
+    return {"results": results, "summary": deal_scorer.summarize_scores(results)}
+
 @app.post("/score-deal", response_model=DealSubmissionResponse)
 async def score_deal(req: DealSubmissionRequest, db: Session = Depends(get_db)):
     """
@@ -508,41 +585,104 @@ def read_root():
     return {"status": "Alliance RAG API is running"}
 
 # --- Background Processing ---
-def process_and_index_files(temp_file_paths: List[str], original_file_names: List[str], property: str):
+# Documents whose facts and summary are being built at once, after indexing
+POST_PROCESS_CONCURRENCY = int(os.getenv("POST_PROCESS_CONCURRENCY", "2"))
+_post_process_slots = asyncio.Semaphore(POST_PROCESS_CONCURRENCY)
+
+async def post_process_document(document: ingestion.IngestDocument, result: dict):
+    """Builds the fact sheet entries and summary of a document once it has been indexed."""
+    chunk_path = result.get("chunk_path")
+    try:
+        property = document.metadata.get("property")
+        if result["error"] or not result["chunks"] or not property:
+            return
+        source = document.metadata["source"]
+        async with _post_process_slots:
+            chunk_list = await run_in_threadpool(ingestion.read_spooled_chunks, chunk_path)
+            outcomes = await asyncio.gather(
+                fact_sheet.extract_document_facts(property, source, chunk_list),
+                summaries.summarize_document(property, source, chunk_list),
+                return_exceptions=True,
+            )
+        for outcome in outcomes:
+            if isinstance(outcome, Exception):
+                logger.error(f"BACKGROUND_TASK_ERROR: Post-processing of {source} failed. Reason: {outcome}")
+    finally:
+        if chunk_path and os.path.exists(chunk_path):
+            os.remove(chunk_path)
+
+async def process_and_index_files(temp_file_paths: List[str], original_file_names: List[str], property: str, file_hashes: Optional[List[str]] = None, doc_type: str = "file_upload"):
     logger.info(f"BACKGROUND_TASK: Starting processing for {len(original_file_names)} files for property '{property}'.")
-    for i, temp_path in enumerate(temp_file_paths):
-        original_name = original_file_names[i]
-        logger.info(f"BACKGROUND_TASK: Processing {original_name}")
-        try:
-            chunks = processor.process_file(temp_path, original_name)
-            if chunks:
-                metadata = {"source": original_name, "doc_type": "file_upload", "property": property}
-                pinecone_manager.upsert_chunks(chunks, metadata)
-                logger.info(f"BACKGROUND_TASK: Successfully processed and indexed {original_name}")
-            else:
-                logger.warning(f"BACKGROUND_TASK: No chunks found for {original_name}. Skipping.")
-        except Exception as e:
-            logger.error(f"BACKGROUND_TASK_ERROR: Failed to process {original_name}. Reason: {e}")
-        finally:
+    documents = [
+        ingestion.IngestDocument(
+            path=temp_path,
+            name=original_name,
+            metadata={"source": original_name, "doc_type": doc_type, "property": property},
+            sha256=file_hash,
+        )
+        for temp_path, original_name, file_hash in zip(temp_file_paths, original_file_names, file_hashes or [None] * len(temp_file_paths))
+    ]
+    post_processing = []
+
+    async def queue_post_processing(document: ingestion.IngestDocument, result: dict):
+        # Runs outside the pipeline so its LLM calls don't hold up other documents' batches
+        post_processing.append(asyncio.create_task(post_process_document(document, result)))
+
+    try:
+        summary = await ingestion.ingest_documents(documents, on_document_done=queue_post_processing, spool_chunks=True)
+        logger.info(f"BACKGROUND_TASK: File processing complete ({summary['parse_cache_hits']} served from the parse cache). Stage timings: {summary['stages']}")
+    except Exception as e:
+        logger.error(f"BACKGROUND_TASK_ERROR: File processing failed. Reason: {e}", exc_info=True)
+    finally:
+        for temp_path in temp_file_paths:
             if os.path.exists(temp_path):
                 os.remove(temp_path)
-    logger.info("BACKGROUND_TASK: File processing complete.")
+    # The property summary is built from the document summaries, so wait for all of them
+    await asyncio.gather(*post_processing, return_exceptions=True)
+    summaries.schedule_property_refresh(property)
 
-def process_and_index_urls(urls: List[str]):
+async def process_and_index_urls(urls: List[str]):
     logger.info(f"BACKGROUND_TASK: Starting crawling for {len(urls)} URLs.")
-    for url in urls:
-        logger.info(f"BACKGROUND_TASK: Processing {url}")
-        try:
-            chunks = processor.process_url(url)
-            if chunks:
-                metadata = {"source": url, "doc_type": "url_crawl"}
-                pinecone_manager.upsert_chunks(chunks, metadata)
-                logger.info(f"BACKGROUND_TASK: Successfully processed and indexed {url}")
-            else:
-                logger.warning(f"BACKGROUND_TASK: No content found for {url}. Skipping.")
-        except Exception as e:
-            logger.error(f"BACKGROUND_TASK_ERROR: Failed to process {url}. Reason: {e}")
-    logger.info("BACKGROUND_TASK: URL crawling complete.")
+    cached = await run_in_threadpool(crawl_cache.get_entries, urls)
+    unchanged = 0
+
+    async def index_page(url: str, response):
+        nonlocal unchanged
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if response.status_code == 304:
+            unchanged += 1
+            await run_in_threadpool(crawl_cache.record_fetch, url, etag, last_modified)
+            return
+
+        # Parsing and embedding are blocking, so keep them off the event loop
+        chunks = await run_in_threadpool(processor.split_html, response.content)
+        page_hash = crawl_cache.content_hash(chunks)
+        previous = cached.get(url)
+        if previous and previous["content_hash"] == page_hash:
+            unchanged += 1
+            await run_in_threadpool(crawl_cache.record_fetch, url, etag, last_modified)
+            return
+
+        if previous:
+            # The page changed; drop the stale chunks before indexing the new ones. Forget the
+            # cached validators first, so the page is refetched if indexing the new ones fails.
+            await run_in_threadpool(crawl_cache.invalidate, url)
+            await run_in_threadpool(pinecone_manager.delete_document, url)
+        if chunks:
+            metadata = {"source": url, "doc_type": "url_crawl"}
+            await run_in_threadpool(pinecone_manager.upsert_chunks, chunks, metadata)
+            logger.info(f"BACKGROUND_TASK: Successfully processed and indexed {url}")
+        else:
+            logger.warning(f"BACKGROUND_TASK: No content found for {url}. Skipping.")
+        await run_in_threadpool(crawl_cache.record_fetch, url, etag, last_modified, page_hash, len(chunks))
+
+    summary = await crawler.crawl_urls(
+        urls,
+        index_page,
+        request_headers=lambda url: crawl_cache.conditional_headers(cached.get(url)),
+    )
+    logger.info(f"BACKGROUND_TASK: URL crawling complete. {summary}, {unchanged} unchanged page(s) skipped.")
 
 # --- API Endpoints ---
 @app.post("/signup", response_model=Token)
@@ -578,14 +718,67 @@ async def upload_files(
 ):
     temp_file_paths = []
     original_file_names = []
-    for file in files:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f"_{file.filename}") as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_file_paths.append(temp_file.name)
-            original_file_names.append(file.filename)
-    background_tasks.add_task(process_and_index_files, temp_file_paths, original_file_names, property)
-    return {"message": f"Successfully uploaded {len(files)} files. Processing has started in the background."}
+    file_hashes = []
+    seen_hashes = set()
+    skipped = 0
+    try:
+        for file in files:
+            stored = await uploads.save_upload_to_disk(file)
+            # Identical bytes uploaded twice in one batch only need indexing once
+            if stored.sha256 in seen_hashes:
+                os.remove(stored.path)
+                skipped += 1
+                continue
+            seen_hashes.add(stored.sha256)
+            temp_file_paths.append(stored.path)
+            original_file_names.append(stored.filename)
+            file_hashes.append(stored.sha256)
+    except Exception:
+        for path in temp_file_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    background_tasks.add_task(process_and_index_files, temp_file_paths, original_file_names, property, file_hashes)
+    message = f"Successfully uploaded {len(temp_file_paths)} files. Processing has started in the background."
+    if skipped:
+        message += f" Skipped {skipped} duplicate file(s)."
+    return {"message": message}
+
+# --- Resumable Uploads ---
+# POST /uploads starts a session, PUT /uploads/{id} sends a byte range with a
+# Content-Range header, GET /uploads/{id} reports the ranges still missing
+# (to resume after a dropped connection) and POST /uploads/{id}/complete
+# hands the finished file to ingestion.
+
+@app.post("/uploads")
+async def create_upload(req: UploadSessionCreate):
+    session = await run_in_threadpool(
+        uploads.create_upload_session, req.filename, req.size, {"property": req.property, "doc_type": req.doc_type}, req.sha256
+    )
+    return uploads.session_status(session)
+
+@app.get("/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    return uploads.session_status(await run_in_threadpool(uploads.get_upload_session, upload_id))
+
+@app.put("/uploads/{upload_id}")
+async def upload_part(upload_id: str, request: Request, content_range: Optional[str] = Header(None)):
+    session = await uploads.write_upload_range(upload_id, content_range, request.stream())
+    return uploads.session_status(session)
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str, background_tasks: BackgroundTasks):
+    stored, metadata = await uploads.finalize_upload_session(upload_id)
+    if metadata is not None:  # None: a retry of a completed upload, already being processed
+        background_tasks.add_task(
+            process_and_index_files, [stored.path], [stored.filename], metadata["property"], [stored.sha256], metadata["doc_type"]
+        )
+    return {"message": f"Upload of {stored.filename} complete. Processing has started in the background.", "sha256": stored.sha256}
+
+@app.delete("/uploads/{upload_id}")
+async def abort_upload(upload_id: str):
+    await run_in_threadpool(uploads.abort_upload_session, upload_id)
+    return {"message": "Upload session discarded."}
 
 @app.post("/crawl-urls")
 async def crawl_urls(url_list: UrlList, background_tasks: BackgroundTasks = BackgroundTasks()):
@@ -604,6 +797,9 @@ async def get_documents(property: Optional[str] = None):
 async def delete_document(file_name: str):
     try:
         pinecone_manager.delete_document(file_name)
+        fact_sheet.delete_facts(file_name)
+        for stale_property in summaries.delete_document_summaries(file_name):
+            summaries.schedule_property_refresh(stale_property)
         return {"message": f"Successfully deleted {file_name}."}
     except Exception as e:
         logger.error(f"Error deleting document {file_name}: {e}")
@@ -616,47 +812,165 @@ async def generator_process(
     core_content: str = Form(...),
     tone: str = Form(...),
     style: str = Form(...),
-    is_preview: str = Form(...) # Comes in as a string
+    is_preview: str = Form(...), # Comes in as a string
+    run_id: Optional[str] = Form(None), # Set to follow a full run on /generator/progress/{run_id}
+    preview_rows: int = Form(1),
+    preview_sample: str = Form("false") # 'true' to preview representative rows instead of the first ones
 ):
+    csv_path = None
     try:
         # The 'key_fields' field is a JSON string of a list
         key_fields_list = json.loads(key_fields)
 
-        csv_buffer = io.BytesIO(await file.read())
+        stored = await uploads.save_upload_to_disk(file)
+        csv_path = stored.path
         
         # Convert string 'true'/'false' to boolean
         is_preview_bool = is_preview.lower() == 'true'
 
-        df = await generator_handler.process_csv_and_generate_content(
-            csv_file=csv_buffer,
-            key_fields=key_fields_list,
-            core_content=core_content,
-            tone=tone,
-            style=style,
-            is_preview=is_preview_bool
-        )
-        
         if is_preview_bool:
-            # For a preview, return the first generated content as JSON
-            preview_content = df['ai_generated_content'].iloc[0] if not df.empty else ""
-            return {"preview_content": preview_content}
-        else:
-            # For a full run, return the entire CSV as a downloadable file
-            output_buffer = io.StringIO()
-            df.to_csv(output_buffer, index=False)
-            output_buffer.seek(0)
-            
-            return Response(
-                content=output_buffer.getvalue(),
-                media_type="text/csv",
-                headers={"Content-Disposition": "attachment; filename=ai_generated_content.csv"}
-            )
+            sample = preview_sample.lower() == 'true'
+            # Only the rows being previewed are read from the file
+            df = await run_in_threadpool(generator_handler.read_preview_rows, csv_path, preview_rows, sample)
+
+            if preview_rows <= 1 and not sample:
+                # For a single-row preview, return the generated content as JSON
+                generated = [
+                    preview["preview_content"]
+                    async for preview in generator_handler.stream_previews(df, key_fields_list, core_content, tone, style)
+                ]
+                return {"preview_content": generated[0] if generated else ""}
+
+            # For several rows, stream each preview as an event as soon as it is ready
+            async def preview_stream() -> AsyncGenerator[str, None]:
+                try:
+                    async for preview in generator_handler.stream_previews(df, key_fields_list, core_content, tone, style):
+                        yield f"data: {json.dumps(preview, default=str)}\n\n"
+                    yield "data: [DONE]\n\n"
+                except Exception as e:
+                    logger.error(f"Error in generator preview stream: {e}", exc_info=True)
+                    yield f"data: {json.dumps({'error': 'An error occurred while generating previews.'})}\n\n"
+
+            return StreamingResponse(preview_stream(), media_type="text/event-stream")
+
+        # For a full run, stream the CSV back as a download, row by row as it is generated
+        df = await run_in_threadpool(generator_handler.read_generator_csv, csv_path)
+        progress = None
+        if run_id:
+            # A run_id must not take over the progress of another run or a job
+            job = await run_in_threadpool(generator_jobs.get_job, run_id)
+            if job or generator_handler.get_progress(run_id):
+                raise HTTPException(status_code=409, detail="That run_id is already in use; choose a new one.")
+            progress = generator_handler.start_progress(run_id, len(df))
+
+        async def csv_stream() -> AsyncGenerator[str, None]:
+            try:
+                async for piece in generator_handler.stream_generated_csv(
+                    df, key_fields_list, core_content, tone, style, progress=progress
+                ):
+                    yield piece
+            finally:
+                if progress:
+                    generator_handler.finish_progress(run_id, progress)
+
+        return StreamingResponse(
+            csv_stream(),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=ai_generated_content.csv"}
+        )
 
+    except HTTPException:
+        raise
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
         logger.error(f"Error in generator processing: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="An internal error occurred during file processing.")
+    finally:
+        if csv_path and os.path.exists(csv_path):
+            os.remove(csv_path)
+
+@app.post("/generator/jobs")
+async def create_generator_job(
+    file: UploadFile = File(...),
+    key_fields: str = Form(...),
+    core_content: str = Form(...),
+    tone: str = Form(...),
+    style: str = Form(...)
+):
+    """
+    Submits a full generator run as a background job, for CSVs of any size.
+    Follow it with GET /generator/jobs/{job_id} (or /generator/progress/{job_id})
+    and fetch the output, partial or complete, from /generator/jobs/{job_id}/download.
+    """
+    csv_path = None
+    try:
+        key_fields_list = json.loads(key_fields)
+        stored = await uploads.save_upload_to_disk(file)
+        csv_path = stored.path
+        return await generator_jobs.create_job(csv_path, file.filename, key_fields_list, core_content, tone, style)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error creating generator job: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Could not create the generator job.")
+    finally:
+        if csv_path and os.path.exists(csv_path):
+            os.remove(csv_path)
+
+@app.get("/generator/jobs/{job_id}")
+async def get_generator_job(job_id: str):
+    job = await run_in_threadpool(generator_jobs.get_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Generator job not found.")
+    return generator_jobs.job_status(job)
+
+@app.post("/generator/jobs/{job_id}/retry")
+async def retry_generator_job(job_id: str):
+    job = await run_in_threadpool(generator_jobs.retry_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Generator job not found.")
+    return generator_jobs.job_status(job)
+
+@app.get("/generator/jobs/{job_id}/download")
+async def download_generator_job(job_id: str):
+    """Returns the job's output CSV so far: every completed row, in input order."""
+    job = await run_in_threadpool(generator_jobs.get_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Generator job not found.")
+    if not generator_jobs.has_output(job):
+        raise HTTPException(status_code=410, detail="The job's output was lost in a restart; please submit it again.")
+    suffix = "" if job.status == "completed" else "_partial"
+    return StreamingResponse(
+        generator_jobs.iter_job_output(job),
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename=ai_generated_content{suffix}.csv"}
+    )
+
+@app.get("/generator/progress/{run_id}")
+async def generator_progress(run_id: str):
+    """Streams progress events for a full generator run started with the same run_id, or a generator job."""
+    progress = generator_handler.get_progress(run_id)
+    if not progress:
+        raise HTTPException(status_code=404, detail="No generator run in progress with that id.")
+
+    async def event_stream() -> AsyncGenerator[str, None]:
+        last_completed = -1
+        while True:
+            snapshot = progress.snapshot()
+            if snapshot["completed"] != last_completed or snapshot["done"]:
+                yield f"data: {json.dumps(snapshot)}\n\n"
+                last_completed = snapshot["completed"]
+            if snapshot["done"]:
+                break
+            await progress.wait_for_change(last_completed)
+            # Marks the run done if it stalled, e.g. its download was never read
+            generator_handler.expire_progress()
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
 
 @app.post("/feedback")
 async def create_feedback(feedback_data: FeedbackCreate, db: Session = Depends(get_db), current_user: User = Depends(auth.get_current_active_user)):
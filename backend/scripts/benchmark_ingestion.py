@@ -0,0 +1,308 @@
+"""
+Ingestion throughput benchmark for Alliance.
+
+Generates a synthetic corpus of PDF, DOCX, XLSX and TXT files of controlled
+sizes, then measures:
+
+  1. parsing: processor.process_file on every file, serially in this process
+  2. indexing: the staged ingestion pipeline (core/ingestion.py) end to end,
+     with a stub embedder and vector store so no external APIs are called
+
+and reports docs/sec, chunks/sec, peak RSS and per-stage timings. Results can
+be saved as JSON and compared against an earlier run.
+
+----------------
+--- HOW TO USE ---
+----------------
+   python backend/scripts/benchmark_ingestion.py --docs 20 --pages 30
+   python backend/scripts/benchmark_ingestion.py --json after.json --compare before.json
+
+Use --embed-latency-ms to simulate embedding API latency per batch. The parse
+cache is bypassed unless --parse-cache is given, so repeated runs over the
+same synthetic corpus measure parsing rather than cache reads.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import resource
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+# The chunk registry needs a database; benchmarks run without it, but the
+# models are still imported, so point SQLAlchemy at an in-memory database.
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import docx
+import openpyxl
+from core import processor, ingestion
+
+WORDS = (
+    "lease tenant rent premises landlord term expiration renewal option base "
+    "escalation CAM operating expenses property manager square feet suite "
+    "occupancy vacancy NOI cap rate appraisal valuation market comparable"
+).split()
+
+
+# --- Synthetic Corpus ---
+
+def _sentences(rng: random.Random, count: int) -> list[str]:
+    return [" ".join(rng.choices(WORDS, k=rng.randint(8, 24))).capitalize() + "." for _ in range(count)]
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: list[list[str]]):
+    """Writes a minimal text-only PDF with one line of text per entry."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        stream = "BT /F1 9 Tf 40 800 Td 11 TL " + " ".join(f"({_pdf_escape(line)}) '" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def write_docx(path: str, rng: random.Random, paragraphs: int):
+    document = docx.Document()
+    for i in range(paragraphs):
+        if i % 15 == 0:
+            document.add_heading(f"Section {i // 15 + 1}", level=2)
+        document.add_paragraph(" ".join(_sentences(rng, rng.randint(2, 6))))
+    document.save(path)
+
+
+def write_xlsx(path: str, rng: random.Random, rows: int):
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Rent Roll")
+    sheet.append(["Unit", "Tenant", "Sq Ft", "Monthly Rent", "Lease Start", "Lease End"])
+    for unit in range(rows):
+        start_year = rng.randint(2015, 2024)
+        sheet.append([
+            f"{100 + unit}", f"Tenant {rng.randint(1, 9999)}", rng.randint(500, 5000),
+            round(rng.uniform(1000, 25000), 2), f"{start_year}-01-01", f"{start_year + rng.randint(1, 10)}-12-31",
+        ])
+    workbook.save(path)
+
+
+def write_txt(path: str, rng: random.Random, paragraphs: int):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(paragraphs):
+            if i % 15 == 0:
+                f.write(f"## SECTION {i // 15 + 1}\n\n")
+            f.write(" ".join(_sentences(rng, rng.randint(2, 6))) + "\n\n")
+
+
+def generate_corpus(directory: str, docs: int, pages: int, seed: int) -> list[str]:
+    """Creates docs files cycling through PDF, DOCX, XLSX and TXT, sized by 'pages'."""
+    rng = random.Random(seed)
+    writers = ["pdf", "docx", "xlsx", "txt"]
+    paths = []
+    for i in range(docs):
+        kind = writers[i % len(writers)]
+        path = os.path.join(directory, f"synthetic_{i:04d}.{kind}")
+        if kind == "pdf":
+            write_pdf(path, [[s[:110] for s in _sentences(rng, 60)] for _ in range(pages)])
+        elif kind == "docx":
+            write_docx(path, rng, pages * 8)
+        elif kind == "xlsx":
+            write_xlsx(path, rng, pages * 40)
+        else:
+            write_txt(path, rng, pages * 8)
+        paths.append(path)
+    return paths
+
+
+# --- Stub Clients ---
+
+class StubEmbeddings:
+    """Deterministic fake embedder with optional per-batch latency."""
+
+    def __init__(self, dimension: int = 768, latency_ms: float = 0.0):
+        self.dimension = dimension
+        self.latency = latency_ms / 1000
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+            vectors.append([((seed >> (i % 64)) & 0xFF) / 255.0 for i in range(self.dimension)])
+        return vectors
+
+
+class StubIndex:
+    """Counts upserted vectors instead of sending them anywhere."""
+
+    def __init__(self):
+        self.vectors = 0
+
+    def upsert(self, vectors):
+        self.vectors += len(vectors)
+
+    def fetch(self, ids):
+        # Nothing is stored, so every id is missing, as with a real index
+        return SimpleNamespace(vectors={})
+
+
+# --- Measurements ---
+
+def peak_rss_mb() -> dict:
+    """Peak resident set size of this process and of its (finished) children, in MB."""
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / divisor,
+    }
+
+
+def benchmark_parsing(paths: list[str], use_cache: bool) -> dict:
+    by_type = {}
+    total_chunks = 0
+    started = time.perf_counter()
+    for path in paths:
+        file_started = time.perf_counter()
+        chunks = processor.process_file(path, os.path.basename(path), use_cache=use_cache)
+        elapsed = time.perf_counter() - file_started
+        kind = os.path.splitext(path)[1]
+        entry = by_type.setdefault(kind, {"docs": 0, "chunks": 0, "seconds": 0.0})
+        entry["docs"] += 1
+        entry["chunks"] += len(chunks)
+        entry["seconds"] += elapsed
+        total_chunks += len(chunks)
+    elapsed = time.perf_counter() - started
+    return {
+        "docs": len(paths),
+        "chunks": total_chunks,
+        "seconds": elapsed,
+        "docs_per_sec": len(paths) / elapsed,
+        "chunks_per_sec": total_chunks / elapsed,
+        "by_type": by_type,
+    }
+
+
+def benchmark_pipeline(paths: list[str], embed_latency_ms: float, embed_workers: int, use_cache: bool) -> dict:
+    documents = [
+        ingestion.IngestDocument(path, os.path.basename(path), {"source": os.path.basename(path), "doc_type": "benchmark", "property": "Benchmark"})
+        for path in paths
+    ]
+    index = StubIndex()
+    pipeline = ingestion.IngestionPipeline(
+        embed_workers=embed_workers,
+        embeddings=StubEmbeddings(latency_ms=embed_latency_ms),
+        index=index,
+        use_registry=False,
+        use_parse_cache=use_cache,
+        delete_files=False,
+    )
+    summary = asyncio.run(pipeline.run(documents))
+    # Wait for the parse workers to exit so their peak RSS is reported
+    processor.shutdown_parse_pool(wait=True)
+    chunks = sum(d["chunks"] for d in summary["documents"])
+    elapsed = summary["elapsed_seconds"]
+    return {
+        "docs": len(paths),
+        "chunks": chunks,
+        "vectors": index.vectors,
+        "errors": [d for d in summary["documents"] if d["error"]],
+        "parse_cache_hits": summary["parse_cache_hits"],
+        "seconds": elapsed,
+        "docs_per_sec": len(paths) / elapsed,
+        "chunks_per_sec": chunks / elapsed,
+        "stages": summary["stages"],
+    }
+
+
+def print_report(results: dict, baseline: dict = None):
+    def delta(section: str, key: str) -> str:
+        if not baseline or section not in baseline:
+            return ""
+        before = baseline[section][key]
+        return f"  ({(results[section][key] - before) / before * 100:+.1f}% vs baseline)" if before else ""
+
+    corpus = results["corpus"]
+    print(f"\nCorpus: {corpus['docs']} docs, {corpus['megabytes']:.1f} MB, {corpus['pages']} pages/doc")
+
+    parsing = results["parsing"]
+    print("\n--- Parsing (processor.process_file, serial) ---")
+    print(f"docs/sec:   {parsing['docs_per_sec']:.2f}{delta('parsing', 'docs_per_sec')}")
+    print(f"chunks/sec: {parsing['chunks_per_sec']:.1f}{delta('parsing', 'chunks_per_sec')}")
+    for kind, entry in sorted(parsing["by_type"].items()):
+        print(f"  {kind:<6} {entry['docs']:>4} docs {entry['chunks']:>7} chunks {entry['seconds']:>8.2f}s")
+
+    pipeline = results["pipeline"]
+    print("\n--- Indexing (ingestion pipeline, stub embedder/index) ---")
+    print(f"docs/sec:   {pipeline['docs_per_sec']:.2f}{delta('pipeline', 'docs_per_sec')}")
+    print(f"chunks/sec: {pipeline['chunks_per_sec']:.1f}{delta('pipeline', 'chunks_per_sec')}")
+    print(f"errors:     {len(pipeline['errors'])}")
+    print(f"parse cache hits: {pipeline['parse_cache_hits']}")
+    for stage, entry in pipeline["stages"].items():
+        print(f"  {stage:<7} {entry['items']:>7} items {entry['busy_seconds']:>8.2f}s busy")
+
+    rss = results["peak_rss_mb"]
+    print(f"\nPeak RSS: {rss['self']:.1f} MB (this process), {rss['children']:.1f} MB (largest worker)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark document ingestion throughput.")
+    parser.add_argument("--docs", type=int, default=12, help="Number of synthetic documents.")
+    parser.add_argument("--pages", type=int, default=20, help="Approximate size of each document in pages.")
+    parser.add_argument("--seed", type=int, default=7, help="Seed for the synthetic corpus.")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Simulated latency per embedding batch.")
+    parser.add_argument("--embed-workers", type=int, default=ingestion.EMBED_WORKERS, help="Embedding workers in the pipeline.")
+    parser.add_argument("--parse-cache", action="store_true", help="Read and write the parse cache.")
+    parser.add_argument("--json", type=str, default=None, help="Write results to this JSON file.")
+    parser.add_argument("--compare", type=str, default=None, help="Baseline JSON file from an earlier run.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="ingest_bench_") as directory:
+        print(f"Generating {args.docs} synthetic documents...")
+        paths = generate_corpus(directory, args.docs, args.pages, args.seed)
+        results = {
+            "corpus": {
+                "docs": args.docs,
+                "pages": args.pages,
+                "megabytes": sum(os.path.getsize(p) for p in paths) / (1024 * 1024),
+            },
+            "parsing": benchmark_parsing(paths, args.parse_cache),
+            "pipeline": benchmark_pipeline(paths, args.embed_latency_ms, args.embed_workers, args.parse_cache),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Micro-benchmark for the text splitters used during ingestion.
+
+Compares the shared token-aware splitter in core/chunking.py against the
+splitters it replaced: LangChain's RecursiveCharacterTextSplitter at the old
+500/50 and 1000/100 character settings (skipped if LangChain isn't
+installed) and the fixed-width slicer from the old standalone_bulk_upload.py.
+
+Example:
+   python backend/scripts/benchmark_splitter.py --size-mb 5 --repeat 3
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from core import chunking
+
+WORDS = (
+    "lease tenant rent premises landlord term expiration renewal option base "
+    "escalation CAM operating expenses property manager square feet suite "
+    "occupancy vacancy NOI cap rate appraisal valuation $12,500.00 2027 3.5%"
+).split()
+
+
+def make_corpus(size_bytes: int, seed: int = 42) -> str:
+    """Builds a document-like text: headings, paragraphs and sentences of varying length."""
+    rng = random.Random(seed)
+    parts = []
+    total = 0
+    section = 0
+    while total < size_bytes:
+        if rng.random() < 0.05:
+            section += 1
+            parts.append(f"## SECTION {section}: {rng.choice(WORDS).upper()}")
+        sentences = [
+            " ".join(rng.choices(WORDS, k=rng.randint(6, 40))).capitalize() + "."
+            for _ in range(rng.randint(1, 8))
+        ]
+        parts.append(" ".join(sentences))
+        total += len(parts[-1]) + 2
+    return "\n\n".join(parts)
+
+
+def fixed_width_slicer(text: str, chunk_size: int = 1000, overlap: int = 200) -> list[str]:
+    """The character slicer previously used by standalone_bulk_upload.py."""
+    chunks = []
+    start = 0
+    while start < len(text):
+        chunks.append(text[start:start + chunk_size])
+        start += chunk_size - overlap
+    return chunks
+
+
+def get_splitters() -> dict:
+    splitters = {
+        "chunking.TextSplitter (250/25 tokens)": chunking.TextSplitter().split_text,
+        "fixed-width slicer (1000/200 chars)": fixed_width_slicer,
+    }
+    try:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        for size, overlap in [(500, 50), (1000, 100)]:
+            splitter = RecursiveCharacterTextSplitter(chunk_size=size, chunk_overlap=overlap, length_function=len)
+            splitters[f"LangChain recursive ({size}/{overlap} chars)"] = splitter.split_text
+    except ImportError:
+        print("(langchain_text_splitters not installed; skipping LangChain splitters)\n")
+    return splitters
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion text splitters.")
+    parser.add_argument("--size-mb", type=float, default=2.0, help="Size of the synthetic text in megabytes.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per splitter; the best run is reported.")
+    parser.add_argument("--file", type=str, default=None, help="Benchmark on an existing text file instead.")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(os.path.expanduser(args.file), "r", encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = make_corpus(int(args.size_mb * 1024 * 1024))
+    size_mb = len(text.encode("utf-8")) / (1024 * 1024)
+    print(f"Corpus: {size_mb:.2f} MB, ~{chunking.count_tokens(text):,} tokens\n")
+
+    splitters = get_splitters()
+    print(f"{'Splitter':<42} {'Best (s)':>9} {'MB/s':>8} {'Chunks':>8} {'Avg tokens':>11}")
+    print("-" * 82)
+    for name, split in splitters.items():
+        best = float("inf")
+        chunks = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            chunks = split(text)
+            best = min(best, time.perf_counter() - start)
+        avg_tokens = sum(chunking.count_tokens(c) for c in chunks) / max(len(chunks), 1)
+        print(f"{name:<42} {best:>9.3f} {size_mb / best:>8.2f} {len(chunks):>8} {avg_tokens:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,29 @@
+"""
+Bulk upload a folder of files to the Alliance Knowledge Base.
+
+Files are sent through the resumable upload API (POST /uploads, PUT byte
+ranges, POST /uploads/{id}/complete) several at a time. Requests that fail
+with a connection error, a 429 or a 5xx are retried with exponential backoff,
+honouring the server's Retry-After. The server's max_concurrency hint caps how
+many files are in flight at once. Progress is recorded in a manifest inside
+the folder, so an interrupted run picks up where it left off, resuming
+half-sent files from the bytes the server already has.
+
+Example:
+   python backend/scripts/bulk_upload.py ~/transcripts --property "Main Street Plaza"
+"""
 import os
-import requests
-import argparse
+import sys
+import json
 import time
+import random
+import hashlib
+import argparse
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 
 # --- Configuration ---
 # Load environment variables from a .env file in the parent directory
@@ -12,95 +33,299 @@ load_dotenv(dotenv_path=dotenv_path)
 # Get the backend URL from environment variables, with a default for local dev
 API_BASE_URL = os.environ.get("VITE_API_BASE_URL", "http://localhost:10000")
 
-def upload_file(file_path: str, doc_type: str = "transcription"):
+# Size of each PUT; the server suggests one when the session is created.
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 1.0
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+MANIFEST_NAME = ".alliance_upload_manifest.json"
+MANIFEST_SAVE_INTERVAL = 2.0  # Seconds between manifest writes
+
+
+class ConcurrencyLimiter:
+    """A semaphore whose limit can change while it is in use (from the server's rate hint)."""
+
+    def __init__(self, limit: int, ceiling: int):
+        self.ceiling = ceiling
+        self.limit = min(limit, ceiling)
+        self.active = 0
+        self._condition = threading.Condition()
+
+    def set_limit(self, limit: int):
+        with self._condition:
+            self.limit = max(1, min(limit, self.ceiling))
+            self._condition.notify_all()
+
+    def __enter__(self):
+        with self._condition:
+            while self.active >= self.limit:
+                self._condition.wait()
+            self.active += 1
+
+    def __exit__(self, *exc):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+
+class Manifest:
     """
-    Manages the three-step upload process for a single file.
+    Per-file upload state, keyed by file name: size and mtime (to notice
+    changed files), the open upload session, and whether it is done.
     """
-    file_name = os.path.basename(file_path)
-    content_type = "text/plain"
-    
-    try:
-        # --- Step 1: Get a pre-signed URL from our backend ---
-        print(f"   [1/3] Requesting upload URL for {file_name}...")
-        presigned_url_response = requests.post(
-            f"{API_BASE_URL}/generate-upload-url",
-            json={"file_name": file_name, "content_type": content_type}
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def fingerprint(file_path: str) -> dict:
+        stat = os.stat(file_path)
+        return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+    def get(self, name: str, file_path: str) -> dict:
+        """Returns the entry for a file, discarding it if the file has changed since."""
+        entry = self.entries.get(name) or {}
+        fingerprint = self.fingerprint(file_path)
+        if any(entry.get(k) != v for k, v in fingerprint.items()):
+            return fingerprint
+        return entry
+
+    def update(self, name: str, entry: dict):
+        with self._lock:
+            self.entries[name] = entry
+            if time.monotonic() - self._last_save >= MANIFEST_SAVE_INTERVAL:
+                self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(temp_path, self.path)
+        self._last_save = time.monotonic()
+
+
+class Progress:
+    """Prints a single updating line with files done, throughput and ETA."""
+
+    def __init__(self, total_files: int, total_bytes: int):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.files_done = 0
+        self.files_failed = 0
+        self.bytes_sent = 0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_bytes(self, count: int):
+        with self._lock:
+            self.bytes_sent += count
+
+    def file_finished(self, ok: bool):
+        with self._lock:
+            if ok:
+                self.files_done += 1
+            else:
+                self.files_failed += 1
+        self.render()
+
+    def render(self, final: bool = False):
+        elapsed = max(time.perf_counter() - self.started, 1e-6)
+        finished = self.files_done + self.files_failed
+        rate = finished / elapsed
+        eta = (self.total_files - finished) / rate if rate else 0
+        line = (
+            f"\r{finished}/{self.total_files} files ({self.files_failed} failed) | "
+            f"{rate:.1f} files/s | {self.bytes_sent / elapsed / (1024 * 1024):.2f} MB/s | ETA {eta:.0f}s   "
         )
-        presigned_url_response.raise_for_status()
-        upload_data = presigned_url_response.json()
-        upload_url = upload_data['upload_url']
-        
-        # --- Step 2: Upload the actual file to Google Cloud Storage ---
-        print(f"   [2/3] Uploading file to Google Cloud Storage...")
-        with open(file_path, 'rb') as f:
-            upload_response = requests.put(
-                upload_url,
-                data=f,
-                headers={'Content-Type': content_type}
-            )
-            upload_response.raise_for_status()
-            
-        # --- Step 3: Notify our backend that the upload is complete ---
-        print(f"   [3/3] Notifying server to process the file...")
-        notify_response = requests.post(
-            f"{API_BASE_URL}/notify-upload",
+        print(line, end="\n" if final else "", flush=True)
+
+
+class BulkUploader:
+    def __init__(self, property: str, doc_type: str, concurrency: int, manifest: Manifest, progress: Progress):
+        self.property = property
+        self.doc_type = doc_type
+        self.limiter = ConcurrencyLimiter(concurrency, concurrency)
+        self.manifest = manifest
+        self.progress = progress
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._pause_until = 0.0
+        self._pause_lock = threading.Lock()
+
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Sends a request, retrying transient failures with jittered exponential backoff."""
+        for attempt in range(MAX_RETRIES + 1):
+            # A 429 seen by any worker pauses all of them
+            with self._pause_lock:
+                wait = self._pause_until - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                response = self.session.request(method, f"{API_BASE_URL}{path}", **kwargs)
+            except requests.exceptions.ConnectionError:
+                if attempt == MAX_RETRIES:
+                    raise
+                time.sleep(BACKOFF_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5))
+                continue
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt == MAX_RETRIES:
+                response.raise_for_status()
+                return response
+            delay = BACKOFF_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5)
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            if response.status_code == 429:
+                # The server is saturated: back every worker off, and send fewer files at once
+                with self._pause_lock:
+                    pause = float(retry_after) if retry_after.isdigit() else BACKOFF_SECONDS
+                    self._pause_until = max(self._pause_until, time.monotonic() + pause)
+                self.limiter.set_limit(self.limiter.limit - 1)
+            time.sleep(delay)
+        raise RuntimeError("unreachable")
+
+    def _apply_hint(self, status: dict):
+        hint = status.get("max_concurrency")
+        if hint:
+            self.limiter.set_limit(hint)
+
+    def _start_session(self, name: str, file_path: str, entry: dict) -> dict:
+        """Resumes the file's open session if the server still has it, otherwise starts a new one."""
+        if entry.get("upload_id"):
+            try:
+                return self._request("GET", f"/uploads/{entry['upload_id']}", timeout=30).json()
+            except requests.exceptions.HTTPError as e:
+                if e.response is None or e.response.status_code != 404:
+                    raise
+        hasher = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(block)
+        return self._request(
+            "POST", "/uploads",
             json={
-                "file_name": file_name,
-                "content_type": content_type,
-                "doc_type": doc_type
-            }
-        )
-        notify_response.raise_for_status()
-        
-        print(f"✅ Successfully initiated processing for {file_name}\n")
-        return True
+                "filename": name,
+                "size": entry["size"],
+                "property": self.property,
+                "sha256": hasher.hexdigest(),
+                "doc_type": self.doc_type,
+            },
+            timeout=30,
+        ).json()
+
+    def _send_missing_ranges(self, file_path: str, status: dict):
+        part_size = status.get("part_size") or DEFAULT_PART_SIZE
+        size = status["size"]
+        with open(file_path, "rb") as f:
+            for start, end in status["missing_ranges"]:
+                for part_start in range(start, end, part_size):
+                    part_end = min(part_start + part_size, end)
+                    f.seek(part_start)
+                    response = self._request(
+                        "PUT", f"/uploads/{status['upload_id']}",
+                        data=f.read(part_end - part_start),
+                        headers={"Content-Range": f"bytes {part_start}-{part_end - 1}/{size}"},
+                        timeout=120,
+                    )
+                    self.progress.add_bytes(part_end - part_start)
+                    self._apply_hint(response.json())
+
+    def upload(self, file_path: str) -> bool:
+        name = os.path.basename(file_path)
+        entry = self.manifest.get(name, file_path)
+        if entry.get("done"):
+            return True
+        with self.limiter:
+            try:
+                if entry["size"] == 0:
+                    raise ValueError("file is empty")
+                status = self._start_session(name, file_path, entry)
+                self._apply_hint(status)
+                self.manifest.update(name, {**entry, "upload_id": status["upload_id"]})
+                self._send_missing_ranges(file_path, status)
+                self._request("POST", f"/uploads/{status['upload_id']}/complete", timeout=300)
+                self.manifest.update(name, {**entry, "done": True})
+                return True
+            except (requests.exceptions.RequestException, OSError, ValueError) as e:
+                detail = ""
+                if isinstance(e, requests.exceptions.RequestException) and e.response is not None:
+                    detail = f" Response: {e.response.text}"
+                print(f"\n❌ Error uploading {name}: {e}.{detail}")
+                return False
 
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Error uploading {file_name}: {e}")
-        if e.response:
-            print(f"    Response: {e.response.text}")
-        return False
 
 def main():
-    parser = argparse.ArgumentParser(description="Bulk upload text files to the Alliance Knowledge Base.")
-    parser.add_argument("folder_path", type=str, help="The full path to the folder containing the transcription files.")
+    parser = argparse.ArgumentParser(description="Bulk upload files to the Alliance Knowledge Base.")
+    parser.add_argument("folder_path", type=str, help="The full path to the folder containing the files.")
+    parser.add_argument("--property", type=str, required=True, help="The property the files belong to.")
+    parser.add_argument("--doc-type", type=str, default="transcription", help="Document type recorded with each file.")
+    parser.add_argument("--extensions", type=str, default=".txt", help="Comma-separated file extensions to upload.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum files uploaded in parallel (the server may ask for fewer).")
+    parser.add_argument("--restart", action="store_true", help="Ignore the manifest and upload every file again.")
     args = parser.parse_args()
 
     folder_path = os.path.expanduser(args.folder_path)
 
     if not os.path.isdir(folder_path):
         print(f"Error: Folder not found at '{folder_path}'")
-        return
+        return 1
 
     print(f"Starting bulk upload from folder: {folder_path}")
     print(f"Targeting API server: {API_BASE_URL}\n")
-    
-    files_to_upload = [f for f in os.listdir(folder_path) if f.endswith('.txt')]
-    total_files = len(files_to_upload)
-    
-    if total_files == 0:
-        print("No .txt files found in the specified folder.")
-        return
-
-    successful_uploads = 0
-    failed_uploads = 0
-
-    for i, file_name in enumerate(files_to_upload):
-        print(f"--- Processing file {i+1} of {total_files}: {file_name} ---")
-        file_path = os.path.join(folder_path, file_name)
-        
-        if upload_file(file_path):
-            successful_uploads += 1
-        else:
-            failed_uploads += 1
-        
-        # Add a small delay to avoid overwhelming the server
-        time.sleep(1) 
+
+    extensions = tuple(ext.strip().lower() for ext in args.extensions.split(",") if ext.strip())
+    files_to_upload = sorted(
+        os.path.join(folder_path, f) for f in os.listdir(folder_path)
+        if f.lower().endswith(extensions) and os.path.isfile(os.path.join(folder_path, f))
+    )
+    if not files_to_upload:
+        print(f"No {', '.join(extensions)} files found in the specified folder.")
+        return 0
+
+    manifest_path = os.path.join(folder_path, MANIFEST_NAME)
+    if args.restart and os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    manifest = Manifest(manifest_path)
+    pending = [p for p in files_to_upload if not manifest.get(os.path.basename(p), p).get("done")]
+    print(f"{len(files_to_upload)} files found; {len(files_to_upload) - len(pending)} already uploaded, {len(pending)} to go.")
+
+    progress = Progress(len(pending), sum(os.path.getsize(p) for p in pending))
+    uploader = BulkUploader(args.property, args.doc_type, args.concurrency, manifest, progress)
+    executor = ThreadPoolExecutor(max_workers=args.concurrency)
+    try:
+        futures = [executor.submit(uploader.upload, path) for path in pending]
+        for future in as_completed(futures):
+            progress.file_finished(future.result())
+    except KeyboardInterrupt:
+        # Drop the queued files rather than uploading them all on the way out
+        executor.shutdown(wait=False, cancel_futures=True)
+        manifest.save()
+        progress.render(final=True)
+        print("\nInterrupted; progress is saved. Run the same command again to resume.", flush=True)
+        # Don't wait for the uploads in flight either; their sessions are in
+        # the manifest, so the next run resumes them where they stopped.
+        os._exit(130)
+    finally:
+        executor.shutdown(wait=True)
+        manifest.save()
+        progress.render(final=True)
 
     print("\n--- Bulk Upload Complete ---")
-    print(f"Successfully processed: {successful_uploads}")
-    print(f"Failed: {failed_uploads}")
+    print(f"Successfully processed: {progress.files_done}")
+    print(f"Failed: {progress.files_failed}")
     print("----------------------------")
+    return 1 if progress.files_failed else 0
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    sys.exit(main())
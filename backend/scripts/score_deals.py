@@ -0,0 +1,89 @@
+"""
+Score a batch of deals from a CSV or JSON file with the vectorised deal scorer.
+
+Each CSV row (or JSON object) is one deal: its metric columns (capRate,
+trafficVolume, pricePerSqFt, occupancyRate, yearBuilt, vacancyRate,
+zoningMatch, deferredMaintenance), propertyType, unitCount, fullBayAccess,
+marketStatus and an optional id. The scores and flags are written as CSV or
+JSON (by the output file's extension), or printed as JSON lines.
+
+Example:
+   python backend/scripts/score_deals.py pipeline.csv --output scored.csv
+"""
+import os
+import sys
+import json
+import argparse
+
+import pandas as pd
+
+# Add parent directory to path to import from core
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import deal_scorer
+
+
+def load_deals(path: str) -> list:
+    if path.lower().endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data["deals"] if isinstance(data, dict) else data
+    df = pd.read_csv(path)
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+LIST_FIELDS = ("red_flags", "yellow_flags", "green_metrics", "unrecognised_fields")
+
+
+def write_results(results: list, path: str):
+    if path.lower().endswith(".json"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, default=str)
+        return
+    rows = [
+        {
+            **{k: v for k, v in result.items() if k not in LIST_FIELDS + ("metric_scores",)},
+            **{k: "; ".join(result[k]) for k in LIST_FIELDS},
+            **{f"{metric}_score": color for metric, color in result["metric_scores"].items()},
+        }
+        for result in results
+    ]
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a batch of deals and report per-deal flags.")
+    parser.add_argument("input_path", type=str, help="CSV or JSON file of deals.")
+    parser.add_argument("--output", type=str, help="Write results to this .csv or .json file instead of printing them.")
+    args = parser.parse_args()
+
+    deals = load_deals(args.input_path)
+    results = deal_scorer.score_deals_batch(deals)
+
+    if args.output:
+        write_results(results, args.output)
+        print(f"Wrote {len(results)} scored deals to {args.output}")
+    else:
+        for result in results:
+            print(json.dumps(result, default=str))
+
+    summary = deal_scorer.summarize_scores(results)
+    insufficient = summary[deal_scorer.INSUFFICIENT_DATA]
+    print(
+        f"Green: {summary['Green']}  Yellow: {summary['Yellow']}  Red: {summary['Red']}  "
+        f"{deal_scorer.INSUFFICIENT_DATA}: {insufficient}",
+        file=sys.stderr,
+    )
+    if insufficient:
+        labels = [
+            f"id {result['id']}" if result["id"] is not None else f"row {i + 1}"
+            for i, result in enumerate(results) if result["score"] == deal_scorer.INSUFFICIENT_DATA
+        ]
+        shown = ", ".join(labels[:20]) + (", ..." if len(labels) > 20 else "")
+        print(f"Warning: {insufficient} deals had no recognised metric ({shown}).", file=sys.stderr)
+    if summary["unrecognised_fields"]:
+        fields = ", ".join(f"{field} ({count} deals)" for field, count in summary["unrecognised_fields"].items())
+        print(f"Unrecognised fields, not scored: {fields}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,19 @@
 Standalone Bulk Upload Script for Alliance
 
 This script is designed to be run locally to process a directory of video files
-and upload them directly to a Pinecone index. It is self-contained and does
-not depend on the main FastAPI application code, to avoid local environment issues.
+and upload them directly to a Pinecone index. It does not need the FastAPI
+application or its services, to avoid local environment issues; the only
+backend code it imports is the shared text splitter in core/chunking.py, which
+needs nothing beyond the standard library (and tiktoken, if installed).
+
+Files move through three overlapping stages:
+  1. ffmpeg extracts 16 kHz mono audio, several files at a time, a few files
+     ahead of transcription.
+  2. Whisper transcribes in worker processes that each load the model once.
+  3. Transcripts are chunked, and chunks from all files are embedded and
+     upserted in shared batches.
+Completed files are recorded in a manifest, so rerunning the script after a
+crash (or on a folder with new videos) only processes what is left.
 
 ----------------
 --- HOW TO USE ---
@@ -26,18 +37,28 @@ not depend on the main FastAPI application code, to avoid local environment issu
 
    Example:
    python backend/scripts/standalone_bulk_upload.py "/path/to/your/video folder"
+
+   Useful options: --model (Whisper model, default tiny), --transcribe-workers,
+   --ffmpeg-workers, --embed-batch-size, --manifest (default: a
+   .bulk_upload_manifest.json file inside the video folder).
 """
 
 import os
 import sys
+import json
+import time
 import argparse
 import tempfile
+import threading
 from dotenv import load_dotenv
 from pathlib import Path
 import subprocess
+from concurrent.futures import FIRST_COMPLETED, CancelledError, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 
 # --- Dependency Check ---
 try:
+    import numpy as np
     import whisper
     from pinecone import Pinecone
     from langchain_google_genai import GoogleGenerativeAIEmbeddings
@@ -47,6 +68,11 @@ except ImportError:
     print("pip install pinecone-client langchain-google-genai openai-whisper python-dotenv")
     sys.exit(1)
 
+# The shared splitter only needs the standard library, so it is safe to
+# import here without pulling in the rest of the FastAPI app.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from core.chunking import chunk_text
+
 # --- FFMPEG Check ---
 try:
     subprocess.run(["ffmpeg", "-version"], capture_output=True, check=True)
@@ -56,44 +82,213 @@ except (subprocess.CalledProcessError, FileNotFoundError):
     sys.exit(1)
 
 
-def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> list[str]:
-    """Splits a long text into smaller chunks with some overlap."""
-    if not text:
-        return []
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunks.append(text[start:end])
-        start += chunk_size - overlap
-    return chunks
-
-def process_and_transcribe_video(file_path: str) -> str:
-    """Processes a single video file, returning the transcribed text."""
-    print(f"  - Processing video: {file_path}")
-    audio_path = None
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".avi", ".mkv", ".webm"}
+MANIFEST_NAME = ".bulk_upload_manifest.json"
+UPSERT_BATCH_SIZE = 100
+EMBED_RETRIES = 3
+WHISPER_SAMPLE_RATE = 16000
+SLOT_POLL_SECONDS = 0.5
+
+
+# --- Stage 1: Audio Extraction ---
+
+def extract_audio(file_path: str, slots: threading.Semaphore, stop: threading.Event) -> str:
+    """
+    Extracts the audio track as raw 16 kHz mono PCM, the format Whisper works
+    on, so it does not have to decode the audio a second time. Waits for a
+    free slot first, which keeps extraction only a few files ahead of
+    transcription, and gives up once the run is stopping.
+    """
+    while not slots.acquire(timeout=SLOT_POLL_SECONDS):
+        if stop.is_set():
+            raise CancelledError()
+    fd, audio_path = tempfile.mkstemp(suffix=".pcm")
+    os.close(fd)
+    command = [
+        "ffmpeg", "-nostdin", "-i", file_path, "-vn", "-ac", "1",
+        "-ar", str(WHISPER_SAMPLE_RATE), "-f", "s16le", audio_path, "-y",
+    ]
     try:
-        with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as temp_audio_file:
-            audio_path = temp_audio_file.name
-        
-        # Use ffmpeg to extract audio without loading video into memory
-        command = ["ffmpeg", "-i", file_path, "-q:a", "0", "-map", "a", audio_path, "-y"]
-        print("    - Extracting audio with ffmpeg...")
         subprocess.run(command, check=True, capture_output=True, text=True)
+    except BaseException:
+        os.remove(audio_path)
+        slots.release()
+        raise
+    return audio_path
+
+
+# --- Stage 2: Transcription (runs in worker processes) ---
+
+_whisper_model = None
+
+def load_whisper_model(model_name: str):
+    """Process pool initializer: loads the Whisper model once per worker."""
+    global _whisper_model
+    _whisper_model = whisper.load_model(model_name)
+
+def transcribe_audio(audio_path: str) -> str:
+    audio = np.fromfile(audio_path, dtype=np.int16).astype(np.float32) / 32768.0
+    result = _whisper_model.transcribe(audio, fp16=False)
+    return result.get('text', '')
+
+
+# --- Manifest ---
+
+class Manifest:
+    """Records completed files (by size and modification time) so reruns skip them."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries = {}
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def _fingerprint(file_path: Path) -> dict:
+        stat = file_path.stat()
+        return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+    def is_done(self, key: str, file_path: Path) -> bool:
+        entry = self.entries.get(key)
+        return bool(entry) and all(entry.get(k) == v for k, v in self._fingerprint(file_path).items())
+
+    def mark_done(self, key: str, file_path: Path, chunks: int):
+        self.entries[key] = {**self._fingerprint(file_path), "chunks": chunks, "completed_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        temp_path = self.path.with_suffix(".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(temp_path, self.path)
+
+
+# --- Stage 3: Embedding and Upload ---
 
-        print("    - Transcribing audio with Whisper...")
-        model = whisper.load_model("tiny")
-        result = model.transcribe(audio_path, fp16=False)
-        print("    - Transcription complete.")
-        return result.get('text', '')
-    except subprocess.CalledProcessError as e:
-        print(f"    - ffmpeg failed: {e.stderr}")
-        return ""
+class VectorUploader:
+    """
+    Embeds and upserts chunks in batches shared across files. A file is
+    marked done in the manifest only once all of its chunks are uploaded.
+    """
+
+    def __init__(self, embeddings, index, doc_type: str, batch_size: int, manifest: Manifest):
+        self.embeddings = embeddings
+        self.index = index
+        self.doc_type = doc_type
+        self.batch_size = batch_size
+        self.manifest = manifest
+        self.buffer = []  # (key, vector_id, metadata)
+        self.remaining = {}  # key -> chunks not yet uploaded
+        self.files = {}  # key -> (file_path, chunk count)
+        self.failed = set()
+        self.completed = 0
+
+    def add(self, key: str, file_path: Path, chunks: list):
+        self.remaining[key] = len(chunks)
+        self.files[key] = (file_path, len(chunks))
+        for j, chunk in enumerate(chunks):
+            metadata = {"source": file_path.name, "doc_type": self.doc_type, "text": chunk}
+            self.buffer.append((key, f"{file_path.name}-chunk-{j}", metadata))
+        while len(self.buffer) >= self.batch_size:
+            self.flush(self.batch_size)
+
+    def flush(self, count: int = None):
+        batch, self.buffer = self.buffer[:count], self.buffer[count:] if count else []
+        if not batch:
+            return
+        try:
+            vectors = self._embed(batch)
+            for start in range(0, len(vectors), UPSERT_BATCH_SIZE):
+                self.index.upsert(vectors=vectors[start:start + UPSERT_BATCH_SIZE])
+        except Exception as e:
+            keys = {key for key, _, _ in batch}
+            print(f"  - ERROR: Failed to upload a batch of {len(batch)} chunks ({', '.join(sorted(keys))}). Reason: {e}")
+            self.failed.update(keys)
+            return
+        print(f"  - Uploaded {len(batch)} vectors to Pinecone.")
+        for key, _, _ in batch:
+            self.remaining[key] -= 1
+            if self.remaining[key] == 0 and key not in self.failed:
+                file_path, chunk_count = self.files[key]
+                self.manifest.mark_done(key, file_path, chunk_count)
+                self.completed += 1
+                print(f"  - Completed {key}.")
+
+    def _embed(self, batch: list) -> list:
+        texts = [metadata["text"] for _, _, metadata in batch]
+        for attempt in range(1, EMBED_RETRIES + 1):
+            try:
+                values = self.embeddings.embed_documents(texts)
+                break
+            except Exception as e:
+                if attempt == EMBED_RETRIES:
+                    raise
+                print(f"  - Embedding failed ({e}); retrying in {2 ** attempt}s...")
+                time.sleep(2 ** attempt)
+        return [(vector_id, vector, metadata) for (_, vector_id, metadata), vector in zip(batch, values)]
+
+
+def run_pipeline(video_files: list, directory: Path, uploader: VectorUploader, args):
+    """Overlaps audio extraction, transcription and uploading across all files."""
+    slots = threading.Semaphore(args.transcribe_workers * 2)
+    stop = threading.Event()
+    extractors = ThreadPoolExecutor(max_workers=args.ffmpeg_workers)
+    transcribers = ProcessPoolExecutor(max_workers=args.transcribe_workers, initializer=load_whisper_model, initargs=(args.model,))
+    stages = {}
+    try:
+        for file_path in video_files:
+            stages[extractors.submit(extract_audio, str(file_path), slots, stop)] = ("extract", file_path, None)
+        pending = set(stages)
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, file_path, audio_path = stages.pop(future)
+                key = file_path.relative_to(directory).as_posix()
+                if stage == "extract":
+                    try:
+                        audio_path = future.result()
+                    except Exception as e:
+                        print(f"  - ERROR: ffmpeg failed for {key}: {getattr(e, 'stderr', None) or e}")
+                        continue
+                    print(f"  - Extracted audio from {key}; transcribing...")
+                    transcription = transcribers.submit(transcribe_audio, audio_path)
+                    stages[transcription] = ("transcribe", file_path, audio_path)
+                    pending.add(transcription)
+                    continue
+
+                os.remove(audio_path)
+                slots.release()
+                try:
+                    full_text = future.result()
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    print(f"  - ERROR: Failed to transcribe {key}. Reason: {e}")
+                    continue
+                if not full_text.strip():
+                    print(f"  - Warning: No text extracted from {key}. Skipping.")
+                    continue
+                text_chunks = chunk_text(full_text)
+                print(f"  - Transcribed {key}: {len(text_chunks)} chunks.")
+                uploader.add(key, file_path, text_chunks)
+    except BrokenProcessPool:
+        # Usually a worker killed for running out of memory; try fewer --transcribe-workers
+        print("  - ERROR: A Whisper worker died; stopping. Files transcribed so far are still uploaded.")
     finally:
-        if audio_path and os.path.exists(audio_path):
-            os.remove(audio_path)
+        # Leaving a with-block would wait for every queued extraction, and
+        # extractions waiting for a slot would never get one.
+        stop.set()
+        extractors.shutdown(wait=True, cancel_futures=True)
+        transcribers.shutdown(wait=False, cancel_futures=True)
+        for future, (stage, _, audio_path) in stages.items():
+            if stage == "extract" and future.done() and not future.cancelled() and not future.exception():
+                audio_path = future.result()
+            if audio_path and os.path.exists(audio_path):
+                os.remove(audio_path)
+
+    uploader.flush()
+
 
-def main(directory_path: str, doc_type: str):
+def main(directory_path: str, doc_type: str, args):
     """Main function to handle the bulk upload process."""
     print("--- Starting Standalone Bulk Upload ---")
 
@@ -129,51 +324,32 @@ def main(directory_path: str, doc_type: str):
         return
 
     # --- Find Video Files ---
-    video_extensions = {".mp4", ".mov", ".avi", ".mkv", ".webm"}
-    video_files = [p for p in Path(directory_path).rglob('*') if p.suffix.lower() in video_extensions]
+    directory = Path(directory_path).expanduser().resolve()
+    video_files = sorted(p for p in directory.rglob('*') if p.suffix.lower() in VIDEO_EXTENSIONS)
 
     if not video_files:
         print(f"No video files found in '{directory_path}'. Please check the path.")
         return
 
-    print(f"Found {len(video_files)} video file(s) to process.\n")
-
-    # --- Process Each File ---
-    for i, file_path in enumerate(video_files):
-        file_name = file_path.name
-        print(f"--- Processing file {i + 1}/{len(video_files)}: {file_name} ---")
-
-        try:
-            full_text = process_and_transcribe_video(str(file_path))
-            if not full_text:
-                print("  - Warning: No text extracted. Skipping.\n")
-                continue
-
-            print("  - Splitting text into chunks...")
-            text_chunks = chunk_text(full_text)
-            
-            print(f"  - Generating {len(text_chunks)} embeddings...")
-            embedded_chunks = embeddings.embed_documents(text_chunks)
-
-            vectors_to_upsert = []
-            for j, (chunk_text, chunk_embedding) in enumerate(zip(text_chunks, embedded_chunks)):
-                vector_id = f"{file_name}-chunk-{j}"
-                metadata = {
-                    "source": file_name,
-                    "doc_type": doc_type,
-                    "text": chunk_text
-                }
-                vectors_to_upsert.append((vector_id, chunk_embedding, metadata))
-            
-            print(f"  - Uploading {len(vectors_to_upsert)} vectors to Pinecone...")
-            pinecone_index.upsert(vectors=vectors_to_upsert)
-            print(f"  - Successfully uploaded {file_name}.\n")
+    manifest = Manifest(Path(args.manifest).expanduser() if args.manifest else directory / MANIFEST_NAME)
+    remaining = [p for p in video_files if not manifest.is_done(p.relative_to(directory).as_posix(), p)]
+    print(f"Found {len(video_files)} video file(s); {len(video_files) - len(remaining)} already uploaded according to {manifest.path}.")
+    if not remaining:
+        print("--- Nothing to do ---")
+        return
+    print(f"Processing {len(remaining)} file(s) with {args.ffmpeg_workers} ffmpeg and {args.transcribe_workers} Whisper worker(s).\n")
 
-        except Exception as e:
-            print(f"  - ERROR: Failed to process {file_name}. Reason: {e}\n")
-            continue
+    # --- Process Files ---
+    started = time.perf_counter()
+    uploader = VectorUploader(embeddings, pinecone_index, doc_type, args.embed_batch_size, manifest)
+    try:
+        run_pipeline(remaining, directory, uploader, args)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted; {uploader.completed} file(s) were completed and recorded in {manifest.path}. Rerun to continue.")
+        return
 
-    print("--- Bulk Upload Process Complete ---")
+    print(f"\n--- Bulk Upload Process Complete in {time.perf_counter() - started:.1f}s ---")
+    print(f"Completed: {uploader.completed}/{len(remaining)} (rerun to retry the rest)")
 
 
 if __name__ == "__main__":
@@ -183,6 +359,11 @@ if __name__ == "__main__":
     )
     parser.add_argument("folder_path", type=str, help="The full path to the folder containing the files to upload.")
     parser.add_argument("--doc_type", type=str, default="Bulk Video Upload", help="The 'Document Type' to assign to these videos.")
+    parser.add_argument("--model", type=str, default="tiny", help="Whisper model to load in each transcription worker.")
+    parser.add_argument("--transcribe-workers", type=int, default=max(1, (os.cpu_count() or 2) // 4), help="Whisper worker processes.")
+    parser.add_argument("--ffmpeg-workers", type=int, default=4, help="Parallel ffmpeg audio extractions.")
+    parser.add_argument("--embed-batch-size", type=int, default=100, help="Chunks embedded and upserted per batch.")
+    parser.add_argument("--manifest", type=str, default=None, help=f"Manifest file (default: {MANIFEST_NAME} in the video folder).")
     
     args = parser.parse_args()
-    main(args.folder_path, args.doc_type) 
\ No newline at end of file
+    main(args.folder_path, args.doc_type, args)
@@ -0,0 +1,55 @@
+import json
+import random
+
+import pytest
+
+from core import deal_scorer
+
+
+def _random_deal(rng: random.Random) -> dict:
+    """Metrics for every SCORING_RULES entry, with values on both sides of each threshold."""
+    vacancy = rng.choice([5, 10, 12.5, 15, 30])
+    return {
+        "capRate": rng.choice([3.0, 4.5, 5.2, 6.0, 7.5]),
+        "trafficVolume": rng.choice([1000, 2500, 5000, 8000, 12000]),
+        "pricePerSqFt": rng.choice([250, 300, 350, 400, 450]),
+        "occupancyRate": 100 - vacancy,
+        "yearBuilt": rng.choice([1970, 1980, 1995, 2000, 2015]),
+        "vacancyRate": vacancy,
+        "zoningMatch": rng.random() > 0.2,
+        "deferredMaintenance": rng.random() > 0.8,
+    }
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_batch_scores_match_score_deal_logic(monkeypatch, seed):
+    rng = random.Random(seed)
+    deals = []
+    for i in range(100):
+        metrics = _random_deal(rng)
+        additional = {"propertyType": rng.choice(["Multifamily", "Retail", "Other"]), "marketStatus": rng.choice(["on-market", "off-market"])}
+        if additional["propertyType"] == "Multifamily":
+            additional["unitCount"] = rng.choice([10, 20, 60])
+        deals.append((metrics, additional))
+
+    batch = deal_scorer.score_deals_batch([{**metrics, **additional, "id": i} for i, (metrics, additional) in enumerate(deals)])
+
+    for (metrics, additional), result in zip(deals, batch):
+        # score_deal_logic fills unknown metrics with random placeholders; give it the same metrics instead
+        monkeypatch.setattr(deal_scorer, "calculate_metrics_from_data", lambda deal_data, additional_data: dict(metrics))
+        expected = deal_scorer.score_deal_logic({"additional_data": json.dumps(additional)})
+        assert (result["score"], result["reason"], result["details"]) == (expected["score"], expected["reason"], expected["details"])
+
+
+def test_deal_without_scored_metrics_is_insufficient_data():
+    result, = deal_scorer.score_deals_batch([{"id": "a", "askingPrice": 1000000, "propertyType": "Retail"}])
+    assert result["score"] == deal_scorer.INSUFFICIENT_DATA
+    assert result["unrecognised_fields"] == ["askingPrice"]
+    assert result["metric_scores"] == {}
+
+
+def test_additional_data_string_is_merged():
+    result, = deal_scorer.score_deals_batch([{"id": 1, "additional_data": json.dumps({"propertyType": "Multifamily", "unitCount": 8, "capRate": 7})}])
+    assert result["score"] == "Red"
+    assert "Unit count below minimum: 8" in result["red_flags"]
+    assert result["metric_scores"] == {"capRate": "green"}
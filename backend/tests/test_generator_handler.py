@@ -0,0 +1,104 @@
+import json
+import asyncio
+
+import pandas as pd
+
+from core import generator_handler
+
+
+PROSPECTS = [
+    {"id": 0, "fields": {"name": "Ada"}, "context": {}},
+    {"id": 1, "fields": {"name": "Bo"}, "context": {}},
+]
+
+
+def test_parse_batch_response_ignores_malformed_ids():
+    response = json.dumps([
+        {"id": True, "content": "Hi Bo"},
+        {"id": "0", "content": "Hi Ada"},
+        {"id": 1.5, "content": "Hi Bo"},
+        {"id": None, "content": "Hi Ada"},
+        {"id": [0], "content": "Hi Ada"},
+    ])
+    assert generator_handler.parse_batch_response(response, PROSPECTS) == {}
+
+
+def test_parse_batch_response_accepts_integral_float_ids():
+    response = json.dumps([{"id": 0.0, "content": "Hi Ada"}, {"id": 1, "content": "Hi Bo"}])
+    outputs = generator_handler.parse_batch_response(response, PROSPECTS)
+    assert outputs == {0: "Hi Ada", 1: "Hi Bo"}
+    assert all(type(position) is int for position in outputs)
+
+
+def test_malformed_batch_ids_fall_back_to_single_rows(monkeypatch):
+    async def fake_generate(llm, prompt, semaphore, label):
+        if "**Prospects:**" in prompt:
+            return json.dumps([{"id": True, "content": "Hi Bo"}, {"id": 0.0, "content": "Hi Ada"}])
+        return "single " + label
+
+    monkeypatch.setattr(generator_handler, "_get_llm", lambda: None)
+    monkeypatch.setattr(generator_handler, "generate_with_retry", fake_generate)
+    monkeypatch.setattr(generator_handler, "get_cached_outputs", lambda keys: {})
+    monkeypatch.setattr(generator_handler, "cache_outputs", lambda outputs: None)
+
+    async def collect():
+        df = pd.DataFrame({"name": ["Ada", "Bo"]})
+        return [
+            item async for item in generator_handler.iter_generated_content(df, ["name"], "Hi {{name}}", "warm", "email")
+        ]
+
+    results = asyncio.run(collect())
+    assert [position for position, _ in results] == [0, 1]
+    assert results[0][1] == "Hi Ada"
+    assert results[1][1].startswith("single ")
+
+
+def test_prepare_rows_fills_templates_and_contexts():
+    df = pd.DataFrame({"name": ["Ada", "Bo"], "city": ["Austin", "Boise"], "units": [12, 40]})
+    prepared = generator_handler.prepare_rows(df, ["name"], "Hi {{name}}, about {{name}}'s deal", "warm", "email")
+    assert prepared.templates == ["Hi Ada, about Ada's deal", "Hi Bo, about Bo's deal"]
+    assert prepared.contexts == ["city: 'Austin', units: '12'", "city: 'Boise', units: '40'"]
+    assert prepared.prospects[1] == {"id": 1, "fields": {"name": "Bo"}, "context": {"city": "Boise", "units": "40"}}
+
+
+def test_prepare_rows_cache_keys_ignore_whitespace_and_missing_values():
+    df = pd.DataFrame({"name": ["Ada", " Ada  ", "Ada", "Bo"], "city": ["", "", None, ""]})
+    keys = generator_handler.prepare_rows(df, ["name"], "Hi {{name}}", "warm", "email").cache_keys
+    assert keys[0] == keys[1] == keys[2]
+    assert keys[3] != keys[0]
+
+    other_tone = generator_handler.prepare_rows(df, ["name"], "Hi {{name}}", "formal", "email").cache_keys
+    other_template = generator_handler.prepare_rows(df, ["name"], "Hello {{name}}", "warm", "email").cache_keys
+    assert other_tone[0] != keys[0]
+    assert other_template[0] != keys[0]
+
+
+def _collect(df, **kwargs):
+    async def collect():
+        return [
+            item async for item in generator_handler.iter_generated_content(df, ["name"], "Hi {{name}}", "warm", "email", **kwargs)
+        ]
+    return asyncio.run(collect())
+
+
+def test_duplicate_and_cached_rows_are_not_generated_again(monkeypatch):
+    df = pd.DataFrame({"name": ["Ada", "Bo", "Ada ", "Cy"]})
+    keys = generator_handler.prepare_rows(df, ["name"], "Hi {{name}}", "warm", "email").cache_keys
+    prompts = []
+    cached = {}
+
+    async def fake_generate(llm, prompt, semaphore, label):
+        prompts.append(prompt)
+        return "generated " + label
+
+    monkeypatch.setattr(generator_handler, "_get_llm", lambda: None)
+    monkeypatch.setattr(generator_handler, "generate_with_retry", fake_generate)
+    monkeypatch.setattr(generator_handler, "get_cached_outputs", lambda requested: {key: "cached" for key in requested if key == keys[1]})
+    monkeypatch.setattr(generator_handler, "cache_outputs", cached.update)
+
+    results = _collect(df, batch_size=1)
+    assert [position for position, _ in results] == [0, 1, 2, 3]
+    assert results[1][1] == "cached"
+    assert results[2][1] == results[0][1] == "generated row 1"
+    assert len(prompts) == 2
+    assert set(cached) == {keys[0], keys[3]}
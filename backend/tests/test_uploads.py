@@ -0,0 +1,95 @@
+import hashlib
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from core import uploads
+
+
+@pytest.fixture
+def session_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_SESSION_DIR", str(tmp_path))
+    return tmp_path
+
+
+async def _body(*pieces):
+    for piece in pieces:
+        yield piece
+
+
+def test_parse_content_range_returns_half_open_range():
+    assert uploads.parse_content_range("bytes 0-9/100", 100) == (0, 10)
+    assert uploads.parse_content_range(" bytes 90-99/100 ", 100) == (90, 100)
+
+
+@pytest.mark.parametrize("header, status", [
+    (None, 400),
+    ("bytes=0-9", 400),
+    ("bytes 0-9/99", 416),  # Total differs from the session size
+    ("bytes 10-9/100", 416),
+    ("bytes 90-100/100", 416),
+])
+def test_parse_content_range_rejects_invalid_headers(header, status):
+    with pytest.raises(HTTPException) as e:
+        uploads.parse_content_range(header, 100)
+    assert e.value.status_code == status
+
+
+def test_merge_ranges_joins_overlapping_and_adjacent_ranges():
+    assert uploads._merge_ranges([[50, 60], [0, 10], [10, 20], [15, 30], [70, 80]]) == [[0, 30], [50, 60], [70, 80]]
+
+
+def test_missing_ranges_lists_the_gaps():
+    session = {"size": 100, "received": [[10, 20], [50, 60]]}
+    assert uploads.missing_ranges(session) == [[0, 10], [20, 50], [60, 100]]
+    assert uploads.missing_ranges({"size": 100, "received": [[0, 100]]}) == []
+
+
+def test_ranges_written_out_of_order_complete_the_upload(session_dir):
+    data = bytes(range(256)) * 4
+    session = uploads.create_upload_session("rent_roll.pdf", len(data), {"property": "Elm"}, hashlib.sha256(data).hexdigest())
+    upload_id = session["upload_id"]
+
+    async def upload():
+        await uploads.write_upload_range(upload_id, f"bytes 512-1023/{len(data)}", _body(data[512:800], data[800:]))
+        with pytest.raises(HTTPException) as e:
+            await uploads.finalize_upload_session(upload_id)
+        assert e.value.status_code == 409
+        assert e.value.detail["missing_ranges"] == [[0, 512]]
+        await uploads.write_upload_range(upload_id, f"bytes 0-511/{len(data)}", _body(data[:512]))
+        return await uploads.finalize_upload_session(upload_id), await uploads.finalize_upload_session(upload_id)
+
+    (stored, metadata), (again, again_metadata) = asyncio.run(upload())
+    with open(stored.path, "rb") as f:
+        assert f.read() == data
+    assert metadata == {"property": "Elm"}
+    # Completing again (a retried request) returns the same file without handing it over twice
+    assert again == stored
+    assert again_metadata is None
+
+
+def test_short_body_records_what_arrived(session_dir):
+    session = uploads.create_upload_session("lease.pdf", 100, {})
+    upload_id = session["upload_id"]
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(uploads.write_upload_range(upload_id, "bytes 0-49/100", _body(b"x" * 30)))
+    assert e.value.status_code == 400
+    assert uploads.missing_ranges(uploads.get_upload_session(upload_id)) == [[30, 100]]
+
+
+def test_body_longer_than_range_is_rejected(session_dir):
+    upload_id = uploads.create_upload_session("lease.pdf", 100, {})["upload_id"]
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(uploads.write_upload_range(upload_id, "bytes 0-9/100", _body(b"x" * 11)))
+    assert e.value.status_code == 400
+    assert uploads.missing_ranges(uploads.get_upload_session(upload_id)) == [[0, 100]]
+
+
+def test_writes_to_an_aborted_session_are_not_found(session_dir):
+    upload_id = uploads.create_upload_session("lease.pdf", 100, {})["upload_id"]
+    uploads.abort_upload_session(upload_id)
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(uploads.write_upload_range(upload_id, "bytes 0-9/100", _body(b"x" * 10)))
+    assert e.value.status_code == 404